@@ -16,6 +16,8 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import argparse
 
+import framed_jsonl
+
 try:
     import requests
     from bs4 import BeautifulSoup
@@ -31,9 +33,10 @@ except ImportError:
 class CryptoNewsScraper:
     """Scrape crypto news and organize on timeline"""
 
-    def __init__(self, rate_limit: float = 2.0, output_dir: str = "datasets"):
+    def __init__(self, rate_limit: float = 2.0, output_dir: str = "datasets", compress: bool = False):
         self.rate_limit = rate_limit
         self.output_dir = output_dir
+        self.compress = compress  # Write .jsonlz instead of .jsonl
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Van-Kush-Family-Bot/1.0 (News Aggregation)'
@@ -146,14 +149,12 @@ class CryptoNewsScraper:
 
     def save_to_timeline(self, articles: List[Dict], filename: str = 'crypto_news_timeline.jsonl'):
         """Save articles to timeline format"""
-        filepath = os.path.join(self.output_dir, filename)
+        filepath = os.path.join(self.output_dir, framed_jsonl.dataset_name(filename, self.compress))
 
         # Sort by publish date
         articles.sort(key=lambda x: x['published'], reverse=True)
 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            for article in articles:
-                f.write(json.dumps(article, ensure_ascii=False) + '\n')
+        framed_jsonl.write_jsonl(filepath, articles)
 
         print(f"✅ Saved {len(articles)} articles to {filepath}")
 
@@ -181,8 +182,9 @@ class CryptoNewsScraper:
 class TimelineBuilder:
     """Build unified timeline from all datasets"""
 
-    def __init__(self, datasets_dir: str = "datasets"):
+    def __init__(self, datasets_dir: str = "datasets", compress: bool = False):
         self.datasets_dir = datasets_dir
+        self.compress = compress  # Write .jsonlz instead of .jsonl
         self.events: List[Dict] = []
 
     def extract_date_from_doc(self, doc: Dict) -> Optional[datetime]:
@@ -202,30 +204,28 @@ class TimelineBuilder:
 
         return None
 
-    def load_all_datasets(self) -> List[Dict]:
-        """Load all datasets into timeline"""
+    def load_all_datasets(self, workers: int = 4) -> List[Dict]:
+        """Load all datasets (plain or frame-compressed) into timeline"""
         print("📅 Building unified timeline...")
 
         for filename in os.listdir(self.datasets_dir):
-            if filename.endswith('.jsonl'):
+            if filename.endswith(('.jsonl', framed_jsonl.SUFFIX)):
                 filepath = os.path.join(self.datasets_dir, filename)
 
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        if line.strip():
-                            doc = json.loads(line)
-                            date = self.extract_date_from_doc(doc)
-
-                            if date:
-                                event = {
-                                    'date': date.isoformat(),
-                                    'title': doc.get('title', 'Unknown'),
-                                    'category': doc.get('category', 'unknown'),
-                                    'source': doc.get('source', 'unknown'),
-                                    'content_preview': doc.get('content', doc.get('summary', ''))[:200],
-                                    'url': doc.get('url', '')
-                                }
-                                self.events.append(event)
+                # Frames of a .jsonlz file are decompressed on workers threads
+                for doc in framed_jsonl.read_jsonl(filepath, workers=workers):
+                    date = self.extract_date_from_doc(doc)
+
+                    if date:
+                        event = {
+                            'date': date.isoformat(),
+                            'title': doc.get('title', 'Unknown'),
+                            'category': doc.get('category', 'unknown'),
+                            'source': doc.get('source', 'unknown'),
+                            'content_preview': doc.get('content', doc.get('summary', ''))[:200],
+                            'url': doc.get('url', '')
+                        }
+                        self.events.append(event)
 
         # Sort by date
         self.events.sort(key=lambda x: x['date'], reverse=True)
@@ -235,11 +235,8 @@ class TimelineBuilder:
 
     def save_timeline(self, filename: str = 'unified_timeline.jsonl'):
         """Save unified timeline"""
-        filepath = os.path.join(self.datasets_dir, filename)
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            for event in self.events:
-                f.write(json.dumps(event, ensure_ascii=False) + '\n')
+        filepath = os.path.join(self.datasets_dir, framed_jsonl.dataset_name(filename, self.compress))
+        framed_jsonl.write_jsonl(filepath, self.events)
 
         print(f"✅ Saved unified timeline to {filepath}")
 
@@ -262,15 +259,18 @@ def main():
     parser.add_argument('--build-timeline', action='store_true', help='Build unified timeline')
     parser.add_argument('--output', default='datasets', help='Output directory')
     parser.add_argument('--rate-limit', type=float, default=2.0, help='Seconds between requests')
+    parser.add_argument('--compress', action='store_true',
+                        help='Write frame-compressed .jsonlz datasets')
 
     args = parser.parse_args()
 
     if args.update_news:
-        scraper = CryptoNewsScraper(rate_limit=args.rate_limit, output_dir=args.output)
+        scraper = CryptoNewsScraper(rate_limit=args.rate_limit, output_dir=args.output,
+                                    compress=args.compress)
         scraper.update_timeline(hours_back=args.hours)
 
     if args.build_timeline:
-        builder = TimelineBuilder(datasets_dir=args.output)
+        builder = TimelineBuilder(datasets_dir=args.output, compress=args.compress)
         builder.load_all_datasets()
         builder.save_timeline()
 
@@ -11,16 +11,18 @@ Use Cases:
 """
 
 import os
-import json
 import re
 from datetime import datetime
 from typing import List, Dict, Optional
 
+import framed_jsonl
+
 class KnowledgeCurator:
     """Curate and sanitize knowledge before importing"""
 
-    def __init__(self, output_dir: str = "datasets"):
+    def __init__(self, output_dir: str = "datasets", compress: bool = False):
         self.output_dir = output_dir
+        self.compress = compress  # Write .jsonlz instead of .jsonl
         os.makedirs(output_dir, exist_ok=True)
 
     def sanitize_text(self, text: str) -> str:
@@ -137,11 +139,8 @@ class KnowledgeCurator:
     def save_curated(self, documents: List[Dict], filename: str = 'curated_knowledge.jsonl'):
         """Save curated documents"""
 
-        filepath = os.path.join(self.output_dir, filename)
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            for doc in documents:
-                f.write(json.dumps(doc, ensure_ascii=False) + '\n')
+        filepath = os.path.join(self.output_dir, framed_jsonl.dataset_name(filename, self.compress))
+        framed_jsonl.write_jsonl(filepath, documents)
 
         print(f"\n✅ Saved {len(documents)} curated documents to {filepath}")
 
@@ -170,10 +169,12 @@ def main():
     parser.add_argument('--preview', action='store_true',
                        help='Preview before saving')
     parser.add_argument('--output', default='datasets', help='Output directory')
+    parser.add_argument('--compress', action='store_true',
+                       help='Write a frame-compressed .jsonlz dataset')
 
     args = parser.parse_args()
 
-    curator = KnowledgeCurator(output_dir=args.output)
+    curator = KnowledgeCurator(output_dir=args.output, compress=args.compress)
 
     # Curate the conversation
     curated = curator.curate_conversation(
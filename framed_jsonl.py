@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Van Kush Family - Frame-Compressed JSONL Datasets
+
+Shared dataset format for the scrapers, the knowledge base and the timeline
+builder. A .jsonlz file holds the same JSON lines as a .jsonl file, cut into
+frames of whole lines that are zlib-compressed independently, followed by an
+index of frame offsets. Any record can be reached by decompressing a single
+frame, frames can be decompressed in parallel, and appending only rewrites
+the index. Plain .jsonl files stay readable through the same functions.
+
+Layout (little-endian):
+  magic b'VKJSONLZ' | version u32
+  frames: b'VKFR' | compressed length u32 | raw length u32 | records u32 | zlib data
+  index:  b'VKIX' | frame count u32 | frame offsets u64[n + 1] | first record u64[n + 1]
+  footer: index offset u64 | record count u64 | b'VKJZTAIL'
+
+Without a valid footer (a writer died mid-append) the frames are found by
+walking their headers, so nothing already written is lost.
+"""
+
+import os
+import sys
+import json
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+SUFFIX = '.jsonlz'
+MAGIC = b'VKJSONLZ'
+VERSION = 1
+FRAME_BYTES = 64 << 10  # Uncompressed bytes per frame (a longer line gets a frame of its own)
+
+_HEADER = struct.Struct('<8sI')
+_FRAME = struct.Struct('<4sIII')
+_INDEX = struct.Struct('<4sI')
+_FOOTER = struct.Struct('<QQ8s')
+_FRAME_MARK, _INDEX_MARK, _FOOTER_MARK = b'VKFR', b'VKIX', b'VKJZTAIL'
+
+
+def is_framed(f) -> bool:
+    """True if an open binary file (or path) is frame-compressed"""
+    if isinstance(f, str):
+        with open(f, 'rb') as handle:
+            return is_framed(handle)
+    return os.pread(f.fileno(), len(MAGIC), 0) == MAGIC
+
+
+def dataset_name(filename: str, compress: bool) -> str:
+    """A .jsonl dataset filename, as .jsonlz when compress is set"""
+    if compress and filename.endswith('.jsonl'):
+        return filename + 'z'
+    return filename
+
+
+def _scan(fd: int, offset: int, end: Optional[int] = None) -> Iterator[Tuple[int, int, int, int]]:
+    """(offset, compressed length, raw length, records) of each complete frame from offset"""
+    size = os.fstat(fd).st_size if end is None else end
+    while offset + _FRAME.size <= size:
+        mark, length, raw, records = _FRAME.unpack(os.pread(fd, _FRAME.size, offset))
+        if mark != _FRAME_MARK or offset + _FRAME.size + length > size:
+            return  # Index, or a frame still being written
+        yield offset, length, raw, records
+        offset += _FRAME.size + length
+
+
+def _read_frame(fd: int, offset: int, length: int) -> bytes:
+    return zlib.decompress(os.pread(fd, length, offset + _FRAME.size))
+
+
+class FramedReader:
+    """Random and streaming access to a .jsonlz file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        fd = self._file.fileno()
+        magic, version = _HEADER.unpack(os.pread(fd, _HEADER.size, 0).ljust(_HEADER.size, b'\0'))
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not a frame-compressed dataset: {path}")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"Dataset format version {version} != {VERSION}")
+
+        # Frame k spans offsets[k]:offsets[k + 1] and holds records firsts[k]:firsts[k + 1]
+        self.offsets = array('Q')
+        self.firsts = array('Q')
+        if not self._read_index():
+            self.offsets.append(_HEADER.size)
+            self.firsts.append(0)
+            for offset, length, raw, records in _scan(fd, _HEADER.size):
+                self.offsets.append(offset + _FRAME.size + length)
+                self.firsts.append(self.firsts[-1] + records)
+
+    def _read_index(self) -> bool:
+        fd = self._file.fileno()
+        size = os.fstat(fd).st_size
+        if size < _HEADER.size + _FOOTER.size:
+            return False
+        index_offset, records, mark = _FOOTER.unpack(os.pread(fd, _FOOTER.size, size - _FOOTER.size))
+        if mark != _FOOTER_MARK or index_offset > size - _FOOTER.size - _INDEX.size:
+            return False
+        mark, n_frames = _INDEX.unpack(os.pread(fd, _INDEX.size, index_offset))
+        length = 8 * (n_frames + 1)
+        if mark != _INDEX_MARK or index_offset + _INDEX.size + 2 * length != size - _FOOTER.size:
+            return False
+        self.offsets.frombytes(os.pread(fd, length, index_offset + _INDEX.size))
+        self.firsts.frombytes(os.pread(fd, length, index_offset + _INDEX.size + length))
+        if sys.byteorder == 'big':
+            self.offsets.byteswap()
+            self.firsts.byteswap()
+        return self.firsts[-1] == records
+
+    def __len__(self):
+        return self.firsts[-1]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def data_end(self) -> int:
+        """Byte offset just past the last frame"""
+        return self.offsets[-1]
+
+    def frame(self, k: int) -> bytes:
+        """Decompressed JSON lines of frame k"""
+        offset = self.offsets[k]
+        return _read_frame(self._file.fileno(), offset, self.offsets[k + 1] - offset - _FRAME.size)
+
+    def record(self, i: int) -> Dict:
+        """Record i, decompressing only the frame that holds it"""
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        k = bisect_right(self.firsts, i) - 1
+        return json.loads(self.frame(k).splitlines()[i - self.firsts[k]])
+
+    def frames(self, workers: int = 1) -> Iterator[bytes]:
+        """Decompressed frames in order, several at a time on workers threads
+        (zlib releases the GIL while it inflates)"""
+        if workers <= 1:
+            for k in range(self.frame_count):
+                yield self.frame(k)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for k in range(self.frame_count):
+                pending.append(pool.submit(self.frame, k))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+
+class FramedWriter:
+    """Write (or append to) a .jsonlz file; the index is written on close()"""
+
+    def __init__(self, path: str, append: bool = False, frame_bytes: int = FRAME_BYTES, level: int = 6):
+        self.path = path
+        self.frame_bytes = frame_bytes
+        self.level = level
+        self._lines: List[bytes] = []
+        self._buffered = 0
+
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            with FramedReader(path) as reader:
+                self.offsets, self.firsts = reader.offsets, reader.firsts
+            self._file = open(path, 'r+b')
+            self._file.truncate(self.offsets[-1])  # Drop the old index and footer
+            self._file.seek(self.offsets[-1])
+        else:
+            self._file = open(path, 'wb')
+            self._file.write(_HEADER.pack(MAGIC, VERSION))
+            self.offsets = array('Q', [_HEADER.size])
+            self.firsts = array('Q', [0])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, record: Dict):
+        self.write_line(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def write_line(self, line: bytes):
+        """Add one JSON line (a newline is added if missing)"""
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        if self._buffered and self._buffered + len(line) > self.frame_bytes:
+            self.flush()
+        self._lines.append(line)
+        self._buffered += len(line)
+
+    def flush(self):
+        """Compress buffered lines into a frame"""
+        if not self._lines:
+            return
+        raw = b''.join(self._lines)
+        data = zlib.compress(raw, self.level)
+        self._file.write(_FRAME.pack(_FRAME_MARK, len(data), len(raw), len(self._lines)))
+        self._file.write(data)
+        self.offsets.append(self.offsets[-1] + _FRAME.size + len(data))
+        self.firsts.append(self.firsts[-1] + len(self._lines))
+        self._lines, self._buffered = [], 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        n_frames = len(self.offsets) - 1
+        self._file.write(_INDEX.pack(_INDEX_MARK, n_frames))
+        self._file.write(struct.pack(f'<{n_frames + 1}Q', *self.offsets))
+        self._file.write(struct.pack(f'<{n_frames + 1}Q', *self.firsts))
+        self._file.write(_FOOTER.pack(self.offsets[-1], self.firsts[-1], _FOOTER_MARK))
+        self._file.close()
+
+
+def iter_lines(f, offset: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, Optional[int]]]:
+    """(line, resume offset) pairs of a plain or framed JSONL file, from a byte offset.
+
+    f is an open binary file. The resume offset is where reading can pick up
+    again after the line: the next line of a plain file, or for a framed file
+    the next frame after each frame's last line (None inside a frame). Offsets
+    and end must be line starts or frame starts respectively. Reading stops
+    at end, and at a frame that is still being written.
+    """
+    if not is_framed(f):
+        f.seek(offset)
+        for line in f:
+            if end is not None and offset >= end:
+                return
+            offset += len(line)
+            yield line, offset
+        return
+
+    fd = f.fileno()
+    for start, length, raw, records in _scan(fd, max(offset, _HEADER.size), end):
+        lines = _read_frame(fd, start, length).splitlines(keepends=True)
+        resume = start + _FRAME.size + length
+        for i, line in enumerate(lines):
+            yield line, resume if i == len(lines) - 1 else None
+
+
+def frame_offsets(f) -> List[Tuple[int, int]]:
+    """(offset, uncompressed bytes) of each complete frame of a framed file"""
+    return [(offset, raw) for offset, length, raw, records in _scan(f.fileno(), _HEADER.size)]
+
+
+def read_jsonl(path: str, workers: int = 1) -> Iterator[Dict]:
+    """Records of a plain or framed JSONL file (blank lines skipped)"""
+    with open(path, 'rb') as f:
+        framed = is_framed(f)
+    if not framed:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    with FramedReader(path) as reader:
+        for frame in reader.frames(workers):
+            for line in frame.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_jsonl(path: str, records: Iterable[Dict], append: bool = False) -> int:
+    """Write records as JSON lines, frame-compressed if path ends in .jsonlz.
+    Returns the number of records written."""
+    count = 0
+    if path.endswith(SUFFIX):
+        with FramedWriter(path, append=append) as writer:
+            for record in records:
+                writer.write(record)
+                count += 1
+        return count
+
+    with open(path, 'a' if append else 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    return count
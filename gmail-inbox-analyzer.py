@@ -13,7 +13,6 @@ Based on ITINERARY.md Phase 2 requirements.
 
 import os
 import sys
-import json
 import re
 import email
 from datetime import datetime
@@ -22,6 +21,8 @@ import imaplib
 from typing import List, Dict
 import argparse
 
+import framed_jsonl
+
 try:
     from dotenv import load_dotenv
     load_dotenv()
@@ -228,27 +229,25 @@ class GmailAnalyzer:
         return sorted_mentions
 
     def export_to_jsonl(self, filename='datasets/van_kush_emails.jsonl'):
-        """Export mentions to JSONL for knowledge base"""
+        """Export mentions to JSONL for knowledge base (frame-compressed if filename ends in .jsonlz)"""
         os.makedirs(os.path.dirname(filename), exist_ok=True)
 
         print(f"\n💾 Exporting to {filename}...")
 
-        with open(filename, 'w', encoding='utf-8') as f:
-            for mention in self.mentions:
-                # Format for knowledge base
-                entry = {
-                    'source': 'gmail',
-                    'category': 'van-kush-mentions',
-                    'title': f"Email: {mention['subject']}",
-                    'content': f"From: {mention['from']}\nDate: {mention['date']}\n\n{mention['context']}",
-                    'metadata': {
-                        'email_id': mention['id'],
-                        'from': mention['from'],
-                        'date': mention['date']
-                    },
-                    'created_at': datetime.now().isoformat()
-                }
-                f.write(json.dumps(entry) + '\n')
+        # Format for knowledge base
+        entries = ({
+            'source': 'gmail',
+            'category': 'van-kush-mentions',
+            'title': f"Email: {mention['subject']}",
+            'content': f"From: {mention['from']}\nDate: {mention['date']}\n\n{mention['context']}",
+            'metadata': {
+                'email_id': mention['id'],
+                'from': mention['from'],
+                'date': mention['date']
+            },
+            'created_at': datetime.now().isoformat()
+        } for mention in self.mentions)
+        framed_jsonl.write_jsonl(filename, entries)
 
         print(f"✅ Exported {len(self.mentions)} mentions")
         print(f"\n📊 Next steps:")
@@ -272,6 +271,8 @@ def main():
     parser.add_argument('--mailbox', default='INBOX', help='Mailbox to search')
     parser.add_argument('--limit', type=int, default=100, help='Max emails to process')
     parser.add_argument('--output', default='datasets/van_kush_emails.jsonl', help='Output file')
+    parser.add_argument('--compress', action='store_true',
+                        help='Write a frame-compressed .jsonlz file')
     parser.add_argument('--username', help='Gmail username (or set GMAIL_USERNAME env var)')
     parser.add_argument('--password', help='Gmail app password (or set GMAIL_APP_PASSWORD env var)')
 
@@ -308,7 +309,7 @@ def main():
 
         if mentions:
             analyzer.create_timeline()
-            analyzer.export_to_jsonl(args.output)
+            analyzer.export_to_jsonl(framed_jsonl.dataset_name(args.output, args.compress))
         else:
             print(f"\n❌ No mentions of '{args.query}' found")
 
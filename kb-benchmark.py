@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Van Kush Family - Knowledge Base Benchmark
+
+Reproducible load and search benchmark for knowledge-base.py:
+- Synthetic corpora of 10k / 100k / 1M documents shaped like datasets/*.jsonl
+  (knowledge entries, crypto news, sacred-texts pages, long Gutenberg books)
+- Index build time, snapshot save and warm start time
+- Peak RSS, index heap size and snapshot size
+- p50/p95/p99 latency of search, query_for_bot and category-filtered search
+- JSON results, compared against a stored baseline
+
+Each corpus size is measured in a fresh process so peak RSS is its own.
+Corpora are generated from a seed and cached between runs.
+
+Usage:
+  python3 kb-benchmark.py --sizes 10k,100k --output bench.json
+  python3 kb-benchmark.py --sizes 10k --baseline bench.json   # exit 1 on regression
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import platform
+import subprocess
+import contextlib
+import gc
+import importlib.util
+import tempfile
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional
+import argparse
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:  # Windows
+    HAS_RESOURCE = False
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GENERATOR_VERSION = 1  # Bump when the corpus shape changes; cached corpora are rebuilt
+
+SIZE_PRESETS = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000}
+
+# Dataset files of a synthetic corpus: (filename, share of documents, document kind)
+CORPUS_FILES = [
+    ('van_kush_knowledge.jsonl', 0.30, 'knowledge'),
+    ('crypto_news_timeline.jsonl', 0.40, 'news'),
+    ('sacred_texts_dataset.jsonl', 0.295, 'page'),
+    ('gutenberg_dataset.jsonl', 0.005, 'book'),
+]
+CATEGORIES = {
+    'knowledge': ['vkbt-token', 'cure-token', 'van-kush-family', 'oilahuasca', 'trading-strategy',
+                  'hive-blockchain', 'pharmaceutical', 'future-plans'],
+    'news': ['crypto-news'],
+    'page': ['mythology', 'egyptian', 'greek', 'hindu', 'biblical'],
+    'book': ['classic-texts'],
+}
+SOURCES = {'knowledge': ['van-kush-family', 'oilahuasca-research'], 'news': ['coindesk', 'cointelegraph', 'decrypt', 'theblock'],
+           'page': ['sacred-texts'], 'book': ['gutenberg']}
+DOMAIN_WORDS = ('vkbt cure hive token blockchain tribaldex swap holders supply staking ancient egypt '
+                'isis osiris anubis hermes pharaoh temple mythology gods goddess oilahuasca allylbenzene '
+                'enzyme cytochrome bitcoin ethereum market trading liquidity wallet exchange').split()
+
+VOCABULARY_SIZE = 40_000
+LATENCY_QUERIES = 300
+PERCENTILES = (50, 95, 99)
+
+# Metrics compared against a baseline (dotted path, all lower-is-better), with the
+# smallest absolute change that counts, so timer noise on tiny values is not flagged
+COMPARED_METRICS = {
+    'load.index_seconds': 0.1,
+    'load.warm_start_seconds': 0.1,
+    'memory.peak_rss_mb': 5,
+    'memory.snapshot_bytes': 0,
+    **{f'latency_ms.{kind}.p{p}': 0.1 for kind in ('search', 'query_for_bot', 'category_search')
+       for p in PERCENTILES}
+}
+
+
+def parse_size(text: str) -> int:
+    """'10k', '1M' or a plain number of documents"""
+    text = text.strip()
+    if text in SIZE_PRESETS:
+        return SIZE_PRESETS[text]
+    multiplier = {'k': 1_000, 'K': 1_000, 'm': 1_000_000, 'M': 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if multiplier > 1 else text) * multiplier)
+
+
+def load_kb_module(path: str):
+    """Import knowledge-base.py (hyphenated, so not importable by name)"""
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+    spec = importlib.util.spec_from_file_location('knowledge_base', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['knowledge_base'] = module  # Process pool workers unpickle by module name
+    spec.loader.exec_module(module)
+    return module
+
+
+class CorpusGenerator:
+    """Deterministic synthetic datasets in the schema of datasets/*.jsonl"""
+
+    def __init__(self, seed: int = 42):
+        self.seed = seed
+        rng = random.Random(seed)
+        syllables = [c + v for c in 'bdfghklmnprstvz' for v in 'aeiou'] + ['ra', 'th', 'sh', 'an', 'os', 'is']
+        words = set(DOMAIN_WORDS)
+        while len(words) < VOCABULARY_SIZE:
+            words.add(''.join(rng.choice(syllables) for _ in range(rng.choice((2, 2, 3, 3, 4)))))
+        # Domain words first so they are among the most frequent; the rest Zipf-distributed
+        others = sorted(words - set(DOMAIN_WORDS))
+        rng.shuffle(others)
+        self.vocabulary = list(DOMAIN_WORDS) + others
+        weights = [1.0 / (rank + 10) for rank in range(len(self.vocabulary))]
+        total = 0.0
+        self.cum_weights = []
+        for weight in weights:
+            total += weight
+            self.cum_weights.append(total)
+
+    def _words(self, rng: random.Random, n: int) -> List[str]:
+        return rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=n)
+
+    def _text(self, rng: random.Random, n_words: int) -> str:
+        words = self._words(rng, n_words)
+        sentences, i = [], 0
+        while i < len(words):
+            length = rng.randint(8, 20)
+            sentence = ' '.join(words[i:i + length])
+            sentences.append(sentence[:1].upper() + sentence[1:] + '.')
+            i += length
+        return ' '.join(sentences)
+
+    def document(self, rng: random.Random, kind: str, i: int) -> Dict:
+        created = datetime(2020, 1, 1) + timedelta(minutes=rng.randrange(6 * 365 * 24 * 60))
+        title = ' '.join(self._words(rng, rng.randint(3, 8))).title()
+        doc = {
+            'source': rng.choice(SOURCES[kind]),
+            'category': rng.choice(CATEGORIES[kind]),
+            'title': title,
+        }
+        if kind == 'knowledge':
+            doc['content'] = self._text(rng, rng.randint(50, 120))
+            doc['created_at'] = created.isoformat() + 'Z'
+            if rng.random() < 0.1:
+                doc['url'] = f"https://tribaldex.com/trade/{i}"
+        elif kind == 'news':
+            doc['summary'] = self._text(rng, rng.randint(20, 40))
+            doc['content'] = self._text(rng, rng.randint(150, 400))
+            doc['url'] = f"https://news.example.com/{doc['source']}/{i}"
+            doc['published'] = created.isoformat()
+        elif kind == 'page':
+            doc['content'] = self._text(rng, rng.randint(200, 700))
+            doc['url'] = f"https://www.sacred-texts.com/{doc['category']}/{i}.htm"
+            doc['scraped_at'] = created.isoformat()
+        else:
+            doc['content'] = '\n\n'.join(self._text(rng, rng.randint(100, 250)) for _ in range(rng.randint(20, 60)))
+            doc['url'] = f"https://www.gutenberg.org/ebooks/{i}"
+            doc['scraped_at'] = created.isoformat()
+        return doc
+
+    def write(self, directory: str, n_docs: int) -> Dict:
+        """Write an n_docs corpus into directory (reused if already complete)"""
+        marker = os.path.join(directory, '.corpus-complete')
+        expected = {'generator': GENERATOR_VERSION, 'seed': self.seed, 'documents': n_docs}
+        if os.path.exists(marker):
+            with open(marker) as f:
+                info = json.load(f)
+            if {key: info.get(key) for key in expected} == expected:
+                return info
+
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.listdir(directory):
+            if entry.endswith('.jsonl') or entry.startswith('.kb_'):
+                os.remove(os.path.join(directory, entry))
+
+        counts = [int(n_docs * share) for _, share, _ in CORPUS_FILES]
+        counts[0] += n_docs - sum(counts)
+        total_bytes = 0
+        for (filename, _, kind), count in zip(CORPUS_FILES, counts):
+            # One generator stream per file, so each file is stable on its own
+            rng = random.Random(f"{self.seed}-{filename}")
+            path = os.path.join(directory, filename)
+            with open(path, 'w', encoding='utf-8') as f:
+                for i in range(count):
+                    f.write(json.dumps(self.document(rng, kind, i), ensure_ascii=False) + '\n')
+            total_bytes += os.path.getsize(path)
+
+        info = dict(expected, bytes=total_bytes, files=dict(zip((name for name, _, _ in CORPUS_FILES), counts)))
+        with open(marker, 'w') as f:
+            json.dump(info, f)
+        return info
+
+    def queries(self, n: int, categories: List[str]) -> List[Dict]:
+        """Mixed 1-3 word queries over mid-frequency words, some with a category filter"""
+        rng = random.Random(f"{self.seed}-queries")
+        pool = self.vocabulary[:2000]
+        queries = []
+        for _ in range(n):
+            words = rng.sample(pool, rng.choice((1, 1, 2, 2, 2, 3)))
+            queries.append({'q': ' '.join(words), 'category': rng.choice(categories)})
+        return queries
+
+
+def percentiles(samples: List[float]) -> Dict:
+    """Nearest-rank percentiles and mean of latencies in milliseconds"""
+    ordered = sorted(samples)
+    summary = {f'p{p}': round(ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)], 3)
+               for p in PERCENTILES}
+    summary['mean'] = round(sum(ordered) / len(ordered), 3)
+    summary['count'] = len(ordered)
+    return summary
+
+
+def _timed_ms(fn, *args, **kwargs) -> float:
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return (time.perf_counter() - started) * 1000
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if not HAS_RESOURCE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def measure(kb_path: str, corpus_dir: str, seed: int, n_queries: int, workers: int) -> Dict:
+    """Build, save, warm-start and query one corpus (run in a fresh process)"""
+    kb_module = load_kb_module(kb_path)
+    snapshot_path = os.path.join(corpus_dir, kb_module.SNAPSHOT_FILENAME)
+
+    with open(os.devnull, 'w') as sink, contextlib.redirect_stdout(sink):
+        kb = kb_module.KnowledgeBase(corpus_dir, snapshot_path=snapshot_path, cache_size=0)
+        started = time.perf_counter()
+        kb.load_all_datasets(use_snapshot=False, workers=workers)
+        index_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        kb.save_snapshot()
+        save_seconds = time.perf_counter() - started
+        stats = kb.get_stats()
+        del kb
+        gc.collect()
+
+        # Searches run against a warm start from the snapshot, as a restarted --serve would
+        kb = kb_module.KnowledgeBase(corpus_dir, snapshot_path=snapshot_path, cache_size=0)
+        started = time.perf_counter()
+        kb.load_all_datasets()
+        warm_seconds = time.perf_counter() - started
+
+        queries = CorpusGenerator(seed).queries(n_queries, kb.get_categories())
+        for query in queries[:20]:  # Warm-up: page in the mapped index
+            kb.search(query['q'])
+        latency = {
+            'search': [_timed_ms(kb.search, query['q']) for query in queries],
+            'query_for_bot': [_timed_ms(kb.query_for_bot, query['q']) for query in queries],
+            'category_search': [_timed_ms(kb.search, query['q'], category=query['category'])
+                                for query in queries],
+        }
+
+    return {
+        'indexed_documents': stats['total_documents'],
+        'keywords': stats['total_keywords'],
+        'load': {
+            'index_seconds': round(index_seconds, 3),
+            'snapshot_save_seconds': round(save_seconds, 3),
+            'warm_start_seconds': round(warm_seconds, 3),
+            'build_workers': workers,
+        },
+        'memory': {
+            'peak_rss_mb': _peak_rss_mb(),
+            'index_heap_bytes': stats['index_memory'].get('heap_bytes'),
+            'snapshot_bytes': os.path.getsize(snapshot_path),
+        },
+        'latency_ms': {kind: percentiles(samples) for kind, samples in latency.items()},
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                                capture_output=True, text=True, timeout=10)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args) -> Dict:
+    kb_path = os.path.abspath(args.kb)
+    with open(kb_path, 'rb') as f:
+        kb_sha1 = hashlib.sha1(f.read()).hexdigest()[:12]
+
+    generator = CorpusGenerator(args.seed)
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(),
+            'git_commit': _git_commit(),
+            'knowledge_base_sha1': kb_sha1,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': args.seed,
+            'queries': args.queries,
+            'generator': GENERATOR_VERSION,
+        },
+        'results': {}
+    }
+
+    for label in args.sizes.split(','):
+        n_docs = parse_size(label)
+        corpus_dir = os.path.join(args.work_dir, f'corpus-{n_docs}-s{args.seed}')
+        print(f"🧪 Generating {n_docs:,} document corpus in {corpus_dir}...")
+        started = time.perf_counter()
+        info = generator.write(corpus_dir, n_docs)
+        print(f"   {info['bytes'] / 1024 / 1024:.1f} MB ({time.perf_counter() - started:.1f}s)")
+
+        print(f"⏱️  Measuring {n_docs:,} documents...")
+        command = [sys.executable, os.path.abspath(__file__), '--measure', corpus_dir, '--kb', kb_path,
+                   '--seed', str(args.seed), '--queries', str(args.queries),
+                   '--build-workers', str(args.build_workers)]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"❌ Measurement failed for {n_docs:,} documents:\n{result.stderr}")
+            sys.exit(1)
+        measured = json.loads(result.stdout.strip().splitlines()[-1])
+        measured['documents'] = n_docs
+        measured['corpus_bytes'] = info['bytes']
+        report['results'][str(n_docs)] = measured
+        print_result(n_docs, measured)
+
+    return report
+
+
+def print_result(n_docs: int, measured: Dict):
+    load, memory, latency = measured['load'], measured['memory'], measured['latency_ms']
+    print(f"   Index {load['index_seconds']:.2f}s, snapshot {load['snapshot_save_seconds']:.2f}s, "
+          f"warm start {load['warm_start_seconds']:.2f}s")
+    print(f"   Peak RSS {memory['peak_rss_mb']} MB, snapshot {memory['snapshot_bytes'] / 1024 / 1024:.1f} MB")
+    for kind, summary in latency.items():
+        print(f"   {kind:16} p50 {summary['p50']:8.2f} ms  p95 {summary['p95']:8.2f} ms  p99 {summary['p99']:8.2f} ms")
+
+
+def _metric(result: Dict, path: str):
+    value = result
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Print changes against a baseline report; returns the regressed metrics"""
+    regressions = []
+    print(f"\n📊 Compared with baseline from {baseline.get('meta', {}).get('created_at', '?')} "
+          f"(commit {baseline.get('meta', {}).get('git_commit')}), tolerance {tolerance:.0%}")
+    if baseline.get('meta', {}).get('seed') != report['meta']['seed']:
+        print("⚠️  Baseline used a different seed; corpora are not comparable")
+
+    for size, result in report['results'].items():
+        before = baseline.get('results', {}).get(size)
+        if before is None:
+            print(f"   {int(size):,} documents: not in baseline")
+            continue
+        print(f"   {int(size):,} documents:")
+        for path, min_delta in COMPARED_METRICS.items():
+            old, new = _metric(before, path), _metric(result, path)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            flag = ''
+            if change > tolerance and new - old > min_delta:
+                flag = '  ❌ slower/larger'
+                regressions.append(f"{size}:{path}")
+            elif change < -tolerance and old - new > min_delta:
+                flag = '  ✅ faster/smaller'
+            print(f"     {path:32} {old:>12} → {new:>12}  {change:+.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Van Kush Family Knowledge Base Benchmark')
+    parser.add_argument('--sizes', default='10k,100k',
+                        help='Corpus sizes, comma-separated (10k, 100k, 1M or a number)')
+    parser.add_argument('--kb', default=os.path.join(SCRIPT_DIR, 'knowledge-base.py'),
+                        help='knowledge-base.py to benchmark')
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'vkbt-kb-bench'),
+                        help='Where synthetic corpora are generated and cached')
+    parser.add_argument('--seed', type=int, default=42, help='Corpus and query seed')
+    parser.add_argument('--queries', type=int, default=LATENCY_QUERIES, help='Timed queries per kind')
+    parser.add_argument('--build-workers', type=int, default=1,
+                        help='Processes for the index build (0 = one per CPU)')
+    parser.add_argument('--output', default='kb-benchmark-results.json', help='Results JSON file')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help='Relative change counted as a regression (default 0.10)')
+    parser.add_argument('--measure', metavar='CORPUS_DIR', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+    workers = args.build_workers or os.cpu_count() or 1
+
+    if args.measure:
+        print(json.dumps(measure(args.kb, args.measure, args.seed, args.queries, workers)))
+        return
+
+    args.build_workers = workers
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} metrics regressed beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\n✅ No regressions")
+
+
+if __name__ == '__main__':
+    main()
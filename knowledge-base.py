@@ -6,222 +6,3787 @@ Centralized knowledge base that all bots can query.
 Saves tokens by storing information instead of dumping into context.
 
 Features:
-- Load JSONL datasets
-- Full-text search
-- Category filtering
-- Query API for bots
-- Export subsets for fine-tuning
+- Load JSONL datasets, plain or frame-compressed (.jsonlz, see framed_jsonl.py)
+- Full-text search with BM25F ranking (boosted title/category, title:word)
+- Category filtering and category/source facet counts
+- Oversized documents indexed as overlapping chunks, collapsed per parent in results
+- Offline semantic search: TF-IDF + truncated SVD vectors (numpy, memory-mapped, IVF)
+- Hybrid keyword + semantic search with reciprocal rank fusion
+- Batched multi-query search sharing term lookups
+- Query API for bots, with best-passage snippets from stored offsets
+- Streaming fine-tuning export: chunked examples, hashed train/validation split, gzip shards
+- Memory-mapped index snapshot for fast warm starts
+- Compact document store: titles in memory, bodies memory-mapped and decoded on lookup
+- Parallel index build: per-file / byte-range segments on a process pool, merged in order
+- Incremental indexing of lines appended to JSONL datasets
+- Section-level indexing of the curated knowledge/ JSON tree
+- LRU/TTL result cache invalidated by index generation
+- Prometheus /metrics: per-route request counts and latency, cache, memory, slow queries
+- Positional index: "quoted phrases", NEAR/k and proximity ranking
+- Boolean queries (AND/OR/NOT, -word, +required, parentheses) with MaxScore top-k pruning
+- Typo-tolerant and prefix (word*) search via a vocabulary bigram index
+- Shared text analyzer: accent folding, stopwords, light stemming, protected terms
+- Near-duplicate detection at ingest (MinHash/LSH) and dataset compaction
 """
 
 import os
+import sys
 import json
 import re
+import math
+import heapq
+import gzip
+import mmap
+import multiprocessing
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, chain
+from operator import add, or_, sub
+from collections import Counter, OrderedDict, defaultdict
+from collections.abc import MutableMapping, Sequence
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional, Union
 import argparse
+import asyncio
+import signal
+import socket
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+import framed_jsonl
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+# Binary snapshot layout:
+#   magic (8 bytes) | version (u32) | header length (u32) | header JSON | sections
+# The header records each dataset file's size/mtime plus the byte range of every
+# section. Sections are 8-byte aligned so they can be cast straight off the mmap.
+SNAPSHOT_MAGIC = b'VKKBSNAP'
+SNAPSHOT_VERSION = 12
+SNAPSHOT_FILENAME = '.kb_snapshot.bin'
+VECTORS_FILENAME = '.kb_vectors.bin'  # Same container, built on demand (needs numpy)
+_SNAPSHOT_PREFIX = struct.Struct('<8sII')
+
+# Keys in KnowledgeBase.files for sources under knowledge_dir (datasets use bare filenames)
+KNOWLEDGE_PREFIX = 'knowledge:'
+
+
+class SnapshotFile:
+    """Read-only, memory-mapped view of a saved index snapshot"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file cannot be mapped
+            self._file.close()
+            raise ValueError(f"Empty snapshot: {path}")
+
+        magic, version, header_len = _SNAPSHOT_PREFIX.unpack_from(self._mmap, 0)
+        if magic != SNAPSHOT_MAGIC:
+            self.close()
+            raise ValueError(f"Not a knowledge base snapshot: {path}")
+        if version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"Snapshot version {version} != {SNAPSHOT_VERSION}")
+
+        start = _SNAPSHOT_PREFIX.size
+        try:
+            self.header = json.loads(self._mmap[start:start + header_len].decode('utf-8'))
+        except ValueError:
+            self.close()
+            raise ValueError(f"Corrupt snapshot header: {path}")
+
+        # Sections must lie between the end of the header and the end of the file
+        for name, (offset, length) in self.header.get('sections', {}).items():
+            if offset < start + header_len or offset + length > len(self._mmap):
+                self.close()
+                raise ValueError(f"Corrupt snapshot section {name!r}: {path}")
+        self._view = memoryview(self._mmap)
+
+    def section(self, name: str, typecode: Optional[str] = None) -> memoryview:
+        """Zero-copy view of a section, optionally cast to an array typecode"""
+        offset, length = self.header['sections'][name]
+        view = self._view[offset:offset + length]
+        return view.cast(typecode) if typecode else view
+
+    def close(self):
+        if getattr(self, '_view', None) is not None:
+            self._view.release()
+            self._view = None
+        self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def write(path: str, header: Dict, sections: Dict):
+        """Write sections atomically (tmp file + rename).
+
+        A section is bytes, or a (length, iterable of bytes) pair that is
+        streamed into the file.
+        """
+        header = dict(header, version=SNAPSHOT_VERSION, sections={})
+
+        # Header size depends on the section offsets, so lay out until it settles
+        header_bytes = b''
+        while True:
+            offset = _align(_SNAPSHOT_PREFIX.size + len(header_bytes))
+            layout = {}
+            for name, blob in sections.items():
+                length = blob[0] if isinstance(blob, tuple) else len(blob)
+                layout[name] = [offset, length]
+                offset = _align(offset + length)
+            header['sections'] = layout
+            encoded = json.dumps(header).encode('utf-8')
+            if _align(_SNAPSHOT_PREFIX.size + len(encoded)) == _align(_SNAPSHOT_PREFIX.size + len(header_bytes)):
+                header_bytes = encoded
+                break
+            header_bytes = encoded
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_SNAPSHOT_PREFIX.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, blob in sections.items():
+                f.write(b'\0' * (layout[name][0] - f.tell()))
+                for chunk in (blob[1] if isinstance(blob, tuple) else (blob,)):
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+
+
+def _align(offset: int, boundary: int = 8) -> int:
+    return (offset + boundary - 1) // boundary * boundary
+
+
+def _pointer_token(key) -> str:
+    """Escape a key for use in a JSON pointer (RFC 6901)"""
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _humanize(key) -> str:
+    return str(key).replace('_', ' ').replace('-', ' ').strip().capitalize()
+
+
+def iter_json_sections(data, relpath: str):
+    """Flatten a curated knowledge JSON tree into searchable sections.
+
+    Every object (or array element) that has scalar fields becomes one
+    section; nested objects and arrays of objects become sections of their
+    own. Sections are yielded lazily in document order and are addressed by
+    the file path plus a JSON pointer, e.g.
+    ``oilahuasca/theory.json#/part_1/neurogenesis``.
+    """
+    parts = relpath.replace(os.sep, '/').split('/')
+    domain = parts[0] if len(parts) > 1 else 'knowledge'
+    file_title = _humanize(os.path.splitext(parts[-1])[0])
+    if isinstance(data, dict) and isinstance(data.get('title'), str):
+        file_title = data['title']
+
+    stack = [('', data, [])]
+    while stack:
+        pointer, node, labels = stack.pop()
+        lines = []
+        children = []
+        items = node.items() if isinstance(node, dict) else enumerate(node)
+
+        for key, value in items:
+            child_pointer = f"{pointer}/{_pointer_token(key)}"
+            label = _humanize(key) if isinstance(node, dict) else f"#{key + 1}"
+
+            if isinstance(value, dict) or (isinstance(value, list) and
+                                           any(isinstance(v, (dict, list)) for v in value)):
+                if isinstance(value, dict):
+                    named = value.get('title') or value.get('name')
+                    if isinstance(named, str) and named:
+                        label = named
+                children.append((child_pointer, value, labels + [label]))
+            elif isinstance(value, list):
+                text = ', '.join(str(v) for v in value if v not in (None, ''))
+                if text:
+                    lines.append(f"{label}: {text}")
+            elif value not in (None, ''):
+                lines.append(f"{label}: {value}" if isinstance(node, dict) else str(value))
+
+        if lines:
+            yield {
+                'source': f"knowledge/{'/'.join(parts)}",
+                'category': domain,
+                'title': ' › '.join([file_title] + labels),
+                'content': '\n'.join(lines),
+                'key': f"{'/'.join(parts)}#{pointer}",
+                'pointer': pointer
+            }
+
+        # Reversed so the stack pops children in their original order
+        stack.extend(reversed(children))
+
+
+def iter_chunks(doc: Dict, max_chars: int = 4000, overlap: int = 400):
+    """Split an oversized document into overlapping passages, lazily.
+
+    Yields copies of doc whose content is one slice of the original, cut at
+    the last paragraph, line or sentence break before max_chars, with the
+    next slice starting about overlap characters earlier (at a word
+    boundary). Each copy records its ordinal as 'chunk' and where it starts
+    in the original content as 'chunk_offset'. Documents that fit are
+    yielded unchanged.
+    """
+    content = doc.get('content')
+    if not isinstance(content, str) or len(content) <= max_chars:
+        yield doc
+        return
+
+    fields = {key: value for key, value in doc.items() if key != 'content'}
+    start, ordinal = 0, 0
+    while start < len(content):
+        end = min(start + max_chars, len(content))
+        if end < len(content):
+            # Prefer a paragraph, then a line, then a sentence break in the back half
+            floor = start + max_chars // 2
+            for separator in ('\n\n', '\n', '. '):
+                cut = content.rfind(separator, floor, end)
+                if cut >= 0:
+                    end = cut + len(separator)
+                    break
+
+        yield dict(fields, content=content[start:end], chunk=ordinal, chunk_offset=start)
+        if end >= len(content):
+            return
+
+        # Step back for the overlap, then forward to the next word start
+        next_start = max(end - overlap, start + 1)
+        space = content.find(' ', next_start, end)
+        start = space + 1 if space >= 0 else next_start
+        ordinal += 1
+
+
+def join_chunks(chunks: List[Dict]) -> Dict:
+    """The document iter_chunks cut into chunks (all of them, in order)"""
+    first = chunks[0]
+    if 'chunk' not in first:
+        return first
+    parts, covered = [], 0
+    for chunk in chunks:
+        parts.append(chunk['content'][max(covered - chunk['chunk_offset'], 0):])
+        covered = chunk['chunk_offset'] + len(chunk['content'])
+    doc = {key: value for key, value in first.items() if key not in ('chunk', 'chunk_offset', 'parent_id')}
+    doc['content'] = ''.join(parts)
+    return doc
+
+
+class _SpillFile:
+    """Append-only file of document bodies, written by one process only"""
+
+    def __init__(self, directory: Optional[str], first: int):
+        try:
+            self.file = tempfile.TemporaryFile(prefix='.kb_docs-', dir=directory, buffering=0)
+        except OSError:
+            self.file = tempfile.TemporaryFile(prefix='.kb_docs-', buffering=0)
+        self.first = first  # Doc id of the first body
+        self.offsets = array('Q', [0])
+        self.pid = os.getpid()
+        self._map = None
+
+    def append(self, data: bytes):
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def read(self, i: int) -> bytes:
+        start, end = self.offsets[i], self.offsets[i + 1]
+        mapped = self._map
+        if mapped is None or len(mapped) < end:
+            # Remap after appends; readers of the old map let GC unmap it
+            mapped = self._map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped[start:end]
+
+
+class DocumentStore(Sequence):
+    """Document table holding titles in memory and bodies on disk.
+
+    Every document is kept as UTF-8 JSON, in the snapshot's 'docs' section
+    or, for documents added since, in an unlinked spill file. Both are
+    memory-mapped and only decoded when a document is looked up (search
+    results, snippets), so full content never sits on the heap. Category
+    and source live in KnowledgeBase.facets; see KnowledgeBase.describe().
+
+    Forked API workers keep refreshing on their own, so each process
+    appends to a spill file of its own.
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None, snapshot: Optional[SnapshotFile] = None):
+        self.spill_dir = spill_dir
+        if snapshot is not None:
+            self._blob = snapshot.section('docs')
+            self._offsets = snapshot.section('doc_offsets', 'Q')
+            self._base_titles = snapshot.section('titles')
+            self._base_title_offsets = snapshot.section('title_offsets', 'Q')
+        else:
+            self._blob = self._base_titles = memoryview(b'')
+            self._offsets = self._base_title_offsets = array('Q', [0])
+        self._base = len(self._offsets) - 1
+        self._spills: List[_SpillFile] = []
+        self._titles = bytearray()  # Titles of spilled documents
+        self._title_offsets = array('Q', [0])
+
+    def __len__(self):
+        return self._base + len(self._title_offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return json.loads(self.encoded(i))
+
+    def encoded(self, i: int) -> bytes:
+        """UTF-8 JSON for a document, without decoding it"""
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if i < self._base:
+            return self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes()
+        for spill in reversed(self._spills):
+            if i >= spill.first:
+                return spill.read(i - spill.first)
+
+    def title(self, i: int) -> str:
+        if i < self._base:
+            titles, offsets = self._base_titles, self._base_title_offsets
+        else:
+            titles, offsets, i = self._titles, self._title_offsets, i - self._base
+        return bytes(titles[offsets[i]:offsets[i + 1]]).decode('utf-8')
+
+    def append(self, doc: Dict):
+        title = doc.get('title')
+        self.append_encoded(json.dumps(doc, ensure_ascii=False).encode('utf-8'),
+                            '' if title is None else str(title))
+
+    def append_encoded(self, data: bytes, title: str):
+        """Add a document already serialized as UTF-8 JSON"""
+        if not self._spills or self._spills[-1].pid != os.getpid():
+            self._spills.append(_SpillFile(self.spill_dir, len(self)))
+        self._spills[-1].append(data)
+        self._titles += title.encode('utf-8')
+        self._title_offsets.append(len(self._titles))
+
+    def memory_usage(self) -> Dict:
+        """Heap bytes of titles and offsets, plus mapped/spilled body bytes"""
+        heap = sys.getsizeof(self._titles) + sys.getsizeof(self._title_offsets)
+        heap += sum(sys.getsizeof(spill.offsets) for spill in self._spills)
+        mapped = (self._blob.nbytes + self._base_titles.nbytes +
+                  sum(spill.offsets[-1] for spill in self._spills))
+        return {'heap_bytes': heap, 'mapped_bytes': mapped}
+
+
+# Largest value each compact array typecode can hold
+_TYPECODE_MAX = {'B': 0xFF, 'H': 0xFFFF, 'I': 0xFFFFFFFF}
+
+
+def _widen(values, value: int) -> array:
+    """Copy values into the narrowest array typecode that can also hold value"""
+    for typecode, limit in _TYPECODE_MAX.items():
+        if value <= limit:
+            return array(typecode, values)
+    raise OverflowError(f"Posting value too large: {value}")
+
+
+def _gallop(ids, target: int, lo: int) -> int:
+    """First index >= lo where ids[index] >= target (exponential probe, then bisect)"""
+    n = len(ids)
+    bound = 1
+    while lo + bound < n and ids[lo + bound] < target:
+        bound *= 2
+    return bisect_left(ids, target, lo + bound // 2, min(lo + bound + 1, n))
+
+
+# Joins gallop through the longer id list when it is this many times longer
+_GALLOP_RATIO = 32
+
+
+def _join(ids, doc_ids, row: Optional[Dict[int, int]] = None) -> tuple:
+    """(docs of sorted doc_ids present in sorted ids, their indexes in ids).
+
+    The shorter list gallops through a much longer one; otherwise ids are
+    looked up through row (doc id -> index, built here if not given).
+    """
+    if row is None and len(doc_ids) * _GALLOP_RATIO < len(ids):
+        found, hits = [], []
+        lo, n = 0, len(ids)
+        for doc_id in doc_ids:
+            lo = _gallop(ids, doc_id, lo)
+            if lo >= n:
+                break
+            if ids[lo] == doc_id:
+                found.append(doc_id)
+                hits.append(lo)
+        return found, hits
+    if row is None and len(ids) * _GALLOP_RATIO < len(doc_ids):
+        found, hits = [], []
+        lo, n = 0, len(doc_ids)
+        for hit, doc_id in enumerate(ids):
+            lo = _gallop(doc_ids, doc_id, lo)
+            if lo >= n:
+                break
+            if doc_ids[lo] == doc_id:
+                found.append(doc_id)
+                hits.append(hit)
+        return found, hits
+
+    if row is None:
+        row = dict(zip(ids, range(len(ids))))
+    hits = list(map(row.get, doc_ids))
+    if None not in hits:
+        return list(doc_ids), hits
+    found = [doc_id for doc_id, hit in zip(doc_ids, hits) if hit is not None]
+    return found, [hit for hit in hits if hit is not None]
+
+
+def _extend_compact(values: array, more: array) -> array:
+    """Extend a compact array with another one, widening to the wider typecode"""
+    if more.itemsize > values.itemsize:
+        values = array(more.typecode, values)
+    values.extend(more if more.typecode == values.typecode else array(values.typecode, more))
+    return values
+
+
+def _compact(values) -> array:
+    """Values in the narrowest compact array typecode that holds them all"""
+    return _widen(values, max(values, default=0))
+
+
+def _append_compact(values: array, value: int) -> array:
+    """Append to a compact array, widening its typecode first if needed"""
+    try:
+        values.append(value)
+    except OverflowError:
+        values = _widen(values, value)
+        values.append(value)
+    return values
+
+
+class PostingList:
+    """Sorted doc ids for one term, with term frequencies and token positions.
+
+    Stored in memory as delta-encoded arrays in the narrowest typecode that
+    fits (most gaps and counts fit in one or two bytes). Positions are stored
+    per posting as gaps within the document, tf entries each, so the positions
+    of posting i start at sum(tfs[:i]). Lists loaded from a snapshot wrap the
+    mapped uint32 arrays directly and are only converted to the compact form
+    if a document is appended to them.
+
+    Appended postings are buffered as plain lists and encoded in one pass the
+    next time the arrays are read (or by encode() at the end of a build), so
+    a build does not widen the arrays one posting at a time.
+    """
+
+    __slots__ = ('_deltas', '_tfs', '_positions', '_last', '_mapped_ids', '_pending')
+
+    def __init__(self):
+        self._deltas = array('B')
+        self._tfs = array('B')
+        self._positions = array('B')
+        self._last = 0
+        self._mapped_ids = None
+        self._pending: Optional[tuple] = None  # (doc ids, tfs, positions) lists not yet encoded
+
+    @classmethod
+    def mapped(cls, ids, tfs, positions) -> 'PostingList':
+        postings = cls()
+        postings._mapped_ids = ids
+        postings._tfs = tfs
+        postings._positions = positions
+        postings._last = ids[-1] if len(ids) else 0
+        return postings
+
+    def __len__(self):
+        return len(self._tfs) + (len(self._pending[0]) if self._pending else 0)
+
+    @property
+    def deltas(self) -> array:
+        if self._pending:
+            self.encode()
+        return self._deltas
+
+    @property
+    def tfs(self):
+        if self._pending:
+            self.encode()
+        return self._tfs
+
+    @property
+    def positions(self):
+        if self._pending:
+            self.encode()
+        return self._positions
+
+    @property
+    def last(self) -> int:
+        """Largest doc id present"""
+        return self._pending[0][-1] if self._pending else self._last
+
+    def encode(self):
+        """Encode buffered postings into the arrays (a mapped list is first
+        converted to the compact form)"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, None
+        if self._mapped_ids is not None:
+            ids = self._mapped_ids
+            self._mapped_ids = None
+            self._deltas = _compact([b - a for a, b in zip(chain((0,), ids), ids)])
+            self._tfs = _compact(self._tfs)
+            self._positions = _compact(self._positions)
+
+        ids, tfs, gaps = pending
+        deltas = list(map(sub, ids, chain((self._last,), ids)))
+        if len(gaps) > len(ids):
+            positions = gaps
+            gaps = list(map(sub, positions, chain((0,), positions)))
+            for start in accumulate(tfs[:-1], initial=0):
+                gaps[start] = positions[start]  # Each posting's run starts from position 0
+        if len(self._tfs):
+            self._deltas = _extend_compact(self._deltas, _compact(deltas))
+            self._tfs = _extend_compact(self._tfs, _compact(tfs))
+            self._positions = _extend_compact(self._positions, _compact(gaps))
+        else:
+            self._deltas, self._tfs, self._positions = _compact(deltas), _compact(tfs), _compact(gaps)
+        self._last = ids[-1]
+
+    def doc_ids(self):
+        """Random-access sorted doc ids"""
+        if self._pending:
+            self.encode()
+        if self._mapped_ids is not None:
+            return self._mapped_ids
+        return array('I', accumulate(self._deltas))
+
+    def position_offsets(self) -> array:
+        """Start of each posting's run in self.positions (one extra end entry)"""
+        return array('Q', accumulate(self.tfs, initial=0))
+
+    def positions_at(self, i: int, offsets: array) -> List[int]:
+        """Sorted token positions of the i-th posting"""
+        return list(accumulate(self.positions[offsets[i]:offsets[i + 1]]))
+
+    def positions_of(self, doc_id: int) -> List[int]:
+        """Sorted token positions of one document ([] if it has no posting)"""
+        ids = self.doc_ids()
+        i = bisect_left(ids, doc_id)
+        if i == len(ids) or ids[i] != doc_id:
+            return []
+        start = sum(self.tfs[:i])
+        return list(accumulate(self.positions[start:start + self.tfs[i]]))
+
+    def append(self, doc_id: int, positions: List[int]):
+        """Add a posting; doc_id must be greater than any already present"""
+        if self._pending is None:
+            self._pending = ([], [], [])
+        ids, tfs, flat = self._pending
+        ids.append(doc_id)
+        tfs.append(len(positions))
+        flat.extend(positions)
+
+    def extend(self, other: 'PostingList', offset: int):
+        """Append all of other's postings with doc ids shifted by offset.
+
+        Used to merge index segments: other's shifted ids must all be greater
+        than any already present.
+        """
+        if not len(other):
+            return
+        if self._mapped_ids is not None or other._mapped_ids is not None:
+            ids, offsets = other.doc_ids(), other.position_offsets()
+            for i, doc_id in enumerate(ids):
+                self.append(doc_id + offset, other.positions_at(i, offsets))
+            return
+
+        self.encode()
+        other.encode()
+        first = other._deltas[0] + offset
+        self._deltas = _append_compact(self._deltas, first - self._last if len(self._tfs) else first)
+        self._deltas = _extend_compact(self._deltas, other._deltas[1:])
+        self._tfs = _extend_compact(self._tfs, other._tfs)
+        self._positions = _extend_compact(self._positions, other._positions)
+        self._last = other._last + offset
+
+    def nbytes(self) -> int:
+        """Heap bytes held by this posting list (mapped arrays excluded)"""
+        if self._pending:
+            self.encode()
+        size = sys.getsizeof(self)
+        if self._mapped_ids is None:
+            size += (sys.getsizeof(self._deltas) + sys.getsizeof(self._tfs) +
+                     sys.getsizeof(self._positions))
+        return size
+
+
+_ITEMSIZE_TYPECODE = {array(typecode).itemsize: typecode for typecode in _TYPECODE_MAX}
+
+
+def _pack_postings(index: Dict[str, PostingList]) -> tuple:
+    """Flatten in-memory posting lists into (terms, table, blob).
+
+    Pickling thousands of PostingList objects is slow, so build workers send
+    every list's raw arrays as one blob plus a table of (itemsize, byte
+    length) for deltas, tfs and positions and the last doc id, per term.
+    """
+    terms = list(index)
+    table = array('Q')
+    chunks = []
+    for term in terms:
+        postings = index[term]
+        for values in (postings.deltas, postings.tfs, postings.positions):
+            chunks.append(values.tobytes())
+            table.extend((values.itemsize, len(chunks[-1])))
+        table.append(postings.last)
+    return terms, table, b''.join(chunks)
+
+
+def _unpack_postings(packed: tuple):
+    """(term, PostingList) pairs from _pack_postings output"""
+    terms, table, blob = packed
+    blob = memoryview(blob)
+    offset = 0
+    for i, term in enumerate(terms):
+        row = table[i * 7:(i + 1) * 7]
+        postings = PostingList()
+        parts = []
+        for k in range(3):
+            values = array(_ITEMSIZE_TYPECODE[row[2 * k]])
+            values.frombytes(blob[offset:offset + row[2 * k + 1]])
+            offset += row[2 * k + 1]
+            parts.append(values)
+        postings._deltas, postings._tfs, postings._positions = parts
+        postings._last = row[6]
+        yield term, postings
+
+
+class SnapshotIndex(MutableMapping):
+    """Keyword index backed by a snapshot's sorted term table.
+
+    Terms are found by binary search over the mmap, and each term's PostingList
+    wraps the mapped doc id and frequency arrays without copying them. Posting
+    lists that have been looked up are kept in an overlay, and writes after
+    loading are copy-on-write, so the snapshot itself is never modified.
+    """
+
+    def __init__(self, snapshot: SnapshotFile):
+        self._terms = snapshot.section('terms')
+        self._term_offsets = snapshot.section('term_offsets', 'Q')
+        self._postings = snapshot.section('postings', 'I')
+        self._tfs = snapshot.section('tfs', 'I')
+        self._posting_offsets = snapshot.section('posting_offsets', 'Q')
+        self._positions = snapshot.section('positions', 'I')
+        self._position_offsets = snapshot.section('position_offsets', 'Q')
+        self._base = len(self._term_offsets) - 1
+        self._overlay: Dict[str, PostingList] = {}
+        self._new_terms = 0
+
+    def _term_at(self, i: int) -> str:
+        return self._terms[self._term_offsets[i]:self._term_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def _find(self, term: str) -> int:
+        key = term.encode('utf-8')
+        lo, hi = 0, self._base
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self._terms[self._term_offsets[mid]:self._term_offsets[mid + 1]].tobytes()
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def peek(self, term) -> Optional[PostingList]:
+        """Posting list for a term without caching it in the overlay"""
+        if term in self._overlay:
+            return self._overlay[term]
+        i = self._find(term)
+        if i < 0:
+            return None
+        start, end = self._posting_offsets[i], self._posting_offsets[i + 1]
+        positions = self._positions[self._position_offsets[i]:self._position_offsets[i + 1]]
+        return PostingList.mapped(self._postings[start:end], self._tfs[start:end], positions)
+
+    def __getitem__(self, term):
+        postings = self.peek(term)
+        if postings is None:
+            raise KeyError(term)
+        self._overlay[term] = postings
+        return postings
+
+    def __contains__(self, term):
+        return term in self._overlay or self._find(term) >= 0
+
+    def __setitem__(self, term, postings):
+        if term not in self:
+            self._new_terms += 1
+        self._overlay[term] = postings
+
+    def __delitem__(self, term):
+        raise TypeError("Snapshot-backed index does not support deletion")
+
+    def __len__(self):
+        return self._base + self._new_terms
+
+    def __iter__(self):
+        for i in range(self._base):
+            yield self._term_at(i)
+        for term in list(self._overlay):
+            if self._find(term) < 0:
+                yield term
+
+    def memory_usage(self) -> Dict:
+        """Heap bytes of looked-up/updated postings, plus bytes left in the mmap"""
+        heap = sys.getsizeof(self._overlay)
+        for term, postings in self._overlay.items():
+            heap += sys.getsizeof(term) + postings.nbytes()
+        mapped = (self._postings.nbytes + self._tfs.nbytes + self._positions.nbytes +
+                  self._terms.nbytes)
+        return {'heap_bytes': heap, 'mapped_bytes': mapped}
+
+
+# Default analyzer word lists. Stopwords are dropped like short words (they
+# still take up a position, so phrases keep their gaps); protected domain
+# terms are never stemmed
+STOPWORDS = frozenset("""
+about after also and any are been but can could did does for from had has have
+her his how into its just more not now our out over she should some such than
+that the their them then there these they this those through very was were
+what when where which while who why with would you your
+""".split())
+PROTECTED_TERMS = frozenset([
+    'isis', 'osiris', 'anubis', 'hermes', 'ramesses', 'cannabis', 'pihkal', 'tihkal'
+])
+
+
+class Analyzer:
+    """Turns text into index terms; one instance serves indexing and querying.
+
+    Text is split into \\w+ tokens, each keeping its position. A token is
+    lowercased and folded to its unaccented form ("Zār" -> "zar"), dropped if
+    shorter than min_length or a stopword, then reduced by a light plural
+    stemmer ("headcones" -> "headcone") unless it is a protected term.
+    Results are memoized per raw token. version identifies the configuration
+    so an index is never queried with a different analyzer than it was built with.
+    """
+
+    VERSION = 1  # Bump whenever a step changes the terms it produces
+    TOKEN = re.compile(r'\w+')
+    CACHE_SIZE = 1 << 18
+
+    def __init__(self, fold: bool = True, stopwords=STOPWORDS, min_length: int = 3,
+                 stem: bool = True, protected=PROTECTED_TERMS):
+        self.fold = fold
+        self.stopwords = frozenset(stopwords)
+        self.min_length = min_length
+        self.stem = stem
+        self.protected = frozenset(protected)
+        config = json.dumps([fold, sorted(self.stopwords), min_length, stem, sorted(self.protected)])
+        self.version = f'{self.VERSION}-{zlib.crc32(config.encode("utf-8")):08x}'
+        self._cache: Dict[str, Optional[str]] = {}
+
+    def __getstate__(self):
+        return dict(self.__dict__, _cache={})  # Sent to build workers without the memo
+
+    def terms(self, text: str) -> List[Optional[str]]:
+        """Term for every token of text, None where the token is dropped"""
+        tokens = self.TOKEN.findall(text)
+        try:
+            return list(map(self._cache.__getitem__, tokens))
+        except KeyError:
+            return [self.term(token) for token in tokens]
+
+    def term(self, token: str) -> Optional[str]:
+        """Index term for a single token, or None"""
+        try:
+            return self._cache[token]
+        except KeyError:
+            pass
+
+        word = self.normalize(token)
+        if len(word) < self.min_length or word in self.stopwords:
+            term = None
+        elif self.stem and word not in self.protected:
+            term = self._stem(word)
+        else:
+            term = word
+
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        self._cache[token] = term
+        return term
+
+    def normalize(self, token: str) -> str:
+        """Lowercase and, unless fold is off, strip accents (no stopwords or stemming)"""
+        word = token.lower()
+        if self.fold and not word.isascii():
+            word = ''.join(c for c in unicodedata.normalize('NFKD', word) if not unicodedata.combining(c))
+        return word
+
+    @staticmethod
+    def _stem(word: str) -> str:
+        """English plural S-stemmer: -ies -> -y, -es/-s -> -e/-"""
+        if len(word) <= 3 or word[-1] != 's' or word[-2] in 'us' or not word.isalpha():
+            return word
+        if word.endswith('ies') and word[-4] not in 'ae':
+            return word[:-3] + 'y'
+        if word[-2] == 'e' and word[-3] in 'aeio':
+            return word
+        return word[:-1]
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Edit distance counting adjacent swaps as one edit, capped at limit + 1.
+
+    Bit-parallel (Myers' algorithm with Hyyro's transposition step): bit i of
+    the vertical delta vectors stands for row i of the distance table, so a
+    whole column is updated with a few integer operations per character of b.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a:
+        return min(len(b), limit + 1)
+    peq: Dict[str, int] = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | 1 << i
+    mask, high = (1 << len(a)) - 1, 1 << (len(a) - 1)
+    vp, vn, d0, previous, distance = mask, 0, 0, 0, len(a)
+    for char in b:
+        match = peq.get(char, 0)
+        swap = ((~d0 & match) << 1) & previous
+        d0 = ((((match & vp) + vp) ^ vp) | match | vn | swap) & mask
+        hp = (vn | ~(d0 | vp)) & mask
+        hn = d0 & vp
+        if hp & high:
+            distance += 1
+        elif hn & high:
+            distance -= 1
+        x = (hp << 1) | 1
+        vn = x & d0
+        vp = ((hn << 1) | ~(x | d0)) & mask
+        previous = match
+    return min(distance, limit + 1)
+
+
+class VocabularyIndex:
+    """Character bigram index over the indexed terms, for typos and prefixes.
+
+    Each term is padded as "^term$" and listed under each of its bigrams and
+    its length, so candidates for a misspelling are the terms of a nearby
+    length sharing enough bigrams with it; only those are checked with a
+    bounded edit distance. Prefix lookups bisect a sorted copy of the
+    vocabulary, re-sorted only after new terms arrive.
+    """
+
+    def __init__(self, terms=()):
+        self.terms: List[str] = []
+        # Term length -> bigram -> ascending term ids, or the number of a list still in the snapshot
+        self.grams: Dict[int, Dict[str, Union[array, int]]] = {}
+        self._mapped: Optional[tuple] = None  # Snapshot (offsets, ids) of the numbered lists
+        self._sorted: Optional[List[str]] = None
+        for term in terms:
+            self.add(term)
+
+    @classmethod
+    def mapped(cls, snapshot: SnapshotFile) -> 'VocabularyIndex':
+        """Index saved in a snapshot by pack(); id lists are sliced from it on first use"""
+        vocabulary = cls()
+        terms = snapshot.section('vocab_terms').tobytes().decode('utf-8')
+        vocabulary.terms = terms.split('\n') if terms else []
+        vocabulary._mapped = (snapshot.section('vocab_offsets', 'Q'), snapshot.section('vocab_ids', 'I'))
+        number = 0
+        for length, grams in json.loads(snapshot.section('vocab_keys').tobytes().decode('utf-8')).items():
+            vocabulary.grams[int(length)] = dict(zip(grams, range(number, number + len(grams))))
+            number += len(grams)
+        return vocabulary
+
+    def pack(self) -> Dict[str, bytes]:
+        """Snapshot sections holding the index (terms are \\w+ tokens, so never contain newlines)"""
+        keys, offsets, ids = {}, array('Q', [0]), array('I')
+        for length, by_gram in self.grams.items():
+            keys[length] = list(by_gram)
+            for gram in by_gram:
+                ids.extend(self._ids(by_gram, gram))
+                offsets.append(len(ids))
+        return {
+            'vocab_terms': '\n'.join(self.terms).encode('utf-8'),
+            'vocab_keys': json.dumps(keys).encode('utf-8'),
+            'vocab_offsets': offsets.tobytes(),
+            'vocab_ids': ids.tobytes()
+        }
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _ids(self, by_gram: Dict, gram: str):
+        ids = by_gram.get(gram, ())
+        if isinstance(ids, int):
+            offsets, mapped = self._mapped
+            ids = by_gram[gram] = mapped[offsets[ids]:offsets[ids + 1]]
+        return ids
+
+    @staticmethod
+    def _bigrams(term: str) -> set:
+        padded = f'^{term}$'
+        return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+    def add(self, term: str):
+        term_id = len(self.terms)
+        self.terms.append(term)
+        by_gram = self.grams.setdefault(len(term), {})
+        for gram in self._bigrams(term):
+            ids = by_gram.get(gram)
+            if ids is None:
+                ids = by_gram[gram] = array('I')
+            elif not isinstance(ids, array):
+                ids = by_gram[gram] = array('I', self._ids(by_gram, gram))  # Copy a mapped list
+            ids.append(term_id)
+        self._sorted = None
+
+    def similar(self, word: str, max_edits: int) -> List[tuple]:
+        """(distance, term) for indexed terms within max_edits of word, closest first"""
+        grams = self._bigrams(word)
+        # Each edit (an adjacent swap included) destroys at most three bigrams
+        needed = max(len(grams) - 3 * max_edits, 1)
+        matches = []
+        # Only terms whose length is within max_edits can be within max_edits
+        for length in range(max(len(word) - max_edits, 1), len(word) + max_edits + 1):
+            by_gram = self.grams.get(length, {})
+            counts = Counter()
+            for gram in grams:
+                counts.update(self._ids(by_gram, gram))
+            for term_id, shared in counts.items():
+                if shared < needed:
+                    continue
+                term = self.terms[term_id]
+                distance = _edit_distance(word, term, max_edits)
+                if distance <= max_edits:
+                    matches.append((distance, term))
+        return sorted(matches)
+
+    def prefixed(self, prefix: str) -> List[str]:
+        """Indexed terms starting with prefix, in sorted order"""
+        if self._sorted is None:
+            self._sorted = sorted(self.terms)
+        start = bisect_left(self._sorted, prefix)
+        end = bisect_left(self._sorted, prefix + '\U0010ffff', start)
+        return self._sorted[start:end]
+
+
+class MinHashLSH:
+    """Near-duplicate detection with one-permutation MinHash and LSH banding.
+
+    Each SHINGLE-token shingle of a document gets one 32-bit rolling hash.
+    Its top bits pick one of PERMUTATIONS bins and each bin keeps the
+    smallest remaining bits (empty bins borrow from the next filled one).
+    Signatures are cut into BANDS bands. Documents that share a band are
+    candidates, and a candidate whose signature agrees in at least threshold
+    of its positions (an estimate of the Jaccard similarity of the shingle
+    sets) is handed to find's confirm callback for an exact check. Documents
+    with fewer than MIN_SHINGLES shingles get no signature: with most bins
+    empty or borrowed, short texts that differ in one word look identical.
+    numpy, when installed, only speeds up hashing; signatures are identical
+    either way.
+    """
+
+    PERMUTATIONS = 64
+    BANDS = 8
+    SHINGLE = 5
+    MIN_SHINGLES = PERMUTATIONS
+    EMPTY = 0xFFFFFFFF  # Signature row of a document that was not hashed (e.g. a chunk)
+    _BASE = 0x01000193  # Rolling hash multiplier
+    _VALUE_BITS = 26  # 32 bits minus log2(PERMUTATIONS)
+
+    def __init__(self, threshold: Optional[float] = 0.85, signatures=()):
+        self.threshold = threshold  # None: only record signatures (parallel build workers)
+        self.signatures = array('I', signatures)  # PERMUTATIONS values per doc id
+        self._buckets: Optional[Dict[int, int]] = None  # Band hash -> doc id, built on demand
+
+    def signature(self, tokens: List[str]) -> Optional[array]:
+        """Signature of a document's tokens (None below MIN_SHINGLES shingles)"""
+        if len(tokens) - self.SHINGLE + 1 < self.MIN_SHINGLES:
+            return None
+        rolled = self._rolled(tokens)
+        value_mask = (1 << self._VALUE_BITS) - 1
+
+        if HAS_NUMPY:
+            sig_values = np.full(self.PERMUTATIONS, self.EMPTY, dtype=np.uint64)
+            np.minimum.at(sig_values, (rolled >> np.uint64(self._VALUE_BITS)).astype(np.intp),
+                          rolled & np.uint64(value_mask))
+            sig = sig_values.tolist()
+        else:
+            sig = [self.EMPTY] * self.PERMUTATIONS
+            for h in rolled:
+                b, value = h >> self._VALUE_BITS, h & value_mask
+                if value < sig[b]:
+                    sig[b] = value
+
+        # Densify: an empty bin takes the next filled bin's value, offset by its distance
+        bins = self.PERMUTATIONS
+        filled = [b for b in range(bins) if sig[b] != self.EMPTY]
+        for b in range(bins):
+            if sig[b] == self.EMPTY:
+                nxt = filled[bisect_left(filled, b) % len(filled)]
+                sig[b] = sig[nxt] + (((nxt - b) % bins) << self._VALUE_BITS)
+        return array('I', sig)
+
+    def shingles(self, tokens: List[str]) -> set:
+        """Hashes of a document's distinct shingles, to compare exactly with jaccard"""
+        rolled = self._rolled(tokens)
+        return set(rolled.tolist() if HAS_NUMPY else rolled)
+
+    @staticmethod
+    def jaccard(a: set, b: set) -> float:
+        return len(a & b) / len(a | b) if a or b else 1.0
+
+    def _rolled(self, tokens: List[str]):
+        """32-bit rolling hash of every SHINGLE-token window (a numpy array when installed)"""
+        hashes = list(map(zlib.crc32, map(str.encode, tokens)))  # crc32 of each token's UTF-8
+        k = min(self.SHINGLE, len(hashes))
+        n = len(hashes) - k + 1
+        mask = 0xFFFFFFFF
+        if HAS_NUMPY:
+            th = np.array(hashes, dtype=np.uint64)
+            rolled = np.zeros(n, dtype=np.uint64)
+            for j in range(k):
+                rolled = (rolled * np.uint64(self._BASE) + th[j:j + n]) & np.uint64(mask)
+            return rolled
+
+        rolled = []
+        top = pow(self._BASE, k - 1, 1 << 32)
+        h = 0
+        for j in range(k):
+            h = (h * self._BASE + hashes[j]) & mask
+        for i in range(n):
+            if i:
+                h = ((h - hashes[i - 1] * top) * self._BASE + hashes[i + k - 1]) & mask
+            rolled.append(h)
+        return rolled
+
+    def _row(self, doc_id: int) -> array:
+        p = self.PERMUTATIONS
+        return self.signatures[doc_id * p:(doc_id + 1) * p]
+
+    def _band_keys(self, sig: array) -> List[int]:
+        rows = self.PERMUTATIONS // self.BANDS
+        return [zlib.crc32(sig[band * rows:(band + 1) * rows].tobytes(), band) for band in range(self.BANDS)]
+
+    def _index(self) -> Dict[int, int]:
+        if self._buckets is None:
+            self._buckets = {}
+            for doc_id in range(len(self.signatures) // self.PERMUTATIONS):
+                row = self._row(doc_id)
+                if row[0] != self.EMPTY:
+                    for key in self._band_keys(row):
+                        self._buckets.setdefault(key, doc_id)
+        return self._buckets
+
+    def find(self, sig: array, deleted=(), confirm: Optional[Callable[[int], bool]] = None) -> Optional[int]:
+        """Most similar live document at or above the threshold, if any.
+
+        Candidates are tried from the highest estimate down (lowest doc id
+        first on ties); confirm(doc_id), when given, has the final say.
+        """
+        if self.threshold is None:
+            return None
+        buckets = self._index()
+        candidates = []
+        for doc_id in {buckets.get(key) for key in self._band_keys(sig)}:
+            if doc_id is None or doc_id in deleted:
+                continue
+            similarity = sum(a == b for a, b in zip(sig, self._row(doc_id))) / self.PERMUTATIONS
+            if similarity >= self.threshold:
+                candidates.append((-similarity, doc_id))
+        for _, doc_id in sorted(candidates):
+            if confirm is None or confirm(doc_id):
+                return doc_id
+        return None
+
+    def add(self, doc_id: int, sig: Optional[array], deleted=()):
+        """Record doc_id's signature (None for a document that is never matched)"""
+        p = self.PERMUTATIONS
+        missing = doc_id + 1 - len(self.signatures) // p
+        if missing > 0:
+            self.signatures.extend([self.EMPTY] * (missing * p))
+        if sig is None:
+            return
+        self.signatures[doc_id * p:(doc_id + 1) * p] = sig
+        if self.threshold is None:
+            return
+        buckets = self._index()
+        for key in self._band_keys(sig):
+            current = buckets.get(key)
+            if current is None or current in deleted:
+                buckets[key] = doc_id
+
+    def padded(self, n_docs: int) -> array:
+        """Signatures for exactly n_docs doc ids"""
+        p = self.PERMUTATIONS
+        if len(self.signatures) < n_docs * p:
+            self.signatures.extend([self.EMPTY] * (n_docs * p - len(self.signatures)))
+        return self.signatures[:n_docs * p]
+
+
+class FacetIndex:
+    """Doc ids grouped by the value of one document field (category, source).
+
+    Every distinct value gets a small integer code. doc_codes holds each
+    document's code and members the sorted doc ids per code, so a filter is
+    one more id list to intersect and counting a result set never has to
+    decode documents. Documents without the field are grouped under None.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.values: List[Optional[str]] = []
+        self.codes: Dict[Optional[str], int] = {}
+        self.doc_codes = array('I')
+        self.members: List[array] = []
+
+    @classmethod
+    def from_codes(cls, field: str, values: List[Optional[str]], doc_codes) -> 'FacetIndex':
+        facet = cls(field)
+        facet.values = list(values)
+        facet.codes = {value: code for code, value in enumerate(facet.values)}
+        facet.doc_codes = array('I', doc_codes)
+        facet.members = [array('I') for _ in facet.values]
+        for doc_id, code in enumerate(facet.doc_codes):
+            facet.members[code].append(doc_id)
+        return facet
+
+    def add(self, doc_id: int, value):
+        """Record the next document's value; doc ids must arrive in order"""
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+            self.members.append(array('I'))
+        self.doc_codes.append(code)
+        self.members[code].append(doc_id)
+
+    def ids(self, value: str) -> array:
+        """Sorted doc ids with this value (deleted ones included)"""
+        code = self.codes.get(value)
+        return self.members[code] if code is not None else array('I')
+
+    def counts(self, doc_ids) -> Dict[str, int]:
+        """Documents per value among doc_ids, most common first"""
+        tally = Counter(map(self.doc_codes.__getitem__, doc_ids))
+        return self._label(tally.most_common())
+
+    def totals(self, deleted, parents) -> Dict[str, int]:
+        """Live documents per value, counting a chunked document once"""
+        live = Counter(code for doc_id, code in enumerate(self.doc_codes)
+                       if parents[doc_id] == doc_id and doc_id not in deleted)
+        return self._label(live.most_common())
+
+    def _label(self, code_counts) -> Dict[str, int]:
+        labelled: Dict[str, int] = {}
+        for code, n in code_counts:
+            value = self.values[code]
+            label = 'unknown' if value is None else value
+            labelled[label] = labelled.get(label, 0) + n
+        return labelled
+
+
+def _csr_dot(indptr, indices, data, dense, block: int = 1 << 18):
+    """rows(indptr, indices, data) @ dense for a CSR sparse matrix, block by block"""
+    out = np.zeros((len(indptr) - 1, dense.shape[1]), dtype=np.float32)
+    rows = np.flatnonzero(np.diff(indptr))
+    i = 0
+    while i < len(rows):
+        start = indptr[rows[i]]
+        ends = indptr[rows[i:] + 1] - start
+        j = i + max(1, int(np.searchsorted(ends, block, side='right')))
+        batch = rows[i:j]
+        end = indptr[batch[-1] + 1]
+        contrib = data[start:end, None] * dense[indices[start:end]]
+        out[batch] = np.add.reduceat(contrib, indptr[batch] - start, axis=0)
+        i = j
+    return out
+
+
+class SemanticIndex:
+    """Dense document vectors for offline semantic search (latent semantic indexing).
+
+    Vectors come from the keyword index itself: log-scaled TF-IDF rows are
+    projected onto the top singular vectors of the TF-IDF matrix, found with
+    a randomized truncated SVD in NumPy. Everything is saved as one snapshot
+    file, so the float32 document matrix is memory-mapped, not loaded.
+    Queries and documents added later are folded in through the same
+    projection. Past brute_force_limit documents, build() also clusters the
+    vectors (spherical k-means) into an IVF index, and a query only scores
+    the members of its nprobe closest clusters.
+    """
+
+    def __init__(self, terms: List[str], idf, projection, vectors,
+                 centroids=None, list_ids=None, list_offsets=None, nprobe: int = 8):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.idf = idf
+        self.projection = projection
+        self.vectors = vectors
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+        self.extra_ids: List[int] = []  # Folded-in documents past the saved matrix
+        self.extra_vectors: List = []
+
+    @property
+    def dims(self) -> int:
+        return self.projection.shape[1]
+
+    @classmethod
+    def build(cls, index, n_docs: int, deleted=(), dims: int = 128, min_df: int = 2,
+              brute_force_limit: int = 50000, seed: int = 0) -> 'SemanticIndex':
+        """Fit the projection and document vectors from a keyword index"""
+        peek = getattr(index, 'peek', index.get)
+        dead = np.zeros(n_docs, dtype=bool)
+        dead[list(deleted)] = True
+
+        terms, idf, indptr, rows, data = [], [], [0], [], []
+        for term in index:
+            if ':' in term:
+                continue  # Per-field postings duplicate the all-field ones
+            postings = peek(term)
+            ids = np.asarray(postings.doc_ids(), dtype=np.int64)
+            tfs = np.asarray(postings.tfs, dtype=np.float32)
+            live = ~dead[ids]
+            if live.sum() < min_df:
+                continue
+            terms.append(term)
+            rows.append(ids[live])
+            data.append(1 + np.log(tfs[live]))
+            indptr.append(indptr[-1] + int(live.sum()))
+
+        n_live = max(n_docs - int(dead.sum()), 1)
+        dfs = np.diff(indptr).astype(np.float32)
+        idf = np.log(1 + n_live / dfs).astype(np.float32)
+        indptr = np.asarray(indptr, dtype=np.int64)
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        data = np.concatenate(data) if data else np.zeros(0, dtype=np.float32)
+        data *= np.repeat(idf, np.diff(indptr))
+
+        # Unit-length documents, then the same matrix in document-major order
+        norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=n_docs)).astype(np.float32)
+        data /= norms[rows]
+        cols = np.repeat(np.arange(len(terms)), np.diff(indptr))
+        order = np.argsort(rows, kind='stable')
+        doc_indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n_docs))])
+        doc_cols, doc_data = cols[order], data[order]
+
+        def by_docs(dense):  # X @ dense
+            return _csr_dot(doc_indptr, doc_cols, doc_data, dense)
+
+        def by_terms(dense):  # X.T @ dense
+            return _csr_dot(indptr, rows, data, dense)
+
+        # Randomized truncated SVD with two power iterations
+        dims = max(1, min(dims, len(terms) - 1, n_live - 1))
+        rng = np.random.default_rng(seed)
+        sample = by_docs(rng.standard_normal((len(terms), dims + 10)).astype(np.float32))
+        for _ in range(2):
+            q, _ = np.linalg.qr(sample)
+            p, _ = np.linalg.qr(by_terms(q))
+            sample = by_docs(p)
+        q, _ = np.linalg.qr(sample)
+        u, s, vt = np.linalg.svd(by_terms(q).T, full_matrices=False)
+        projection = np.ascontiguousarray(vt[:dims].T, dtype=np.float32)
+        vectors = (q @ (u[:, :dims] * s[:dims])).astype(np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        semantic = cls(terms, idf, projection, vectors)
+        if n_live > brute_force_limit:
+            semantic.cluster(int(np.sqrt(n_live)), seed=seed)
+        return semantic
+
+    def cluster(self, n_clusters: int, iterations: int = 10, seed: int = 0):
+        """Build the IVF lists with spherical k-means over the document vectors"""
+        rng = np.random.default_rng(seed)
+        vectors = np.asarray(self.vectors)
+        live = np.flatnonzero(np.abs(vectors).sum(axis=1) > 0)
+        sample = vectors[rng.choice(live, size=min(len(live), n_clusters * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_clusters, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(n_clusters):
+                members = sample[assign == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        assign = np.concatenate([np.argmax(vectors[i:i + 65536] @ centroids.T, axis=1)
+                                 for i in range(0, len(vectors), 65536)])
+        self.centroids = centroids.astype(np.float32)
+        self.list_ids = np.argsort(assign, kind='stable').astype(np.uint32)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_clusters))]).astype(np.uint64)
+
+    def embed(self, term_counts: Dict[str, int]):
+        """Unit vector for a bag of words (zeros if no word is in the vocabulary)"""
+        ids = [self.term_ids[term] for term in term_counts if term in self.term_ids]
+        vector = np.zeros(self.dims, dtype=np.float32)
+        if ids:
+            counts = np.array([term_counts[self.terms[i]] for i in ids], dtype=np.float32)
+            weights = (1 + np.log(counts)) * self.idf[ids]
+            vector = (weights / np.linalg.norm(weights)) @ self.projection[ids]
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        return vector
+
+    def add(self, doc_id: int, term_counts: Dict[str, int]):
+        """Fold in a document indexed after the vectors were built"""
+        self.extra_ids.append(doc_id)
+        self.extra_vectors.append(self.embed(term_counts))
+
+    def search(self, queries, limit: int, exclude=(), allowed=None) -> List[List[tuple]]:
+        """Top (doc_id, cosine) per row of a (queries x dims) matrix.
+
+        exclude holds doc ids to skip and allowed, if given, the only doc ids
+        that may be returned.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.centroids is None:
+            candidates = [None] * len(queries)
+        else:
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :self.nprobe]
+            candidates = [np.concatenate([self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]]
+                                          for c in row]).astype(np.int64) for row in probes]
+
+        # One matrix product for every query that scans the whole matrix
+        full = [i for i, ids in enumerate(candidates) if ids is None]
+        full_scores = self.vectors @ queries[full].T if full else None
+
+        extra_ids = np.asarray(self.extra_ids, dtype=np.int64)
+        extra_scores = np.asarray(self.extra_vectors).reshape(-1, self.dims) @ queries.T
+
+        results = []
+        for i, ids in enumerate(candidates):
+            if ids is None:
+                ids, scores = np.arange(len(self.vectors)), full_scores[:, full.index(i)]
+            else:
+                scores = np.asarray(self.vectors[ids]) @ queries[i]
+            ids = np.concatenate([ids, extra_ids])
+            scores = np.concatenate([scores, extra_scores[:, i]])
+
+            keep = scores > 0
+            if exclude:
+                keep &= ~np.isin(ids, np.fromiter(exclude, dtype=np.int64))
+            if allowed is not None:
+                keep &= np.isin(ids, np.asarray(allowed, dtype=np.int64))
+            ids, scores = ids[keep], scores[keep]
+
+            if len(ids) > limit:
+                top = np.argpartition(-scores, limit)[:limit]
+                ids, scores = ids[top], scores[top]
+            order = np.lexsort((ids, -scores))
+            results.append([(int(ids[j]), float(scores[j])) for j in order])
+        return results
+
+    def save(self, path: str, header: Dict):
+        terms = [term.encode('utf-8') for term in self.terms]
+        sections = {
+            'terms': b''.join(terms),
+            'term_offsets': array('Q', accumulate((len(t) for t in terms), initial=0)).tobytes(),
+            'idf': np.asarray(self.idf, dtype=np.float32).tobytes(),
+            'projection': np.asarray(self.projection, dtype=np.float32).tobytes(),
+            'vectors': np.asarray(self.vectors, dtype=np.float32).tobytes()
+        }
+        if self.centroids is not None:
+            sections['centroids'] = self.centroids.tobytes()
+            sections['list_ids'] = self.list_ids.tobytes()
+            sections['list_offsets'] = self.list_offsets.tobytes()
+        header = dict(header, kind='vectors', dims=self.dims, clusters=self.centroids is not None)
+        SnapshotFile.write(path, header, sections)
+
+    @classmethod
+    def load(cls, snapshot: 'SnapshotFile') -> 'SemanticIndex':
+        dims = snapshot.header['dims']
+        blob, offsets = snapshot.section('terms'), snapshot.section('term_offsets', 'Q')
+        terms = [blob[offsets[i]:offsets[i + 1]].tobytes().decode('utf-8') for i in range(len(offsets) - 1)]
+
+        def matrix(name, dtype, width=None):
+            values = np.frombuffer(snapshot.section(name), dtype=dtype)
+            return values.reshape(-1, width) if width else values
+
+        ivf = {}
+        if snapshot.header.get('clusters'):
+            ivf = dict(centroids=matrix('centroids', np.float32, dims),
+                       list_ids=matrix('list_ids', np.uint32),
+                       list_offsets=matrix('list_offsets', np.uint64))
+        return cls(terms, matrix('idf', np.float32), matrix('projection', np.float32, dims),
+                   matrix('vectors', np.float32, dims), **ivf)
+
+
+class ResultCache:
+    """Bounded LRU cache of query results with a TTL, tied to an index generation.
+
+    The knowledge base bumps its generation on every reload, added document or
+    dropped file. The first lookup under a newer generation empties the cache,
+    and results computed under an older generation are never stored.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sync(self, generation: int) -> bool:
+        """Catch up with the index generation; False if the caller's is stale"""
+        if generation > self.generation:
+            self._entries.clear()
+            self.generation = generation
+            self.invalidations += 1
+        return generation == self.generation
+
+    def get(self, key, generation: int):
+        with self._lock:
+            entry = self._entries.get(key) if self._sync(generation) else None
+            if entry is None or (self.ttl and entry[0] < time.monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation: int):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if not self._sync(generation):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'invalidations': self.invalidations,
+            'generation': self.generation
+        }
+
+
+class QueryTerms:
+    """Posting lists of one query's words, with lookup tables built on first use.
+
+    A word is joined with candidate documents by galloping through its doc
+    ids when there are few candidates, and otherwise through a doc id ->
+    posting index table built once per query, so matching, scoring and
+    reranking share the work. Words that matched nothing have no postings.
+    """
+
+    def __init__(self, resolved: Dict[str, tuple]):
+        self.resolved = resolved  # word -> (postings, restricted field, per-field postings)
+        self._ids = {word: found[0].doc_ids() for word, found in resolved.items()}
+        self._rows: Dict[object, Dict[int, int]] = {}  # word or (word, field) -> doc id -> index
+        self._field_ids: Dict[tuple, array] = {}
+        self._offsets: Dict[str, array] = {}
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.resolved
+
+    def postings(self, word: str) -> PostingList:
+        return self.resolved[word][0]
+
+    def fields(self, word: str) -> tuple:
+        """(restricted field or None, per-field postings)"""
+        return self.resolved[word][1:]
+
+    def ids(self, word: str):
+        """Sorted doc ids of a word ([] if it matched nothing)"""
+        return self._ids.get(word, [])
+
+    def join(self, word: str, doc_ids) -> tuple:
+        """(docs of sorted doc_ids the word occurs in, their indexes in its postings)"""
+        ids = self._ids[word]
+        if doc_ids is ids:  # Every posting, e.g. a one-word query
+            return list(ids), list(range(len(ids)))
+        return self._join(word, ids, doc_ids)
+
+    def field_join(self, word: str, field: str, doc_ids, row: Dict[int, int]) -> tuple:
+        """(indexes in sorted doc_ids of the docs with the word in field, its
+        frequency there in each); row maps each of doc_ids to its index"""
+        postings = self.resolved[word][2].get(field)
+        if postings is None:
+            return [], []
+        key = (word, field)
+        if key not in self._field_ids:
+            self._field_ids[key] = postings.doc_ids()
+        ids, tfs = self._field_ids[key], postings.tfs
+        if len(doc_ids) >= len(ids) and len(doc_ids) <= len(ids) * _GALLOP_RATIO:
+            # No more field postings than docs: look each one up in row
+            slots = list(map(row.get, ids))
+            return [i for i in slots if i is not None], [tf for i, tf in zip(slots, tfs) if i is not None]
+        found, hits = self._join(key, ids, doc_ids)
+        return [row[doc_id] for doc_id in found], [tfs[hit] for hit in hits]
+
+    def _join(self, key, ids, doc_ids) -> tuple:
+        if len(ids) * _GALLOP_RATIO < len(doc_ids):
+            return _join(ids, doc_ids)
+        row = self._rows.get(key)
+        if row is None:
+            if len(doc_ids) * _GALLOP_RATIO < len(ids):
+                return _join(ids, doc_ids)
+            row = self._rows[key] = dict(zip(ids, range(len(ids))))
+        return _join(ids, doc_ids, row)
+
+    def positions(self, word: str, hit: int) -> List[int]:
+        """Token positions of the word's posting at index hit"""
+        if word not in self._offsets:
+            self._offsets[word] = self.postings(word).position_offsets()
+        return self.postings(word).positions_at(hit, self._offsets[word])
 
 
 class KnowledgeBase:
     """Searchable knowledge base for all Van Kush Family bots"""
 
-    def __init__(self, datasets_dir: str = "datasets"):
-        self.datasets_dir = datasets_dir
-        self.documents: List[Dict] = []
-        self.index = {}  # Simple keyword index
+    # BM25 parameters: term frequency saturation and document length normalization
+    BM25_K1 = 1.2
+    BM25_B = 0.75
+
+    # BM25F boosts per field. Title and category words also get postings of
+    # their own ("title:word") so a query word can be restricted to one field;
+    # content frequencies are what remains of the all-field postings
+    FIELD_BOOSTS = {'title': 3.0, 'category': 2.0, 'content': 1.0}
+    FIELDED = ('title', 'category')
+    # Query syntax (see _parse_query): "phrase", +/- prefixes, (), AND/OR/NOT,
+    # NEAR/k, and words with an optional field prefix and prefix *
+    _QUERY_TOKEN = re.compile(r'"([^"]*)"?|(?<![^\s(])([+-])(?=[\w"(])|([()])|\b(AND|OR|NOT)\b|'
+                              r'\bNEAR/(\d+)\b|(?:(\w+):)?(\w+\*?)')
+
+    # Proximity bonus: per adjacent query-word pair, divided by their closest
+    # distance in the document
+    PROXIMITY_WEIGHT = 1.0
+    # Top-k scoring reads the posting lists this many doc ids at a time, and
+    # keeps the best score of up to TERM_BOUNDS (word, boosts) pairs
+    SCORE_BLOCK = 512
+    TERM_BOUNDS = 4096
+
+    # Unknown words of at least FUZZY_MIN_LENGTH letters match their closest
+    # indexed terms (one edit, two from FUZZY_TWO_EDITS letters); "word*"
+    # matches up to PREFIX_EXPANSIONS of the most frequent terms it starts
+    FUZZY_MIN_LENGTH = 4
+    FUZZY_TWO_EDITS = 7
+    FUZZY_EXPANSIONS = 3
+    PREFIX_EXPANSIONS = 50
+
+    # Document fields with precomputed doc id lists, for filters and counts
+    FACET_FIELDS = ('category', 'source')
+
+    # Content is split into passages at line and sentence breaks (or every
+    # PASSAGE_MAX_TOKENS tokens); bot snippets are windows of whole passages
+    # up to SNIPPET_CHARS long
+    PASSAGE_MAX_TOKENS = 60
+    SNIPPET_CHARS = 500
+
+    # Documents with more content than this (whole books, PDF dumps, long
+    # conversations) are indexed as overlapping chunks of their parent
+    CHUNK_CHARS = 4000
+    CHUNK_OVERLAP = 400
+
+    # Semantic vectors: dimensions, and corpus size past which an IVF index is built
+    VECTOR_DIMS = 128
+    VECTOR_BRUTE_FORCE_LIMIT = 50000
+
+    # Near-duplicates: documents whose word shingles overlap a live document's
+    # by this estimated Jaccard similarity are skipped at ingest
+    DEDUP_THRESHOLD = 0.85
+
+    # Parallel builds split JSONL files into byte ranges of about this size
+    SEGMENT_BYTES = 16 << 20
+
+    # Hybrid search: reciprocal rank fusion constant, and how many ranked
+    # documents each retriever contributes
+    RRF_K = 60
+    HYBRID_DEPTH = 50
+
+    def __init__(self, datasets_dir: str = "datasets", snapshot_path: Optional[str] = None,
+                 knowledge_dir: Optional[str] = None, cache_size: int = 1024, cache_ttl: float = 300.0,
+                 vectors_path: Optional[str] = None, analyzer: Optional[Analyzer] = None,
+                 dedup_threshold: Optional[float] = DEDUP_THRESHOLD):
+        self.datasets_dir = datasets_dir
+        self.knowledge_dir = knowledge_dir  # Optional curated knowledge/<domain>/*.json tree
+        self.snapshot_path = snapshot_path or os.path.join(datasets_dir, SNAPSHOT_FILENAME)
+        self.vectors_path = vectors_path or os.path.join(datasets_dir, VECTORS_FILENAME)
+        self.analyzer = analyzer or Analyzer()  # Shared by indexing and queries
+        self.documents = DocumentStore(datasets_dir)  # Bodies stay on disk until looked up
+        self.index = {}  # Keyword index: term -> PostingList
+        self.doc_lengths = array('I')  # Indexed words per document
+        self.total_length = 0
+        self.field_lengths = {field: array('I') for field in self.FIELDED}
+        self.field_totals = dict.fromkeys(self.FIELDED, 0)
+        # Passage starts in content as (token position, char offset) pairs;
+        # document i owns entries passage_offsets[i]:passage_offsets[i + 1],
+        # the last being an end marker (content token count, content length)
+        self.passage_tokens = array('I')
+        self.passage_chars = array('I')
+        self.passage_offsets = array('Q', [0])
+        self.parents = array('I')  # Doc id of each document's parent (itself unless chunked)
+        self.semantic: Optional[SemanticIndex] = None  # Dense vectors, see build_vectors()
+        # Near-duplicate signatures (None disables dedup); canonical doc ids of
+        # duplicates skipped since the current file was last tracked
+        self.dedup = MinHashLSH(dedup_threshold) if dedup_threshold else None
+        self._shadowed: List[int] = []
+        self._retrievers: Optional[ThreadPoolExecutor] = None  # For hybrid_search
+        self._retrievers_pid = None
+        self.files: Dict[str, Dict] = {}  # Per dataset file: inode, byte offset, doc id ranges
+        self.deleted = set()  # Doc ids from rewritten/removed files
+        self._snapshot: Optional[SnapshotFile] = None
+        self._lock = threading.RLock()
+        self.generation = 0  # Bumped on every index change; invalidates self.cache
+        self.last_reload: Optional[Dict] = None  # Duration of the last load or refresh that changed the index
+        self.cache = ResultCache(maxsize=cache_size, ttl=cache_ttl)
+        self._term_maxima = ResultCache(maxsize=self.TERM_BOUNDS, ttl=0)  # See _term_bound()
+        self.vocabulary: Optional[VocabularyIndex] = None  # Built when datasets finish loading
+        self.facets = {field: FacetIndex(field) for field in self.FACET_FIELDS}
+
+    def load_jsonl(self, filename: str):
+        """Load a JSONL dataset (plain .jsonl or frame-compressed .jsonlz)"""
+        filepath = os.path.join(self.datasets_dir, filename)
+
+        if not os.path.exists(filepath):
+            print(f"⚠️  File not found: {filepath}")
+            return 0
+
+        count = self._tail_jsonl(filename, 0)
+
+        print(f"✅ Loaded {count} documents from {filename}")
+        return count
+
+    def load_json(self, filename: str):
+        """Load a JSON file (list or single object)"""
+        filepath = os.path.join(self.datasets_dir, filename)
+
+        if not os.path.exists(filepath):
+            print(f"⚠️  File not found: {filepath}")
+            return 0
+
+        count = self._read_json(filename)
+
+        print(f"✅ Loaded {count} documents from {filename}")
+        return count
+
+    def _read_json(self, filename: str) -> int:
+        filepath = os.path.join(self.datasets_dir, filename)
+        start = len(self.documents)
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+            st = os.fstat(f.fileno())
+
+        if isinstance(data, list):
+            count = sum(self._add_document(doc) for doc in data)
+        else:
+            count = int(self._add_document(data))
+
+        self._track_file(filename, st, st.st_size, b'', start)
+        return count
+
+    def load_knowledge_file(self, relpath: str) -> int:
+        """Index one curated knowledge JSON file as addressable sections"""
+        filepath = os.path.join(self.knowledge_dir, relpath)
+        start = len(self.documents)
+
+        with open(filepath, 'r', encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                print(f"⚠️  Skipping invalid JSON {filepath}: {e}")
+                data = None
+            st = os.fstat(f.fileno())
+
+        if data is not None:
+            for section in iter_json_sections(data, relpath):
+                self._add_document(section)
+
+        self._track_file(KNOWLEDGE_PREFIX + relpath, st, st.st_size, b'', start)
+        return self._parents_since(start)
+
+    def load_knowledge_tree(self) -> int:
+        """Walk knowledge_dir and index every JSON file, one file at a time"""
+        if not self.knowledge_dir or not os.path.isdir(self.knowledge_dir):
+            print(f"⚠️  Knowledge directory not found: {self.knowledge_dir}")
+            return 0
+
+        count = 0
+        files = self._knowledge_files()
+        for relpath in files:
+            count += self.load_knowledge_file(relpath)
+
+        print(f"✅ Loaded {count} sections from {len(files)} knowledge files")
+        return count
+
+    def _add_document(self, doc: Dict) -> bool:
+        """Index a document, as chunks pointing back at their parent if it is oversized.
+
+        A near-duplicate of a live document is not indexed at all (returns
+        False); its file records the canonical doc id instead, see _track_file.
+        """
+        sig = None
+        if self.dedup is not None:
+            tokens = self._dedup_tokens(doc)
+            sig = self.dedup.signature(tokens)
+            canonical = self._duplicate_of(sig, lambda: tokens) if sig is not None else None
+            if canonical is not None:
+                self._shadowed.append(canonical)
+                return False
+
+        parent_id = len(self.documents)
+        for chunk in iter_chunks(doc, self.CHUNK_CHARS, self.CHUNK_OVERLAP):
+            if chunk is not doc:
+                chunk['parent_id'] = parent_id
+            self.documents.append(chunk)
+            self.parents.append(parent_id)
+            self._index_document(chunk, len(self.documents) - 1)
+        if self.dedup is not None:
+            self.dedup.add(parent_id, sig, self.deleted)
+        self.generation += 1
+        return True
+
+    def _parents_since(self, start: int) -> int:
+        """Documents indexed from doc id start on, counting a chunked one once"""
+        parents = self.parents
+        return sum(1 for doc_id in range(start, len(parents)) if parents[doc_id] == doc_id)
+
+    def _document_count(self) -> int:
+        """Live documents, counting a chunked one once"""
+        parents, deleted = self.parents, self.deleted
+        return sum(1 for doc_id, parent in enumerate(parents) if parent == doc_id and doc_id not in deleted)
+
+    def _dedup_tokens(self, doc: Dict) -> List[str]:
+        """Lowercased tokens of title and content, numbers and stopwords included
+        (none for a text too short to ever get a MinHash signature)"""
+        text = f"{doc.get('title', '')}\n{doc.get('content', '')}"
+        if len(text) < 2 * (MinHashLSH.MIN_SHINGLES + MinHashLSH.SHINGLE - 1) - 1:
+            return []  # Each token takes a character and a separator
+        return self.analyzer.TOKEN.findall(text.lower())
+
+    def _duplicate_of(self, sig: array, tokens: Callable[[], List[str]],
+                      document: Optional[Callable[[int], Dict]] = None) -> Optional[int]:
+        """Live document a new one near-duplicates, if any.
+
+        LSH candidates only count once the exact Jaccard similarity of the
+        two shingle sets reaches the threshold. tokens() gives the new
+        document's tokens and document(doc_id) a candidate (by default the
+        indexed one), both only called for candidates.
+        """
+        document = document or self._whole_document
+        shingles = None
+
+        def confirm(doc_id: int) -> bool:
+            nonlocal shingles
+            if shingles is None:
+                shingles = self.dedup.shingles(tokens())
+            other = self.dedup.shingles(self._dedup_tokens(document(doc_id)))
+            return MinHashLSH.jaccard(shingles, other) >= self.dedup.threshold
+
+        return self.dedup.find(sig, self.deleted, confirm)
+
+    def _tail_jsonl(self, filename: str, offset: int, end: Optional[int] = None) -> int:
+        """Index complete JSONL lines after a byte offset (up to end, a line
+        start, or a frame start of a .jsonlz file), remembering where we stopped"""
+        filepath = os.path.join(self.datasets_dir, filename)
+        start = len(self.documents)
+
+        with open(filepath, 'rb') as f:
+            for line, resume in framed_jsonl.iter_lines(f, offset, end):
+                try:
+                    doc = json.loads(line) if line.strip() else None
+                except json.JSONDecodeError:
+                    if not line.endswith(b'\n'):
+                        break  # Writer is still appending this line
+                    print(f"⚠️  Skipping malformed line in {filename} at byte {offset}")
+                    doc = None
+
+                if resume is not None:
+                    offset = resume
+                if doc is not None:
+                    self._add_document(doc)
+
+            f.seek(max(offset - 64, 0))
+            tail = f.read(offset - f.tell())
+            st = os.fstat(f.fileno())
+
+        self._track_file(filename, st, offset, tail, start)
+        return self._parents_since(start)
+
+    @staticmethod
+    def _is_jsonl(filename: str) -> bool:
+        """Plain or frame-compressed JSONL: read line by line and tailed on append"""
+        return filename.endswith(('.jsonl', framed_jsonl.SUFFIX))
+
+    def _track_file(self, filename: str, st: os.stat_result, offset: int, tail: bytes, start: int):
+        """Remember how far a dataset file has been indexed and which doc ids it produced"""
+        state = self.files.setdefault(filename, {'ranges': []})
+        if len(self.documents) > start:
+            state['ranges'].append([start, len(self.documents)])
+        if self._shadowed:
+            # Canonical doc ids of this file's skipped near-duplicates
+            state['shadows'] = state.get('shadows', []) + self._shadowed
+            self._shadowed = []
+        state.update({
+            'inode': st.st_ino,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'offset': offset,
+            # Fingerprint of the bytes just before offset, to tell appends from rewrites
+            'tail': tail.hex()
+        })
+
+    def _drop_file(self, filename: str):
+        """Tombstone every document that came from a dataset file"""
+        state = self.files.pop(filename, None)
+        if not state:
+            return
+        self.generation += 1
+        for start, end in state['ranges']:
+            for doc_id in range(start, end):
+                if doc_id not in self.deleted:
+                    self.deleted.add(doc_id)
+                    self.total_length -= self.doc_lengths[doc_id]
+                    for field, lengths in self.field_lengths.items():
+                        self.field_totals[field] -= lengths[doc_id]
+
+        # Files whose near-duplicates of these documents were skipped need reindexing
+        for other, other_state in list(self.files.items()):
+            if any(start <= doc_id < end for doc_id in other_state.get('shadows', ())
+                   for start, end in state['ranges']):
+                print(f"🔄 {other} duplicated dropped documents, reindexing it")
+                self._drop_file(other)
+
+    def _file_changed(self, filename: str, st: os.stat_result) -> bool:
+        """True if a file was truncated or rewritten rather than appended to"""
+        state = self.files[filename]
+        if st.st_ino != state['inode'] or st.st_size < state['offset']:
+            return True
+        if not self._is_jsonl(filename):
+            return (st.st_size, st.st_mtime_ns) != (state['size'], state['mtime_ns'])
+        if (st.st_size, st.st_mtime_ns) == (state['size'], state['mtime_ns']) or not state['tail']:
+            return False
+
+        tail = bytes.fromhex(state['tail'])
+        with open(os.path.join(self.datasets_dir, filename), 'rb') as f:
+            f.seek(state['offset'] - len(tail))
+            return f.read(len(tail)) != tail
+
+    def refresh(self) -> int:
+        """Pick up dataset changes without reloading everything.
+
+        Lines appended to a JSONL file are parsed and indexed from the last
+        remembered byte offset. New files are loaded, removed files are
+        dropped, and a file that was truncated or rewritten (different inode,
+        shrunk, or different bytes before the old offset) is reindexed on its
+        own. Returns the number of documents added.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            before = (len(self.documents), len(self.deleted))
+            added = 0
+            current = self._source_files()
+
+            for filename in set(self.files) - set(current):
+                print(f"🗑️  {filename} was removed, dropping its documents")
+                self._drop_file(filename)
+
+            for filename, filepath in current.items():
+                try:
+                    st = os.stat(filepath)
+                except FileNotFoundError:
+                    continue
+
+                if filename in self.files and self._file_changed(filename, st):
+                    print(f"🔄 {filename} was rewritten, reindexing it")
+                    self._drop_file(filename)
+
+                if filename not in self.files:
+                    added += self._load_source(filename)
+                elif self._is_jsonl(filename) and st.st_size > self.files[filename]['offset']:
+                    count = self._tail_jsonl(filename, self.files[filename]['offset'])
+                    if count:
+                        print(f"➕ Indexed {count} new documents from {filename}")
+                    added += count
+
+            # Files dropped after their turn because they duplicated a dropped file
+            for filename, filepath in current.items():
+                if filename not in self.files and os.path.exists(filepath):
+                    added += self._load_source(filename)
+
+            if (len(self.documents), len(self.deleted)) != before:
+                self._record_reload('refresh', started, added)
+            return added
+
+    def _record_reload(self, kind: str, started: float, added: int):
+        self.last_reload = {
+            'kind': kind,
+            'seconds': round(time.perf_counter() - started, 4),
+            'finished': time.time(),
+            'documents_added': added
+        }
+
+    def _load_source(self, filename: str) -> int:
+        """(Re)load one source by its KnowledgeBase.files key"""
+        if filename.startswith(KNOWLEDGE_PREFIX):
+            return self.load_knowledge_file(filename[len(KNOWLEDGE_PREFIX):])
+        if self._is_jsonl(filename):
+            return self.load_jsonl(filename)
+        return self.load_json(filename)
+
+    def start_watcher(self, interval: float = 5.0, save_snapshot: bool = True) -> threading.Thread:
+        """Refresh in a background thread, e.g. while serving the API"""
+        def watch():
+            while True:
+                time.sleep(interval)
+                try:
+                    before = (len(self.documents), len(self.deleted))
+                    self.refresh()
+                    if save_snapshot and (len(self.documents), len(self.deleted)) != before:
+                        with self._lock:
+                            self.save_snapshot()
+                except Exception as e:
+                    print(f"⚠️  Dataset watcher error: {e}")
+
+        thread = threading.Thread(target=watch, name='kb-watcher', daemon=True)
+        thread.start()
+        print(f"👁️  Watching {self.datasets_dir} for new data every {interval}s")
+        return thread
+
+    def _dataset_files(self) -> List[str]:
+        """Dataset filenames in load order"""
+        files = []
+        for filename in sorted(os.listdir(self.datasets_dir)):
+            if self._is_jsonl(filename):
+                files.append(filename)
+            elif filename.endswith('.json') and not filename.endswith('_stats.json'):
+                files.append(filename)
+        return files
+
+    def _knowledge_files(self) -> List[str]:
+        """JSON files under knowledge_dir, relative to it, in load order"""
+        files = []
+        for root, dirs, filenames in os.walk(self.knowledge_dir):
+            dirs.sort()
+            for filename in sorted(filenames):
+                if filename.endswith('.json'):
+                    relpath = os.path.relpath(os.path.join(root, filename), self.knowledge_dir)
+                    files.append(relpath.replace(os.sep, '/'))
+        return files
+
+    def _source_files(self) -> Dict[str, str]:
+        """Every indexed source: KnowledgeBase.files key -> path on disk"""
+        sources = {name: os.path.join(self.datasets_dir, name) for name in self._dataset_files()}
+        if self.knowledge_dir and os.path.isdir(self.knowledge_dir):
+            for relpath in self._knowledge_files():
+                sources[KNOWLEDGE_PREFIX + relpath] = os.path.join(self.knowledge_dir, relpath)
+        return sources
+
+    def _live_documents(self):
+        """Documents that have not been tombstoned"""
+        if not self.deleted:
+            return iter(self.documents)
+        return (doc for doc_id, doc in enumerate(self.documents) if doc_id not in self.deleted)
+
+    def load_all_datasets(self, use_snapshot: bool = True, rebuild: bool = False, workers: int = 1):
+        """Load all available datasets, catching up from the index snapshot when possible.
+
+        A full build runs on workers processes when more than one is given.
+        """
+        if not os.path.exists(self.datasets_dir):
+            print(f"⚠️  Datasets directory not found: {self.datasets_dir}")
+            return
+
+        started = time.perf_counter()
+        if use_snapshot and not rebuild and self.load_snapshot():
+            print(f"⚡ Loaded {self._document_count()} documents from snapshot {self.snapshot_path}")
+            before = (len(self.documents), len(self.deleted))
+            added = self.refresh()
+
+            # Too many tombstones: fall through to a clean rebuild
+            if len(self.deleted) * 4 <= len(self.documents):
+                if (len(self.documents), len(self.deleted)) != before:
+                    self.save_snapshot()
+                self.load_vectors(quiet=True)
+                self._record_reload('snapshot', started, added)
+                return
+            print("🧹 Many documents were replaced, rebuilding index from scratch...")
+            self._reset()
+
+        total = 0
+
+        if workers > 1:
+            total = self._build_parallel(workers)
+        else:
+            for filename in self._dataset_files():
+                if self._is_jsonl(filename):
+                    total += self.load_jsonl(filename)
+                else:
+                    total += self.load_json(filename)
+
+            if self.knowledge_dir:
+                total += self.load_knowledge_tree()
+
+        for postings in self.index.values():
+            postings.encode()  # Postings are buffered while indexing; encode each list once
+
+        print(f"\n📚 Total documents loaded: {total}")
+        skipped = self._duplicates_skipped()
+        if skipped:
+            print(f"🧬 Skipped {skipped} near-duplicate documents")
+
+        if use_snapshot:
+            self.save_snapshot()
+        self.load_vectors(quiet=True)
+        self._vocabulary()  # Built before API workers fork, so they share one copy
+        self._record_reload('build', started, total)
+
+    def _build_parallel(self, workers: int) -> int:
+        """Index every source on a process pool and merge the segments in load order.
+
+        Each worker indexes one file, or one SEGMENT_BYTES byte range of a
+        large JSONL file, into a standalone segment. Segments are merged as
+        they arrive, in the same order a sequential build reads them, so doc
+        ids and near-duplicate decisions come out identical.
+        """
+        units = self._segment_units()
+        kb_args = {'datasets_dir': self.datasets_dir, 'knowledge_dir': self.knowledge_dir,
+                   'analyzer': self.analyzer, 'signatures': self.dedup is not None}
+        context = (multiprocessing.get_context('fork')
+                   if 'fork' in multiprocessing.get_all_start_methods() else None)
+        print(f"⚙️  Indexing {len(units)} segments on {workers} processes...")
+
+        total = knowledge_count = 0
+        file_count = 0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            segments = pool.map(_build_segment, [kb_args] * len(units), units)
+            for i, (unit, segment) in enumerate(zip(units, segments)):
+                kind, name = unit[0], unit[1]
+                count = self._merge_segment(segment)
+                file_count += count
+                if i + 1 < len(units) and units[i + 1][:2] == unit[:2]:
+                    continue  # More byte ranges of this file to come
+                if kind == 'knowledge':
+                    knowledge_count += file_count
+                else:
+                    print(f"✅ Loaded {file_count} documents from {name}")
+                total += file_count
+                file_count = 0
+
+        if self.knowledge_dir and not os.path.isdir(self.knowledge_dir):
+            print(f"⚠️  Knowledge directory not found: {self.knowledge_dir}")
+        elif self.knowledge_dir:
+            n_files = sum(1 for unit in units if unit[0] == 'knowledge')
+            print(f"✅ Loaded {knowledge_count} sections from {n_files} knowledge files")
+        return total
+
+    def _segment_units(self) -> List[tuple]:
+        """(kind, name, start, end) work units in load order"""
+        units = []
+        for filename in self._dataset_files():
+            if not self._is_jsonl(filename):
+                units.append(('json', filename, 0, None))
+                continue
+            filepath = os.path.join(self.datasets_dir, filename)
+            size = os.path.getsize(filepath)
+            cuts = []
+            with open(filepath, 'rb') as f:
+                if framed_jsonl.is_framed(f):
+                    # Cut at frame starts, every SEGMENT_BYTES of uncompressed lines
+                    raw = 0
+                    for offset, length in framed_jsonl.frame_offsets(f):
+                        if raw >= self.SEGMENT_BYTES:
+                            cuts.append(offset)
+                            raw = 0
+                        raw += length
+                else:
+                    start = 0
+                    while size - start > self.SEGMENT_BYTES:
+                        f.seek(start + self.SEGMENT_BYTES)
+                        f.readline()  # Cut at the next line start
+                        start = f.tell()
+                        if start >= size:
+                            break
+                        cuts.append(start)
+            for start, end in zip([0] + cuts, cuts + [None]):
+                units.append(('jsonl', filename, start, end))
+
+        if self.knowledge_dir and os.path.isdir(self.knowledge_dir):
+            units.extend(('knowledge', relpath, 0, None) for relpath in self._knowledge_files())
+        return units
+
+    def _merge_segment(self, segment: Dict) -> int:
+        """Append a worker's segment with its doc ids renumbered after ours.
+
+        Near-duplicates are decided here, against everything merged so far,
+        exactly as _add_document would. Returns the number of documents kept
+        (a chunked document counts once).
+        """
+        docs, titles, parents = segment['documents'], segment['titles'], segment['parents']
+        signatures, p = segment['signatures'], MinHashLSH.PERMUTATIONS
+        base = len(self.documents)
+
+        def segment_document(local: int) -> Dict:
+            end = local + 1
+            while end < len(docs) and parents[end] == local:
+                end += 1
+            return join_chunks([json.loads(data) for data in docs[local:end]])
+
+        def document(doc_id: int) -> Dict:  # Candidates kept from this segment are not appended yet
+            return segment_document(new_ids.index(doc_id)) if doc_id >= base else self._whole_document(doc_id)
+
+        # Renumber, skipping near-duplicate parents together with their chunks
+        new_ids: List[Optional[int]] = []
+        shadows = []
+        next_id = base
+        for local in range(len(docs)):
+            parent = parents[local]
+            if parent != local:
+                keep = new_ids[parent] is not None
+            else:
+                keep = True
+                if self.dedup is not None:
+                    sig = signatures[local * p:(local + 1) * p]
+                    sig = sig if sig[0] != MinHashLSH.EMPTY else None
+                    tokens = lambda: self._dedup_tokens(segment_document(local))
+                    canonical = self._duplicate_of(sig, tokens, document) if sig is not None else None
+                    if canonical is not None:
+                        shadows.append(canonical)
+                        keep = False
+                    else:
+                        self.dedup.add(next_id, sig, self.deleted)
+            new_ids.append(next_id if keep else None)
+            next_id += keep
+        kept = [local for local, new_id in enumerate(new_ids) if new_id is not None]
+
+        facet_codes = segment['facets']
+        for local in kept:
+            data = docs[local]
+            parent_id = new_ids[parents[local]]
+            if b'"parent_id"' in data:
+                doc = json.loads(data)
+                if 'parent_id' in doc:
+                    doc['parent_id'] = parent_id
+                    data = json.dumps(doc, ensure_ascii=False).encode('utf-8')
+            self.documents.append_encoded(data, titles[local])
+            self.parents.append(parent_id)
+            for field, facet in self.facets.items():
+                values, codes = facet_codes[field]
+                facet.add(new_ids[local], values[codes[local]])
+
+        doc_lengths = segment['doc_lengths']
+        self.doc_lengths.extend(doc_lengths[local] for local in kept)
+        self.total_length += sum(doc_lengths[local] for local in kept)
+        for field, lengths in segment['field_lengths'].items():
+            self.field_lengths[field].extend(lengths[local] for local in kept)
+            self.field_totals[field] += sum(lengths[local] for local in kept)
+
+        tokens, chars, offsets = segment['passage_tokens'], segment['passage_chars'], segment['passage_offsets']
+        for local in kept:
+            lo, hi = offsets[local], offsets[local + 1]
+            self.passage_tokens.extend(tokens[lo:hi])
+            self.passage_chars.extend(chars[lo:hi])
+            self.passage_offsets.append(len(self.passage_tokens))
+
+        for term, postings in _unpack_postings(segment['index']):
+            if len(kept) == len(docs):
+                self.index.setdefault(term, PostingList()).extend(postings, base)
+                continue
+            ids, position_offsets = postings.doc_ids(), postings.position_offsets()
+            for i, local in enumerate(ids):
+                if new_ids[local] is not None:
+                    target = self.index.get(term)
+                    if target is None:
+                        target = self.index[term] = PostingList()
+                    target.append(new_ids[local], postings.positions_at(i, position_offsets))
+
+        # Dataset file bookkeeping, as _track_file would have left it
+        for filename, worker_state in segment['files'].items():
+            state = self.files.setdefault(filename, {'ranges': []})
+            if kept:
+                ranges = state['ranges']
+                start, end = new_ids[kept[0]], new_ids[kept[-1]] + 1
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1][1] = end
+                else:
+                    ranges.append([start, end])
+            if shadows:
+                state['shadows'] = state.get('shadows', []) + shadows
+            state.update({key: worker_state[key] for key in ('inode', 'size', 'mtime_ns', 'offset')})
+            state['tail'] = worker_state['tail'] or state.get('tail', '')
+
+        self.generation += 1
+        return self._parents_since(base)
+
+    def _reset(self):
+        """Forget all loaded documents and index state"""
+        # Mapped views may still be referenced, so let GC unmap the old snapshot
+        self._snapshot = None
+        self.generation += 1
+        self.documents = DocumentStore(self.datasets_dir)
+        self.index = {}
+        self.doc_lengths = array('I')
+        self.total_length = 0
+        self.field_lengths = {field: array('I') for field in self.FIELDED}
+        self.field_totals = dict.fromkeys(self.FIELDED, 0)
+        self.passage_tokens = array('I')
+        self.passage_chars = array('I')
+        self.passage_offsets = array('Q', [0])
+        self.parents = array('I')
+        self.semantic = None
+        self.dedup = MinHashLSH(self.dedup.threshold) if self.dedup else None
+        self._shadowed = []
+        self.files = {}
+        self.deleted = set()
+        self.vocabulary = None
+        self.facets = {field: FacetIndex(field) for field in self.FACET_FIELDS}
+
+    def save_snapshot(self, path: Optional[str] = None) -> bool:
+        """Save documents and keyword index as a memory-mappable snapshot"""
+        path = path or self.snapshot_path
+
+        # Bodies are streamed from the document store rather than joined in memory
+        encoded, n_docs = self.documents.encoded, len(self.documents)
+        doc_offsets = array('Q', [0])
+        for i in range(n_docs):
+            doc_offsets.append(doc_offsets[-1] + len(encoded(i)))
+        titles = [self.documents.title(i).encode('utf-8') for i in range(n_docs)]
+        title_offsets = array('Q', [0])
+        title_offsets.extend(accumulate(map(len, titles)))
+
+        peek = getattr(self.index, 'peek', self.index.get)
+        terms = sorted(self.index, key=lambda t: t.encode('utf-8'))
+        term_offsets = array('Q', [0])
+        term_chunks = []
+        postings = array('I')
+        tfs = array('I')
+        posting_offsets = array('Q', [0])
+        positions = array('I')
+        position_offsets = array('Q', [0])
+        for term in terms:
+            chunk = term.encode('utf-8')
+            term_chunks.append(chunk)
+            term_offsets.append(term_offsets[-1] + len(chunk))
+            term_postings = peek(term)
+            postings.extend(term_postings.doc_ids())
+            tfs.fromlist(list(term_postings.tfs))
+            posting_offsets.append(len(postings))
+            positions.fromlist(list(term_postings.positions))
+            position_offsets.append(len(positions))
+
+        header = {
+            'byteorder': sys.byteorder,
+            'files': self.files,
+            'knowledge_dir': self.knowledge_dir,
+            'analyzer': self.analyzer.version,
+            'dedup': self.dedup.threshold if self.dedup else None,
+            'documents': len(self.documents),
+            'facets': {field: facet.values for field, facet in self.facets.items()},
+            'created_at': datetime.now().isoformat()
+        }
+        sections = {
+            'docs': (doc_offsets[-1], map(encoded, range(n_docs))),
+            'doc_offsets': doc_offsets.tobytes(),
+            'titles': b''.join(titles),
+            'title_offsets': title_offsets.tobytes(),
+            'terms': b''.join(term_chunks),
+            'term_offsets': term_offsets.tobytes(),
+            'postings': postings.tobytes(),
+            'tfs': tfs.tobytes(),
+            'posting_offsets': posting_offsets.tobytes(),
+            'positions': positions.tobytes(),
+            'position_offsets': position_offsets.tobytes(),
+            'doc_lengths': self.doc_lengths.tobytes(),
+            **{f'{field}_lengths': lengths.tobytes() for field, lengths in self.field_lengths.items()},
+            'passage_tokens': self.passage_tokens.tobytes(),
+            'passage_chars': self.passage_chars.tobytes(),
+            'passage_offsets': self.passage_offsets.tobytes(),
+            'parents': self.parents.tobytes(),
+            'deleted': array('I', sorted(self.deleted)).tobytes(),
+            'minhash': self.dedup.padded(len(self.documents)).tobytes() if self.dedup else b''
+        }
+        for field, facet in self.facets.items():
+            sections[f'facet_{field}'] = facet.doc_codes.tobytes()
+        sections.update(self._vocabulary().pack())
+
+        try:
+            SnapshotFile.write(path, header, sections)
+        except OSError as e:
+            print(f"⚠️  Could not save snapshot {path}: {e}")
+            return False
+
+        print(f"💾 Saved index snapshot to {path}")
+        return True
 
-    def load_jsonl(self, filename: str):
-        """Load a JSONL dataset"""
-        filepath = os.path.join(self.datasets_dir, filename)
+    def load_snapshot(self, path: Optional[str] = None) -> bool:
+        """Map a saved snapshot; call refresh() afterwards to catch up with dataset changes"""
+        path = path or self.snapshot_path
 
-        if not os.path.exists(filepath):
-            print(f"⚠️  File not found: {filepath}")
-            return 0
+        if not os.path.exists(path):
+            return False
 
-        count = 0
-        with open(filepath, 'r', encoding='utf-8') as f:
-            for line in f:
-                if line.strip():
-                    doc = json.loads(line)
-                    self.documents.append(doc)
-                    self._index_document(doc, len(self.documents) - 1)
-                    count += 1
+        try:
+            snapshot = SnapshotFile(path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Ignoring snapshot: {e}")
+            return False
 
-        print(f"✅ Loaded {count} documents from {filename}")
-        return count
+        if snapshot.header.get('byteorder') != sys.byteorder:
+            print("🔄 Snapshot was written on a different platform, rebuilding index...")
+            snapshot.close()
+            return False
+        if snapshot.header.get('knowledge_dir') != self.knowledge_dir:
+            print("🔄 Snapshot was built with a different knowledge directory, rebuilding index...")
+            snapshot.close()
+            return False
+        if snapshot.header.get('analyzer') != self.analyzer.version:
+            print("🔄 Snapshot was built with a different text analyzer, rebuilding index...")
+            snapshot.close()
+            return False
+        threshold = self.dedup.threshold if self.dedup else None
+        if snapshot.header.get('dedup') != threshold:
+            print("🔄 Snapshot was built with different duplicate detection, rebuilding index...")
+            snapshot.close()
+            return False
 
-    def load_json(self, filename: str):
-        """Load a JSON file (list or single object)"""
-        filepath = os.path.join(self.datasets_dir, filename)
+        self._snapshot = snapshot
+        self.generation += 1
+        self.documents = DocumentStore(self.datasets_dir, snapshot)
+        self.index = SnapshotIndex(snapshot)
+        self.vocabulary = VocabularyIndex.mapped(snapshot)
+        self.semantic = None
+        self.doc_lengths = array('I', snapshot.section('doc_lengths', 'I'))
+        self.files = snapshot.header['files']
+        self.deleted = set(snapshot.section('deleted', 'I'))
+        self.total_length = sum(self.doc_lengths) - sum(self.doc_lengths[i] for i in self.deleted)
+        self.field_lengths = {field: array('I', snapshot.section(f'{field}_lengths', 'I'))
+                              for field in self.FIELDED}
+        self.field_totals = {field: sum(lengths) - sum(lengths[i] for i in self.deleted)
+                             for field, lengths in self.field_lengths.items()}
+        self.passage_tokens = array('I', snapshot.section('passage_tokens', 'I'))
+        self.passage_chars = array('I', snapshot.section('passage_chars', 'I'))
+        self.passage_offsets = array('Q', snapshot.section('passage_offsets', 'Q'))
+        self.parents = array('I', snapshot.section('parents', 'I'))
+        if threshold:
+            self.dedup = MinHashLSH(threshold, snapshot.section('minhash', 'I'))
+        self._shadowed = []
+        self.facets = {
+            field: FacetIndex.from_codes(field, values, snapshot.section(f'facet_{field}', 'I'))
+            for field, values in snapshot.header['facets'].items()
+        }
+        return True
 
-        if not os.path.exists(filepath):
-            print(f"⚠️  File not found: {filepath}")
-            return 0
+    def _index_document(self, doc: Dict, doc_id: int):
+        """Index keyword positions, term frequencies and document/field lengths"""
+        # Positions run across content, title and category in that order and
+        # count every token, so phrases with short words keep their gaps
+        term_positions = defaultdict(list)
+        field_positions = {field: defaultdict(list) for field in self.FIELDED}
+        tokens = {'content': self._index_passages(doc.get('content', ''))}
+        for field in ('title', 'category'):
+            tokens[field] = self.analyzer.terms(doc[field]) if field in doc else []
 
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        position = 0
+        for field, words in tokens.items():
+            for targets in (term_positions, field_positions.get(field)):
+                if targets is None:
+                    continue
+                for offset, word in enumerate(words, position):
+                    if word is not None:  # Dropped by the analyzer
+                        targets[word].append(offset)
+            position += len(words)
 
-        if isinstance(data, list):
-            for doc in data:
-                self.documents.append(doc)
-                self._index_document(doc, len(self.documents) - 1)
-            count = len(data)
+        # Index keywords
+        length = 0
+        for word, positions in term_positions.items():
+            postings = self.index.get(word)
+            if postings is None:
+                postings = self.index[word] = PostingList()
+                if self.vocabulary is not None:
+                    self.vocabulary.add(word)
+            postings.append(doc_id, positions)
+            length += len(positions)
+
+        self.doc_lengths.append(length)
+        self.total_length += length
+
+        if self.semantic is not None:
+            self.semantic.add(doc_id, {word: len(positions) for word, positions in term_positions.items()})
+
+        # Per-field postings for boosting and field:word restrictions
+        for field, positions_by_word in field_positions.items():
+            field_length = 0
+            for word, positions in positions_by_word.items():
+                key = f'{field}:{word}'
+                postings = self.index.get(key)
+                if postings is None:
+                    postings = self.index[key] = PostingList()
+                postings.append(doc_id, positions)
+                field_length += len(positions)
+            self.field_lengths[field].append(field_length)
+            self.field_totals[field] += field_length
+
+        for field, facet in self.facets.items():
+            facet.add(doc_id, doc.get(field))
+
+    def _index_passages(self, content: str) -> List[Optional[str]]:
+        """Record passage starts for the next document's content; returns its analyzed tokens"""
+        words = []
+        start = 0
+        for end in [match.end() for match in re.finditer(r'\n|[.!?]\s', content)] + [len(content)]:
+            segment = content[start:end]
+            segment_words = self.analyzer.terms(segment)
+            if len(segment_words) > self.PASSAGE_MAX_TOKENS:
+                # Run-on text: a new passage every PASSAGE_MAX_TOKENS tokens
+                chunk = r'\w+(?:\W+\w+){0,%d}' % (self.PASSAGE_MAX_TOKENS - 1)
+                for k, match in enumerate(re.finditer(chunk, segment)):
+                    self.passage_tokens.append(len(words) + k * self.PASSAGE_MAX_TOKENS)
+                    self.passage_chars.append(start + match.start() if words or k else 0)
+            elif segment_words:
+                self.passage_tokens.append(len(words))
+                self.passage_chars.append(start + re.search(r'\w', segment).start() if words else 0)
+            words.extend(segment_words)
+            start = end
+
+        self.passage_tokens.append(len(words))
+        self.passage_chars.append(len(content))
+        self.passage_offsets.append(len(self.passage_tokens))
+        return words
+
+    def _field_norms(self, doc_ids: List[int]) -> Dict[str, List[float]]:
+        """BM25 length normalization per field for each doc"""
+        n_docs = len(self.doc_lengths) - len(self.deleted)
+        b = self.BM25_B
+        lengths = {field: [self.field_lengths[field][doc_id] for doc_id in doc_ids]
+                   for field in self.FIELDED}
+        content = [self.doc_lengths[doc_id] for doc_id in doc_ids]
+        for field in self.FIELDED:
+            content = [total - length for total, length in zip(content, lengths[field])]
+        lengths['content'] = content
+        totals = dict(self.field_totals, content=self.total_length - sum(self.field_totals.values()))
+        norms = {}
+        for field, field_lengths in lengths.items():
+            avg = totals[field] / n_docs if n_docs else 0.0
+            norms[field] = [1 - b + b * length / avg if avg else 1.0 for length in field_lengths]
+        return norms
+
+    def _term_scores(self, terms: QueryTerms, word: str, doc_ids: List[int], term_hits: List[int],
+                     boosts: Dict[str, float]) -> List[float]:
+        """One word's BM25F contribution to each doc (term_hits index its postings)"""
+        n_docs = len(self.doc_lengths) - len(self.deleted)
+        k1 = self.BM25_K1
+        postings = terms.postings(word)
+        restricted, field_postings = terms.fields(word)
+        df = len(postings)
+        idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+        tfs = postings.tfs
+        norms = self._field_norms(doc_ids)
+
+        if restricted:
+            weighted = [boosts.get(restricted, 1.0) * tfs[hit] / norm
+                        for hit, norm in zip(term_hits, norms[restricted])]
         else:
-            self.documents.append(data)
-            self._index_document(data, len(self.documents) - 1)
-            count = 1
+            row = None
+            content = [tfs[hit] for hit in term_hits]
+            weighted = [0.0] * len(doc_ids)
+            for field, field_posting in field_postings.items():
+                if field_posting is None:
+                    continue
+                if row is None:
+                    row = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+                boost, field_norms = boosts.get(field, 1.0), norms[field]
+                for i, tf in zip(*terms.field_join(word, field, doc_ids, row)):
+                    content[i] -= tf
+                    weighted[i] += boost * tf / field_norms[i]
+            content_boost = boosts.get('content', 1.0)
+            for i, tf in enumerate(content):
+                weighted[i] += content_boost * tf / norms['content'][i]
 
-        print(f"✅ Loaded {count} documents from {filename}")
-        return count
+        return [idf * tf * (k1 + 1) / (tf + k1) for tf in weighted]
 
-    def load_all_datasets(self):
-        """Load all available datasets"""
-        if not os.path.exists(self.datasets_dir):
-            print(f"⚠️  Datasets directory not found: {self.datasets_dir}")
-            return
+    @staticmethod
+    def _cache_key(kind: str, query: str, *args) -> tuple:
+        """Cache key on the whitespace-normalized query text plus request parameters"""
+        return (kind, ' '.join(query.split())) + args
 
-        total = 0
+    @classmethod
+    def parse_boosts(cls, spec: str) -> Dict[str, float]:
+        """Parse "title:4,content:1" into field boosts"""
+        boosts = {}
+        for item in filter(None, (part.strip() for part in spec.split(','))):
+            field, _, value = item.partition(':')
+            if field not in cls.FIELD_BOOSTS:
+                raise ValueError(f"Unknown field {field!r}; expected one of {', '.join(cls.FIELD_BOOSTS)}")
+            try:
+                boost = float(value)
+            except ValueError:
+                boost = math.nan
+            if not math.isfinite(boost):
+                raise ValueError(f"Boost for {field!r} must be a finite number")
+            boosts[field] = boost
+        return boosts
 
-        for filename in os.listdir(self.datasets_dir):
-            if filename.endswith('.jsonl'):
-                total += self.load_jsonl(filename)
-            elif filename.endswith('.json') and not filename.endswith('_stats.json'):
-                total += self.load_json(filename)
+    def search(self, query: str, category: Optional[str] = None, limit: int = 10,
+               boosts: Optional[Dict[str, float]] = None) -> List[Dict]:
+        """Search knowledge base, ranked by BM25F (boosts override FIELD_BOOSTS)"""
+        return self.search_faceted(query, category, limit, facets=False, boosts=boosts)['results']
 
-        print(f"\n📚 Total documents loaded: {total}")
+    def search_faceted(self, query: str, category: Optional[str] = None, limit: int = 10,
+                       facets: bool = True, boosts: Optional[Dict[str, float]] = None) -> Dict:
+        """Search, plus the number of matching documents and their per-category/source
+        counts (facets=False skips both, as only the top limit are looked at then)"""
+        boosts = dict(self.FIELD_BOOSTS, **(boosts or {}))
+        key = self._cache_key('search', query, category, limit, facets, tuple(sorted(boosts.items())))
+        cached = self.cache.get(key, self.generation)
+        if cached is None:
+            with self._lock:
+                generation = self.generation
+                top, matches = self._search(query, category, limit, boosts, exact_total=facets)
+                results = [self.documents[doc_id] for doc_id, _ in top]
+                counts = total = None
+                if facets:
+                    representatives = self._representatives(matches)
+                    counts = {field: facet.counts(representatives) for field, facet in self.facets.items()}
+                    total = len(representatives)
+            cached = (results, counts, total)
+            self.cache.put(key, cached, generation)
 
-    def _index_document(self, doc: Dict, doc_id: int):
-        """Build simple keyword index"""
-        text = ""
+        results, counts, total = cached
+        response = {'results': list(results)}
+        if counts is not None:
+            response['total'] = total
+            response['facets'] = counts
+        return response
 
-        # Extract searchable text from document
-        if 'content' in doc:
-            text += doc['content'] + " "
-        if 'title' in doc:
-            text += doc['title'] + " "
-        if 'category' in doc:
-            text += doc['category'] + " "
+    def search_many(self, queries: List, category: Optional[str] = None, limit: int = 10,
+                    boosts: Optional[Dict[str, float]] = None) -> List[Dict]:
+        """Run several searches under one lock acquisition.
 
-        # Normalize and tokenize
-        text = text.lower()
-        words = re.findall(r'\w+', text)
+        Each query is a string or a {"q", "category", "limit"} dict overriding
+        the shared defaults. Words (with their misspelling and prefix
+        expansions) are resolved once for the whole batch, and each word is
+        scored once per document over the candidates of all its queries.
+        Returns {'query', 'results'} per query, in order.
+        """
+        boosts = dict(self.FIELD_BOOSTS, **(boosts or {}))
+        requests = []
+        for item in queries:
+            if isinstance(item, str):
+                item = {'q': item}
+            elif not isinstance(item, dict):
+                raise ValueError(f"Expected a query string or object, got {item!r}")
+            requests.append((str(item.get('q', '')), item.get('category', category),
+                             int(item.get('limit', limit))))
 
-        # Index keywords
-        for word in words:
-            if len(word) > 2:  # Skip very short words
-                if word not in self.index:
-                    self.index[word] = set()
-                self.index[word].add(doc_id)
-
-    def search(self, query: str, category: Optional[str] = None, limit: int = 10) -> List[Dict]:
-        """Search knowledge base"""
-        # Normalize query
-        query = query.lower()
-        query_words = re.findall(r'\w+', query)
-
-        # Find documents matching keywords
-        matching_docs = None
-
-        for word in query_words:
-            if word in self.index:
-                word_docs = self.index[word]
-                if matching_docs is None:
-                    matching_docs = word_docs.copy()
-                else:
-                    matching_docs &= word_docs  # Intersection (AND logic)
+        # Same entries as search(), so single and batched lookups share the cache
+        keys = [self._cache_key('search', query, cat, lim, False, tuple(sorted(boosts.items())))
+                for query, cat, lim in requests]
+        found = [self.cache.get(key, self.generation) for key in keys]
+        missing = [i for i, cached in enumerate(found) if cached is None]
+        if missing:
+            with self._lock:
+                generation = self.generation
+                memo, shared = {}, {}
+                for i in missing:
+                    query, cat, lim = requests[i]
+                    top, _ = self._search(query, cat, lim, boosts, memo, shared=shared)
+                    found[i] = ([self.documents[doc_id] for doc_id, _ in top], None, None)
+                    self.cache.put(keys[i], found[i], generation)
+
+        return [{'query': query, 'results': list(results)}
+                for (query, _, _), (results, _, _) in zip(requests, found)]
+
+    def _representatives(self, doc_ids) -> List[int]:
+        """One doc id per parent among doc_ids (chunks share their parent's facets)"""
+        return list(dict(zip(map(self.parents.__getitem__, doc_ids), doc_ids)).values())
+
+    def _collapse(self, scores: Dict[int, float]) -> Dict[int, float]:
+        """Keep only the best-scoring chunk of each parent document"""
+        best: Dict[int, int] = {}
+        parents = self.parents
+        for doc_id, score in scores.items():
+            parent = parents[doc_id]
+            current = best.get(parent)
+            if current is None or (score, -doc_id) > (scores[current], -current):
+                best[parent] = doc_id
+        if len(best) == len(scores):
+            return scores
+        return {doc_id: scores[doc_id] for doc_id in best.values()}
+
+    @staticmethod
+    def _rank_key(item: tuple) -> tuple:
+        """Best score first; ties keep load order"""
+        return item[1], -item[0]
+
+    def _parse_query(self, query: str, require_all: bool = True) -> Optional[tuple]:
+        """Parse a query into a tree of match clauses (None if it has no words).
+
+        Plain words, "quoted phrases" and ``a NEAR/k b`` pairs side by side
+        must all match (implicit AND; ``AND`` may also be written out).
+        ``a OR b`` matches either side and binds looser than AND, parentheses
+        group, and ``NOT x`` or ``-x`` excludes documents matching x. Prefixing
+        an item with ``+`` makes it required and the unmarked items of its
+        group optional: they only add to the score. With require_all=False
+        unmarked items are optional everywhere. Words may be restricted to a
+        field with ``title:word`` or ``category:word``; ``content:word`` is a plain
+        word, as every search covers the content, and any other ``x:y`` is
+        matched literally as the phrase "x y". Operators must be upper case, as "and" and
+        "not" are stopwords otherwise.
+
+        Nodes are ('word', term), ('phrase', [(term, offset), ...]) with
+        offsets counted over every token so dropped words keep their slot,
+        ('near', a, b, k), ('any', [node, ...]) and
+        ('all', required, optional, excluded) lists of nodes.
+        """
+        tokens, depth = [], 0
+        for match in self._QUERY_TOKEN.finditer(query):
+            phrase, sign, paren, operator, near, field, word = match.groups()
+            if phrase is not None:
+                tokens.append(('phrase', phrase))
+            elif sign:
+                tokens.append(('not' if sign == '-' else 'required', None))
+            elif paren == '(':
+                depth += 1
+                tokens.append(('(', None))
+            elif paren == ')':
+                if depth:  # Unbalanced closing parentheses are ignored
+                    depth -= 1
+                    tokens.append((')', None))
+            elif operator:
+                tokens.append((operator.lower(), None))
+            elif near:
+                tokens.append(('near', int(near)))
+            elif field and field.lower() in self.FIELDED:
+                tokens.append(('word', f'{field.lower()}:{word.lower()}'))
+            elif field and field.lower() != 'content':
+                # Not a field: match the text as written
+                tokens.append(('phrase', f'{field} {word}'))
+            else:
+                tokens.append(('word', word.lower()))
+        tokens.append(('end', None))
+        pos = 0
+
+        def word_node(word: str) -> Optional[tuple]:
+            field, _, token = word.rpartition(':')
+            if token.endswith('*'):
+                # Prefixes are only folded: a stemmed prefix would miss longer words
+                term = self.analyzer.normalize(token[:-1]) + '*'
+            else:
+                term = self.analyzer.term(token)
+            if not term:
+                return None
+            return ('word', f'{field}:{term}' if field else term)
+
+        def parse_any() -> Optional[tuple]:
+            nonlocal pos
+            groups = [parse_all()]
+            while tokens[pos][0] == 'or':
+                pos += 1
+                groups.append(parse_all())
+            groups = [group for group in groups if group is not None]
+            if len(groups) > 1:
+                return ('any', groups)
+            return groups[0] if groups else None
+
+        def parse_all() -> Optional[tuple]:
+            nonlocal pos
+            items = []
+            while tokens[pos][0] not in ('or', ')', 'end'):
+                mode = ''
+                while tokens[pos][0] in ('not', 'required', 'and'):
+                    if tokens[pos][0] != 'and':
+                        mode = tokens[pos][0]
+                    pos += 1
+                node = parse_primary()
+                if node is not None:
+                    items.append((mode, node))
+
+            marked = any(mode == 'required' for mode, _ in items)
+            required = [node for mode, node in items if mode == 'required']
+            plain = [node for mode, node in items if not mode]
+            excluded = [node for mode, node in items if mode == 'not']
+            optional = plain if marked or not require_all else []
+            if not (marked or not require_all):
+                required += plain
+            if not excluded and not optional and len(required) == 1:
+                return required[0]
+            if not (required or optional or excluded):
+                return None
+            return ('all', required, optional, excluded)
+
+        def parse_primary() -> Optional[tuple]:
+            nonlocal pos
+            kind, value = tokens[pos]
+            if kind == 'end':
+                return None
+            pos += 1
+            if kind == '(':
+                node = parse_any()
+                if tokens[pos][0] == ')':
+                    pos += 1
+                return node
+            if kind == 'phrase':
+                terms = self.analyzer.terms(value)
+                phrase = [(term, i) for i, term in enumerate(terms) if term is not None]
+                if len(phrase) == 1:
+                    return ('word', phrase[0][0])
+                if not phrase:
+                    return None
+                first = phrase[0][1]
+                return ('phrase', [(term, i - first) for term, i in phrase])
+            if kind != 'word':
+                return None  # A stray NEAR/k or operator
+            # a NEAR/k b NEAR/k c chains pairwise constraints; a dropped word drops its pairs
+            nodes, node = [], word_node(value)
+            while tokens[pos][0] == 'near' and tokens[pos + 1][0] == 'word':
+                k, other = tokens[pos][1], word_node(tokens[pos + 1][1])
+                pos += 2
+                if node is not None and other is not None:
+                    nodes.append(('near', node[1], other[1], k))
+                elif node is not None:
+                    nodes.append(node)
+                node = other
+            if not nodes:
+                return node
+            if node is not None and not any(node[1] in n[1:3] for n in nodes if n[0] == 'near'):
+                nodes.append(node)
+            return nodes[0] if len(nodes) == 1 else ('all', nodes, [], [])
+
+        return parse_any()
+
+    @classmethod
+    def _query_words(cls, node: Optional[tuple], positive: bool = True) -> List[str]:
+        """Distinct words of a query tree in query order (only those that
+        can match, unless positive is False)"""
+        if node is None:
+            return []
+        kind = node[0]
+        if kind == 'word':
+            return [node[1]]
+        if kind == 'phrase':
+            return list(dict.fromkeys(term for term, _ in node[1]))
+        if kind == 'near':
+            return list(dict.fromkeys(node[1:3]))
+        children = node[1] if kind == 'any' else node[1] + node[2] + ([] if positive else node[3])
+        return list(dict.fromkeys(word for child in children for word in cls._query_words(child, positive)))
+
+    def _peek(self, term: str) -> Optional[PostingList]:
+        """Posting list for a term without pulling it into the snapshot overlay"""
+        if isinstance(self.index, SnapshotIndex):
+            return self.index.peek(term)
+        return self.index.get(term)
+
+    def _vocabulary(self) -> VocabularyIndex:
+        if self.vocabulary is None:
+            self.vocabulary = VocabularyIndex(term for term in self.index if ':' not in term)
+        return self.vocabulary
+
+    def expand_term(self, word: str) -> List[str]:
+        """Indexed terms a query word stands for: itself, its prefix matches or closest spellings"""
+        field, _, term = word.rpartition(':')
+        if field:
+            return [f'{field}:{t}' for t in self.expand_term(term) if f'{field}:{t}' in self.index]
 
-        if matching_docs is None:
+        if word.endswith('*'):
+            stem = word.rstrip('*')
+            if len(stem) < 2:
+                return []
+            matches = self._vocabulary().prefixed(stem)
+            if len(matches) > self.PREFIX_EXPANSIONS:
+                matches = heapq.nlargest(self.PREFIX_EXPANSIONS, matches,
+                                         key=lambda term: len(self._peek(term)))
+            return matches
+
+        if word in self.index:
+            return [word]
+        if len(word) < self.FUZZY_MIN_LENGTH:
+            return []
+
+        # Only the closest terms are used, so two edits are tried only when one finds nothing
+        matches = []
+        for max_edits in range(1, 3 if len(word) >= self.FUZZY_TWO_EDITS else 2):
+            matches = self._vocabulary().similar(word, max_edits)
+            if matches:
+                break
+        closest = [term for distance, term in matches if distance == matches[0][0]] if matches else []
+        closest.sort(key=lambda term: len(self._peek(term)), reverse=True)
+        return closest[:self.FUZZY_EXPANSIONS]
+
+    def _merge(self, terms: List[str]) -> Optional[PostingList]:
+        """One posting list covering several indexed terms"""
+        terms = [term for term in terms if term in self.index]
+        if not terms:
+            return None
+        if len(terms) == 1:
+            return self.index[terms[0]]
+
+        merged_positions: Dict[int, List[int]] = {}
+        for term in terms:
+            postings = self._peek(term)
+            offsets = postings.position_offsets()
+            for i, doc_id in enumerate(postings.doc_ids()):
+                merged_positions.setdefault(doc_id, []).extend(postings.positions_at(i, offsets))
+
+        merged = PostingList()
+        for doc_id in sorted(merged_positions):
+            merged.append(doc_id, sorted(merged_positions[doc_id]))
+        return merged
+
+    def _resolve(self, word: str) -> Optional[tuple]:
+        """(postings, restricted field, per-field postings) for a query word.
+
+        Expansions of misspelled and word* terms are merged into one list.
+        """
+        terms = self.expand_term(word)
+        postings = self._merge(terms)
+        if postings is None:
+            return None
+        field = word.partition(':')[0] if ':' in word else None
+        if field:
+            return postings, field, {}
+        return postings, None, {field: self._merge([f'{field}:{term}' for term in terms])
+                                for field in self.FIELDED}
+
+    @staticmethod
+    def _min_distance(a: List[int], b: List[int]) -> int:
+        """Smallest gap between two sorted position lists"""
+        if len(a) > len(b):
+            a, b = b, a
+        best, n = float('inf'), len(b)
+        for position in a:  # Neighbours of each position of the shorter list
+            i = bisect_left(b, position)
+            if i < n and b[i] - position < best:
+                best = b[i] - position
+            if i and position - b[i - 1] < best:
+                best = position - b[i - 1]
+        return best
+
+    def _search(self, query: str, category: Optional[str], limit: int,
+                boosts: Optional[Dict[str, float]] = None, memo: Optional[Dict] = None,
+                require_all: bool = True, exact_total: bool = False,
+                shared: Optional[Dict] = None) -> tuple:
+        """Evaluate a query: its best limit documents, and every match if asked.
+
+        Returns ([(doc id, score)] of the top limit parents, best first, and
+        the sorted ids of every live matching document, or None unless
+        exact_total). Only documents that can still make the top limit are
+        matched and scored (see _score_top); the full match set is one more
+        pass of doc id list joins. memo caches _resolve() per word and shared
+        caches term scores (see _contributions); both may be shared by
+        several queries.
+        """
+        tree = self._parse_query(query, require_all)
+        if tree is None:
+            return [], ([] if exact_total else None)
+        memo = {} if memo is None else memo
+        for word in self._query_words(tree, positive=False):
+            if word not in memo:
+                memo[word] = self._resolve(word)
+        terms = QueryTerms({word: memo[word] for word in self._query_words(tree, positive=False)
+                            if memo[word] is not None})
+
+        matches = None
+        if exact_total:
+            matches = self._evaluate(tree, terms)
+            if len(matches) and self.deleted:
+                matches = [doc_id for doc_id in matches if doc_id not in self.deleted]
+            if len(matches) and category:
+                matches = _join(self.facets['category'].ids(category), matches)[0]
+            if not len(matches):
+                return [], []
+
+        order = [word for word in self._query_words(tree) if word in terms]
+        scores = self._score_top(tree, order, terms, limit, boosts or self.FIELD_BOOSTS,
+                                 category, matches, shared)
+        return heapq.nlargest(limit, scores.items(), key=self._rank_key), matches
+
+    def _evaluate(self, node: tuple, terms: QueryTerms, doc_ids=None):
+        """Sorted doc ids matching a query tree node (deleted ones included),
+        out of the sorted doc_ids if given, else out of the whole index"""
+        kind = node[0]
+        if kind == 'word':
+            if node[1] not in terms:
+                return []
+            return terms.ids(node[1]) if doc_ids is None else terms.join(node[1], doc_ids)[0]
+
+        if kind == 'any':
+            return self._union([self._evaluate(child, terms, doc_ids) for child in node[1]])
+
+        if kind == 'all':
+            required, optional, excluded = node[1:]
+            if required:
+                # Most selective first; the others only filter what is left
+                matches = doc_ids
+                for child in sorted(required, key=lambda child: self._estimate(child, terms)):
+                    matches = self._evaluate(child, terms, matches)
+                    if not len(matches):
+                        return []
+            else:
+                matches = self._union([self._evaluate(child, terms, doc_ids) for child in optional])
+            if excluded and len(matches):
+                dropped = set(self._union([self._evaluate(child, terms, matches) for child in excluded]))
+                matches = [doc_id for doc_id in matches if doc_id not in dropped]
+            return matches
+
+        # Phrase / NEAR: documents holding every word, then their positions are checked
+        words = self._query_words(node)
+        if any(word not in terms for word in words):
             return []
+        words.sort(key=lambda word: len(terms.ids(word)))
+        if doc_ids is None:
+            doc_ids = terms.ids(words[0])
+        for word in words:
+            doc_ids = terms.join(word, doc_ids)[0]
+            if not doc_ids:
+                return []
+        hits = {word: terms.join(word, doc_ids)[1] for word in words}
+
+        def positions(word: str, j: int) -> List[int]:
+            return terms.positions(word, hits[word][j])
+
+        if kind == 'phrase':
+            return [doc_id for j, doc_id in enumerate(doc_ids)
+                    if self._phrase_match([(positions(word, j), offset) for word, offset in node[1]])]
+        _, a, b, k = node
+        return [doc_id for j, doc_id in enumerate(doc_ids)
+                if self._min_distance(positions(a, j), positions(b, j)) <= k]
+
+    def _estimate(self, node: tuple, terms: QueryTerms) -> int:
+        """Most documents a query tree node can match"""
+        kind = node[0]
+        if kind == 'word':
+            return len(terms.ids(node[1]))
+        if kind == 'any':
+            return sum(self._estimate(child, terms) for child in node[1])
+        if kind == 'all':
+            required, optional = node[1:3]
+            if required:
+                return min(self._estimate(child, terms) for child in required)
+            return sum(self._estimate(child, terms) for child in optional)
+        return min(len(terms.ids(word)) for word in self._query_words(node))
+
+    @classmethod
+    def _required_words(cls, node: tuple) -> set:
+        """Words every document matching a query tree node contains"""
+        kind = node[0]
+        if kind == 'word':
+            return {node[1]}
+        if kind in ('phrase', 'near'):
+            return set(cls._query_words(node))
+        if kind == 'any':
+            return set.intersection(*(cls._required_words(child) for child in node[1]))
+        required, optional = node[1:3]
+        if required:
+            return set().union(*(cls._required_words(child) for child in required))
+        if optional:
+            return set.intersection(*(cls._required_words(child) for child in optional))
+        return set()
+
+    @staticmethod
+    def _union(id_lists: List):
+        id_lists = [ids for ids in id_lists if len(ids)]
+        if len(id_lists) == 1:
+            return id_lists[0]
+        return sorted(set().union(*id_lists))
 
-        # Get actual documents
-        results = [self.documents[doc_id] for doc_id in matching_docs]
+    def _term_bound(self, word: str, terms: QueryTerms, boosts: Dict[str, float]) -> Optional[float]:
+        """Highest BM25F score the word adds to any document, or None if its
+        scores can be negative (negative idf or boosts). Found by scoring its
+        whole posting list once per index generation and boosts."""
+        n_docs = len(self.doc_lengths) - len(self.deleted)
+        df = len(terms.postings(word))
+        restricted = terms.fields(word)[0]
+        fields = [restricted] if restricted else self.FIELD_BOOSTS
+        if n_docs < df or any(boosts.get(field, 1.0) < 0 for field in fields):
+            return None
+        key = (word, tuple(sorted(boosts.items())))
+        bound = self._term_maxima.get(key, self.generation)
+        if bound is None:
+            ids = terms.ids(word)
+            bound = max(self._term_scores(terms, word, ids, range(len(ids)), boosts), default=0.0)
+            self._term_maxima.put(key, bound, self.generation)
+        return bound
 
-        # Filter by category if specified
+    def _score_top(self, tree: tuple, order: List[str], terms: QueryTerms, limit: int,
+                   boosts: Dict[str, float], category: Optional[str] = None, matches=None,
+                   shared: Optional[Dict] = None) -> Dict[int, float]:
+        """Scores of the best document of each of the top limit parents (MaxScore).
+
+        Candidates come off the posting lists in blocks of up to SCORE_BLOCK
+        postings per list. The upper bounds (_term_bound) of the words a
+        document holds, plus PROXIMITY_WEIGHT per adjacent pair of them, cap
+        what it can score. With the words sorted by bound, the longest prefix
+        whose cap is below the limit-th best parent's score so far is
+        non-essential: a document holding only those words cannot make the
+        top. So blocks are read from the essential words' lists only (or from
+        the rarest word every match must contain, while it is essential),
+        their cursors galloping past the skipped postings, and the lists of
+        the others are only probed for the documents whose score so far plus
+        the bounds left can still reach the top. Blocks are checked against
+        the query tree (or matches, when given), category and deletions
+        before scoring. Scores returned are exact.
+        """
+        if limit < 1 or not order:
+            return {}
+        required = self._required_words(tree)
+        if any(word not in terms for word in required):
+            return {}
+        code = None
         if category:
-            results = [r for r in results if r.get('category') == category]
+            code = self.facets['category'].codes.get(category)
+            if code is None:
+                return {}
+        doc_codes = self.facets['category'].doc_codes
+        wanted = set(matches) if matches is not None else None
+        deleted, parents = self.deleted, self.parents
+
+        # Bit per query word; a doc earns a proximity bonus of at most weight
+        # for each pair of adjacent query words it holds both of
+        bits = {word: 1 << i for i, word in enumerate(order)}
+        weight = self.PROXIMITY_WEIGHT if len(order) > 1 else 0.0
+
+        def count_pairs(mask: int) -> int:
+            return bin(mask & mask >> 1).count('1')
+
+        # Tabulated for all masks of a short query
+        pairs = list(map(count_pairs, range(1 << len(order)))).__getitem__ if len(order) <= 10 else count_pairs
+        bounds = [self._term_bound(word, terms, boosts) for word in order]
+        prune = None not in bounds and weight >= 0
+        if prune:
+            bounds, words = map(list, zip(*sorted(zip(bounds, order))))
+            sums = list(accumulate(bounds, initial=0.0))
+            below = list(accumulate((bits[word] for word in words), or_, initial=0))  # Bits of words[:i]
+            ceilings = [total + weight * pairs(mask) for total, mask in zip(sums, below)]  # Most words[:i] can score
+        else:
+            words = list(order)
+        must = min(required, key=lambda word: len(terms.ids(word))) if required else None
+
+        best: Dict[int, tuple] = {}  # Parent -> (score, -doc id) of its best document so far
+        floor = None  # Parent holding the lowest entry of best, once it is full
+        cutoff = -math.inf
+
+        def offer(entries: List[tuple]):
+            """Keep (score, doc id) entries that make the top limit parents"""
+            nonlocal floor, cutoff
+            for score, doc_id in entries:
+                if score < cutoff:
+                    continue
+                entry, parent = (score, -doc_id), parents[doc_id]
+                current = best.get(parent)
+                if current is not None:
+                    if entry <= current:
+                        continue
+                elif len(best) >= limit:
+                    if entry <= best[floor]:
+                        continue
+                    del best[floor]
+                best[parent] = entry
+                if len(best) >= limit:
+                    floor = min(best, key=best.get)
+                    threshold = best[floor][0]
+                    cutoff = threshold - 1e-9 * abs(threshold)
+
+        first = 0  # words[first:] are essential
+        step = self.SCORE_BLOCK if len(words) > 1 else len(terms.ids(words[0]))  # Nothing to skip for one word
+        frontier, cursors = 0, dict.fromkeys(words, 0)
+        # Plain words joined by OR, with at most one required, need no query
+        # tree evaluation: a doc matches when it holds the required word
+        # (needed). Anything else is matched before it is scored.
+        flat = len(required) <= 1 and (
+            tree[0] == 'word' or tree[0] == 'any' and all(child[0] == 'word' for child in tree[1])
+            or tree[0] == 'all' and not tree[3] and all(child[0] == 'word' for child in tree[1] + tree[2]))
+        needed = sum(bits[word] for word in required) if flat else 0
+        while True:
+            if prune:
+                while first < len(words) and ceilings[first + 1] < cutoff:
+                    first += 1
+                if first == len(words):
+                    break
+            essential = words[first:]
+            drivers = [must] if must in essential else essential
+
+            # Next block: postings of the drivers up to a common doc id
+            upper = None
+            for word in drivers:
+                ids = terms.ids(word)
+                cursors[word] = pos = _gallop(ids, frontier, cursors[word])
+                if pos + step < len(ids) and (upper is None or ids[pos + step] < upper):
+                    upper = ids[pos + step]
+            parts = []
+            for word in drivers:
+                ids, pos = terms.ids(word), cursors[word]
+                end = len(ids) if upper is None else _gallop(ids, upper, pos)
+                if end > pos:
+                    parts.append((word, pos, end))
+                cursors[word] = end
+            if not parts:
+                break
+            frontier = math.inf if upper is None else upper
+            if len(parts) == 1:
+                word, pos, end = parts[0]
+                block = list(terms.ids(word)[pos:end])
+                span = (word, range(pos, end))  # The block is these postings of word, unless filtered
+            else:
+                block = sorted(set().union(*(terms.ids(word)[pos:end] for word, pos, end in parts)))
+                span = None
+
+            if wanted is not None:
+                block = [doc_id for doc_id in block if doc_id in wanted]
+            else:
+                if deleted:
+                    block = [doc_id for doc_id in block if doc_id not in deleted]
+                if code is not None:
+                    block = [doc_id for doc_id in block if doc_codes[doc_id] == code]
+                if block and not flat:
+                    block = self._evaluate(tree, terms, block)
+            if not block:
+                continue
+
+            # Essential words for the whole block, then the others, largest
+            # bound first, for the documents that can still make the top
+            scores = dict.fromkeys(block, 0.0)
+            held = dict.fromkeys(block, 0)  # Bits of the query words each doc holds
+            if span and len(span[1]) != len(block):
+                span = None
+            for word in essential:
+                hits = span[1] if span and span[0] == word else None
+                found, found_scores = self._contributions(word, block, terms, boosts, shared, hits)
+                bit = bits[word]
+                if len(found) == len(block):
+                    scores = dict(zip(block, map(add, scores.values(), found_scores)))
+                    held = dict(zip(block, [mask | bit for mask in held.values()]))
+                    continue
+                for doc_id, score in zip(found, found_scores):
+                    scores[doc_id] += score
+                    held[doc_id] |= bit
+            live = block
+            for i in range(first - 1, -1, -1):
+                if weight:
+                    rest, extra = below[i + 1], sums[i + 1]
+                    live = [doc_id for doc_id in live
+                            if scores[doc_id] + extra + weight * pairs(held[doc_id] | rest) >= cutoff]
+                else:
+                    live = [doc_id for doc_id in live if scores[doc_id] + ceilings[i + 1] >= cutoff]
+                if not live:
+                    break
+                found, found_scores = self._contributions(words[i], live, terms, boosts, shared)
+                bit = bits[words[i]]
+                for doc_id, score in zip(found, found_scores):
+                    scores[doc_id] += score
+                    held[doc_id] |= bit
+            if flat and wanted is None and needed and must not in drivers:
+                live = [doc_id for doc_id in live if held[doc_id] & needed]
+            if not (weight and live):
+                offer([(scores[doc_id], doc_id) for doc_id in live if scores[doc_id] >= cutoff])
+                continue
+            # Docs that could beat the cutoff with their proximity bonus get
+            # it, most promising first
+            ceiling = {doc_id: scores[doc_id] + weight * pairs(held[doc_id]) for doc_id in live}
+            if prune:
+                live = sorted(live, key=ceiling.get, reverse=True)
+            for start in range(0, len(live), limit):
+                batch = live[start:start + limit]
+                if prune:
+                    batch = [doc_id for doc_id in batch if ceiling[doc_id] >= cutoff]
+                    if not batch:
+                        break
+                near = sorted(doc_id for doc_id in batch if pairs(held[doc_id]))
+                for doc_id, bonus in zip(near, self._proximity(near, order, terms)):
+                    scores[doc_id] += bonus
+                offer([(scores[doc_id], doc_id) for doc_id in batch])
+        return {-neg_id: score for score, neg_id in best.values()}
+
+    def _contributions(self, word: str, doc_ids: List[int], terms: QueryTerms,
+                       boosts: Dict[str, float], shared: Optional[Dict] = None, hits=None) -> tuple:
+        """(docs of sorted doc_ids holding the word, its BM25F score in each).
+
+        hits, if known, index every doc of doc_ids in the word's postings.
+        shared, when given, keeps the scores per word across the queries of
+        a batch (same boosts), so each word is scored once per document over
+        the union of the candidates of every query that needs it.
+        """
+        found, hits = terms.join(word, doc_ids) if hits is None else (doc_ids, hits)
+        if shared is None:
+            return found, self._term_scores(terms, word, found, hits, boosts)
+        known = shared.setdefault(word, {})
+        todo = [j for j, doc_id in enumerate(found) if doc_id not in known]
+        if todo:
+            new_ids = [found[j] for j in todo]
+            known.update(zip(new_ids, self._term_scores(terms, word, new_ids, [hits[j] for j in todo], boosts)))
+        return found, list(map(known.__getitem__, found))
+
+    def _proximity(self, doc_ids: List[int], order: List[str], terms: QueryTerms) -> List[float]:
+        """Bonus of each doc for how close adjacent query words sit together in it"""
+        positions = []  # Per word: {doc id: positions}
+        for word in order:
+            found, hits = terms.join(word, doc_ids)
+            positions.append({doc_id: terms.positions(word, hit) for doc_id, hit in zip(found, hits)})
+        bonuses = []
+        for doc_id in doc_ids:
+            bonus = 0.0
+            for a, b in zip(positions, positions[1:]):
+                gap = self._min_distance(a.get(doc_id, []), b.get(doc_id, []))
+                bonus += self.PROXIMITY_WEIGHT / max(gap, 1)
+            bonuses.append(bonus)
+        return bonuses
+
+    @staticmethod
+    def _phrase_match(runs: List[tuple]) -> bool:
+        """True if every (positions, offset) run lines up from a common start"""
+        (first, first_offset), rest = runs[0], [(set(p), off) for p, off in runs[1:]]
+        for position in first:
+            start = position - first_offset
+            if all(start + off in others for others, off in rest):
+                return True
+        return False
+
+    def _vector_fingerprint(self, n_docs: int) -> int:
+        """Checksum tying a vectors file to the documents it was built from"""
+        return zlib.crc32(self.doc_lengths[:n_docs].tobytes() + self.parents[:n_docs].tobytes())
+
+    def build_vectors(self, dims: Optional[int] = None, path: Optional[str] = None) -> bool:
+        """Compute and save dense document vectors for semantic search (needs numpy)"""
+        if not HAS_NUMPY:
+            print("❌ numpy not installed. Install: pip3 install numpy")
+            return False
+
+        path = path or self.vectors_path
+        with self._lock:
+            n_docs = len(self.documents)
+            print(f"🧮 Computing {dims or self.VECTOR_DIMS}-d vectors for {n_docs} documents...")
+            semantic = SemanticIndex.build(self.index, n_docs, self.deleted, dims=dims or self.VECTOR_DIMS,
+                                           brute_force_limit=self.VECTOR_BRUTE_FORCE_LIMIT)
+            header = {
+                'byteorder': sys.byteorder,
+                'analyzer': self.analyzer.version,
+                'documents': n_docs,
+                'fingerprint': self._vector_fingerprint(n_docs),
+                'created_at': datetime.now().isoformat()
+            }
+            try:
+                semantic.save(path, header)
+            except OSError as e:
+                print(f"⚠️  Could not save vectors {path}: {e}")
+                return False
+
+        print(f"💾 Saved vectors to {path}")
+        return self.load_vectors(path)
+
+    def load_vectors(self, path: Optional[str] = None, quiet: bool = False) -> bool:
+        """Map saved document vectors, folding in documents indexed since they were built"""
+        path = path or self.vectors_path
+        if not HAS_NUMPY or not os.path.exists(path):
+            return False
+
+        try:
+            snapshot = SnapshotFile(path)
+        except (OSError, ValueError) as e:
+            if not quiet:
+                print(f"⚠️  Ignoring vectors: {e}")
+            return False
+
+        header = snapshot.header
+        n_docs = header.get('documents', 0)
+        if (header.get('kind') != 'vectors' or header.get('byteorder') != sys.byteorder or
+                header.get('analyzer') != self.analyzer.version or n_docs > len(self.documents) or
+                header.get('fingerprint') != self._vector_fingerprint(n_docs)):
+            snapshot.close()
+            if not quiet:
+                print("🔄 Vectors are out of date with the index, run --build-vectors to refresh them")
+            return False
+
+        with self._lock:
+            semantic = SemanticIndex.load(snapshot)
+            for doc_id in range(n_docs, len(self.documents)):
+                semantic.add(doc_id, self._term_counts(self.documents[doc_id]))
+            self.semantic = semantic
+            self.generation += 1
+        return True
+
+    def _term_counts(self, doc: Dict) -> Dict[str, int]:
+        text = ' '.join(str(doc.get(field, '')) for field in ('content', 'title', 'category'))
+        return Counter(term for term in self.analyzer.terms(text) if term is not None)
+
+    def _semantic_stats(self) -> Optional[Dict]:
+        if self.semantic is None:
+            return None
+        return {
+            'documents': len(self.semantic.vectors) + len(self.semantic.extra_ids),
+            'dims': self.semantic.dims,
+            'terms': len(self.semantic.terms),
+            'clusters': 0 if self.semantic.centroids is None else len(self.semantic.centroids)
+        }
+
+    def semantic_search(self, query: str, category: Optional[str] = None, limit: int = 10) -> List[Dict]:
+        """Search by meaning: cosine similarity of dense vectors (see build_vectors)"""
+        key = self._cache_key('semantic', query, category, limit)
+        results = self.cache.get(key, self.generation)
+        if results is None:
+            with self._lock:
+                generation = self.generation
+                scores = self._semantic_match(query, category, limit)
+                top = heapq.nlargest(limit, scores.items(), key=self._rank_key)
+                results = [self.documents[doc_id] for doc_id, _ in top]
+            self.cache.put(key, results, generation)
+        return list(results)
+
+    def _semantic_match(self, query: str, category: Optional[str], limit: int) -> Dict[int, float]:
+        """Cosine scores of the nearest documents, one per parent"""
+        if self.semantic is None:
+            raise ValueError("Semantic search needs document vectors: run with --build-vectors (requires numpy)")
+
+        # Misspelled, prefixed and field-restricted words count as their expansions
+        counts = Counter()
+        for word in self._query_words(self._parse_query(query)):
+            for term in self.expand_term(word):
+                counts[term.rpartition(':')[2]] += 1
+
+        allowed = self.facets['category'].ids(category) if category else None
+        # Over-fetch so collapsing chunks into parents still fills the limit
+        hits = self.semantic.search(self.semantic.embed(counts), limit * 3, self.deleted, allowed)[0]
+        return self._collapse(dict(hits))
+
+    def hybrid_search(self, query: str, category: Optional[str] = None, limit: int = 10) -> Dict:
+        """Keyword and semantic retrieval side by side, merged by reciprocal rank fusion.
+
+        Both retrievers run concurrently on a small thread pool while the
+        index lock is held. Each document scores sum(1 / (RRF_K + rank)) over
+        the rankings it appears in. Without vectors, only the keyword ranking
+        is used. The response includes per-stage latencies in milliseconds.
+        """
+        key = self._cache_key('hybrid', query, category, limit)
+        cached = self.cache.get(key, self.generation)
+        if cached is not None:
+            return dict(cached, results=list(cached['results']), cached=True)
+
+        started = time.perf_counter()
+        depth = max(limit, self.HYBRID_DEPTH)
+        with self._lock:
+            generation = self.generation
+            retrievers = [('keyword', self._keyword_ranking)]
+            if self.semantic is not None:
+                retrievers.append(('semantic', self._semantic_ranking))
+            pool = self._retriever_pool()
+            futures = [(name, pool.submit(self._timed, retrieve, query, category, depth))
+                       for name, retrieve in retrievers]
+            rankings, timings = {}, {}
+            for name, future in futures:
+                rankings[name], timings[name] = future.result()
+
+            fusion_started = time.perf_counter()
+            fused: Dict[int, float] = {}
+            representative: Dict[int, int] = {}  # Parent -> first chunk ranked for it
+            for ranking in rankings.values():
+                for rank, doc_id in enumerate(ranking, 1):
+                    parent = self.parents[doc_id]
+                    representative.setdefault(parent, doc_id)
+                    fused[parent] = fused.get(parent, 0.0) + 1.0 / (self.RRF_K + rank)
+            top = heapq.nlargest(limit, fused.items(), key=self._rank_key)
+            results = [self.documents[representative[parent]] for parent, _ in top]
+            timings['fusion'] = time.perf_counter() - fusion_started
+
+        timings['total'] = time.perf_counter() - started
+        response = {
+            'results': results,
+            'retrievers': list(rankings),
+            'timings_ms': {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+        }
+        self.cache.put(key, response, generation)
+        return dict(response, results=list(results))
 
-        # Sort by relevance (number of keyword matches)
-        def relevance_score(doc):
-            text = (doc.get('content', '') + ' ' + doc.get('title', '')).lower()
-            return sum(1 for word in query_words if word in text)
+    def _keyword_ranking(self, query: str, category: Optional[str], depth: int) -> List[int]:
+        return [doc_id for doc_id, _ in self._search(query, category, depth)[0]]
 
-        results.sort(key=relevance_score, reverse=True)
+    def _semantic_ranking(self, query: str, category: Optional[str], depth: int) -> List[int]:
+        scores = self._semantic_match(query, category, depth)
+        return [doc_id for doc_id, _ in heapq.nlargest(depth, scores.items(), key=self._rank_key)]
 
-        return results[:limit]
+    @staticmethod
+    def _timed(fn, *args) -> tuple:
+        """(fn(*args), seconds taken)"""
+        started = time.perf_counter()
+        return fn(*args), time.perf_counter() - started
+
+    def _retriever_pool(self) -> ThreadPoolExecutor:
+        """Per-process pool for hybrid retrieval (threads do not survive a fork)"""
+        if self._retrievers is None or self._retrievers_pid != os.getpid():
+            self._retrievers = ThreadPoolExecutor(max_workers=2, thread_name_prefix='kb-retriever')
+            self._retrievers_pid = os.getpid()
+        return self._retrievers
+
+    def describe(self, doc_id: int) -> Dict:
+        """Title, category and source of a document, without reading its body"""
+        meta = {'title': self.documents.title(doc_id)}
+        for field in ('category', 'source'):
+            facet = self.facets[field]
+            meta[field] = facet.values[facet.doc_codes[doc_id]]
+        return {field: value for field, value in meta.items() if value}
 
     def get_by_category(self, category: str, limit: int = 100) -> List[Dict]:
         """Get all documents in a category"""
-        results = [doc for doc in self.documents if doc.get('category') == category]
-        return results[:limit]
+        with self._lock:
+            results = []
+            for doc_id in self.facets['category'].ids(category):
+                if doc_id not in self.deleted and self.parents[doc_id] == doc_id:
+                    results.append(self._whole_document(doc_id))
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def _whole_document(self, parent: int) -> Dict:
+        """A document as it was loaded, with the content of its chunks joined again"""
+        end = parent + 1
+        while end < len(self.parents) and self.parents[end] == parent:
+            end += 1
+        return join_chunks([self.documents[doc_id] for doc_id in range(parent, end)])
 
     def get_categories(self) -> List[str]:
         """Get all available categories"""
-        categories = set()
-        for doc in self.documents:
-            if 'category' in doc:
-                categories.add(doc['category'])
-        return sorted(list(categories))
+        with self._lock:
+            facet = self.facets['category']
+            live = facet.totals(self.deleted, self.parents)
+            return sorted(value for value in facet.values if value is not None and live.get(value))
 
     def get_stats(self) -> Dict:
         """Get knowledge base statistics"""
-        categories = {}
-        sources = {}
+        with self._lock:
+            return {
+                'total_documents': self._document_count(),
+                'total_keywords': len(self.index),
+                'index_memory': self._index_memory(),
+                'document_memory': self.documents.memory_usage(),
+                'from_snapshot': self._snapshot is not None,
+                'last_reload': self.last_reload,
+                'cache': self.cache.stats(),
+                'semantic': self._semantic_stats(),
+                'analyzer': self.analyzer.version,
+                'duplicates_skipped': self._duplicates_skipped(),
+                'categories': self.facets['category'].totals(self.deleted, self.parents),
+                'sources': self.facets['source'].totals(self.deleted, self.parents),
+                'last_updated': datetime.now().isoformat()
+            }
 
-        for doc in self.documents:
-            cat = doc.get('category', 'unknown')
-            src = doc.get('source', 'unknown')
+    def _duplicates_skipped(self) -> int:
+        return sum(len(state.get('shadows', ())) for state in self.files.values())
 
-            categories[cat] = categories.get(cat, 0) + 1
-            sources[src] = sources.get(src, 0) + 1
+    def compact_datasets(self, dry_run: bool = False) -> Dict:
+        """Rewrite JSONL datasets without their near-duplicate lines.
 
-        return {
-            'total_documents': len(self.documents),
-            'total_keywords': len(self.index),
-            'categories': categories,
-            'sources': sources,
-            'last_updated': datetime.now().isoformat()
-        }
+        Files are read in load order and the first occurrence of each
+        document is kept, the same one ingest treats as canonical. Run it
+        while no scraper is appending to the files. The shingle hashes of
+        every kept document are held in memory (about 4 bytes per token) to
+        confirm candidates exactly.
+        """
+        lsh = MinHashLSH(self.dedup.threshold if self.dedup else self.DEDUP_THRESHOLD)
+        kept_shingles: Dict[int, array] = {}
+        n_docs = removed = saved = 0
+        for filename in self._dataset_files():
+            if not self._is_jsonl(filename):
+                continue
+            filepath = os.path.join(self.datasets_dir, filename)
+            temp_path = filepath + '.compact'
+            framed = filename.endswith(framed_jsonl.SUFFIX)
+            dropped = 0
+            with open(filepath, 'rb') as src, \
+                    (framed_jsonl.FramedWriter(temp_path) if framed else open(temp_path, 'wb')) as dst:
+                write = dst.write_line if framed else dst.write
+                for line, _ in framed_jsonl.iter_lines(src):
+                    try:
+                        doc = json.loads(line) if line.strip() else None
+                    except json.JSONDecodeError:
+                        doc = None
+                    if isinstance(doc, dict):
+                        tokens = self._dedup_tokens(doc)
+                        sig = lsh.signature(tokens)
+                        if sig is not None:
+                            shingles = lsh.shingles(tokens)
+                            confirm = lambda doc_id: lsh.jaccard(shingles, set(kept_shingles[doc_id])) >= lsh.threshold
+                            if lsh.find(sig, confirm=confirm) is not None:
+                                dropped += 1
+                                saved += len(line)
+                                continue
+                            kept_shingles[n_docs] = array('I', shingles)
+                        lsh.add(n_docs, sig)
+                        n_docs += 1
+                    write(line)
+
+            if dropped and not dry_run:
+                os.replace(temp_path, filepath)
+            else:
+                os.remove(temp_path)
+            if dropped:
+                print(f"🧬 {filename}: {dropped} near-duplicate lines {'found' if dry_run else 'removed'}")
+            removed += dropped
+
+        action = 'Would remove' if dry_run else 'Removed'
+        print(f"✅ {action} {removed} near-duplicates ({saved / 1024 / 1024:.1f} MB)")
+        return {'removed': removed, 'bytes': saved, 'dry_run': dry_run}
+
+    def _index_memory(self) -> Dict:
+        """Approximate memory held by the keyword index"""
+        if isinstance(self.index, SnapshotIndex):
+            usage = self.index.memory_usage()
+        else:
+            heap = sys.getsizeof(self.index)
+            for word, postings in self.index.items():
+                heap += sys.getsizeof(word) + postings.nbytes()
+            usage = {'heap_bytes': heap, 'mapped_bytes': 0}
+
+        usage['doc_lengths_bytes'] = sys.getsizeof(self.doc_lengths)
+        return usage
 
     def export_for_fine_tuning(self, output_file: str = 'fine_tuning_dataset.jsonl',
-                                 category: Optional[str] = None):
-        """Export in format suitable for AI fine-tuning"""
-        docs_to_export = self.documents
+                               category: Optional[str] = None, max_chars: int = 2000,
+                               validation: float = 0.05, shard_bytes: int = 64 << 20,
+                               workers: Optional[int] = None) -> Dict:
+        """Export for AI fine-tuning as gzipped JSONL shards, streaming.
 
-        if category:
-            docs_to_export = [d for d in docs_to_export if d.get('category') == category]
+        Examples are generated one document at a time. Long content becomes
+        several examples of at most max_chars instead of being cut off. Each
+        document goes to the train or validation split, with all of its
+        examples, by a hash of its key, so no document is split across both
+        and reruns put it in the same split again. A shard
+        holds up to shard_bytes of JSONL before compression. Full shards are
+        compressed and written on a thread pool while the next ones fill,
+        with at most workers of them waiting, so memory use stays bounded.
+        Returns the manifest, which is also saved as <name>_stats.json.
+        """
+        stem = output_file[:-len('.jsonl')] if output_file.endswith('.jsonl') else output_file
+        base = os.path.join(self.datasets_dir, stem)
+        directory, prefix = os.path.split(base)
+        for filename in os.listdir(directory or '.'):
+            if filename.startswith(prefix + '-') and filename.endswith('.jsonl.gz'):
+                os.remove(os.path.join(directory, filename))  # Shards of an earlier export
 
-        filepath = os.path.join(self.datasets_dir, output_file)
+        workers = workers or min(4, os.cpu_count() or 1)
+        splits = ('train', 'validation')
+        buffers = {split: [] for split in splits}
+        sizes = dict.fromkeys(splits, 0)
+        shards = []
+        pending = []
 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            for doc in docs_to_export:
-                # Format for fine-tuning: {"prompt": "...", "completion": "..."}
-                prompt = f"Question about {doc.get('category', 'general knowledge')}: {doc.get('title', 'Unknown')}"
-                completion = doc.get('content', '')[:2000]  # Limit length
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='kb-export') as pool:
+            def flush(split: str):
+                index = sum(1 for shard in shards if shard['split'] == split)
+                path = f"{base}-{split}-{index:05d}.jsonl.gz"
+                shards.append({'file': os.path.basename(path), 'split': split,
+                               'examples': len(buffers[split]), 'bytes': sizes[split]})
+                pending.append(pool.submit(self._write_shard, path, b''.join(buffers[split])))
+                buffers[split], sizes[split] = [], 0
+                while len(pending) > workers:
+                    pending.pop(0).result()
 
-                training_example = {
-                    'prompt': prompt,
-                    'completion': completion
-                }
+            for key, example in self._fine_tuning_examples(category, max_chars):
+                digest = zlib.crc32(key.encode('utf-8'))
+                split = 'validation' if digest % 10000 < validation * 10000 else 'train'
+                line = (json.dumps(example, ensure_ascii=False) + '\n').encode('utf-8')
+                if buffers[split] and sizes[split] + len(line) > shard_bytes:
+                    flush(split)
+                buffers[split].append(line)
+                sizes[split] += len(line)
+
+            for split in splits:
+                if buffers[split]:
+                    flush(split)
+            for future in pending:
+                future.result()
+
+        manifest = {
+            'category': category,
+            'examples': {split: sum(s['examples'] for s in shards if s['split'] == split) for split in splits},
+            'validation_fraction': validation,
+            'max_chars': max_chars,
+            'shards': shards,
+            'created_at': datetime.now().isoformat()
+        }
+        with open(f"{base}_stats.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        counts = manifest['examples']
+        print(f"✅ Exported {counts['train']} train / {counts['validation']} validation examples "
+              f"in {len(shards)} shards to {base}-*.jsonl.gz")
+        return manifest
 
-                f.write(json.dumps(training_example) + '\n')
+    def _fine_tuning_examples(self, category: Optional[str], max_chars: int):
+        """(document key, prompt/completion pair) tuples, one live document at a time.
 
-        print(f"✅ Exported {len(docs_to_export)} documents to {filepath}")
+        Indexed chunks of a long document overlap, so each chunk only
+        contributes the text after where the previous one ended. The key is
+        a knowledge section's 'key', else the title and the text of the
+        document's first chunk, the same for every example of the document.
+        """
+        doc_ids = self.facets['category'].ids(category) if category else range(len(self.documents))
+        parent, covered, part = None, 0, 0
+        for doc_id in doc_ids:
+            if doc_id in self.deleted:
+                continue
+            doc = self.documents[doc_id]
+            content = doc.get('content', '')
+            if not isinstance(content, str):
+                continue
+            if self.parents[doc_id] != parent:
+                parent, covered, part = self.parents[doc_id], 0, 0
+                key = doc.get('key') or f"{doc.get('title', '')}\n{content}"
+            offset = doc.get('chunk_offset', 0)
+            text = content[max(covered - offset, 0):]
+            covered = max(covered, offset + len(content))
+
+            # Format for fine-tuning: {"prompt": "...", "completion": "..."}
+            prompt = f"Question about {doc.get('category', 'general knowledge')}: {doc.get('title', 'Unknown')}"
+            in_parts = 'chunk' in doc or len(text) > max_chars
+            for piece in iter_chunks({'content': text}, max_chars, overlap=0):
+                if not piece['content'].strip():
+                    continue
+                part += 1
+                yield key, {
+                    'prompt': f"{prompt} (part {part})" if in_parts else prompt,
+                    'completion': piece['content'].strip()
+                }
+
+    @staticmethod
+    def _write_shard(path: str, data: bytes) -> int:
+        """Compress one shard to disk (zlib releases the GIL, so shards compress in parallel)"""
+        compressed = gzip.compress(data)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(temp_path, path)
+        return len(compressed)
 
     def query_for_bot(self, query: str, context_limit: int = 2000) -> str:
         """Query knowledge base and return formatted response for bots"""
-        results = self.search(query, limit=3)
+        key = self._cache_key('query', query, context_limit)
+        generation = self.generation
+        response = self.cache.get(key, generation)
+        if response is None:
+            response = self._query_for_bot(query, context_limit)
+            self.cache.put(key, response, generation)
+        return response
+
+    def snippets(self, query: str, doc_ids: List[int]) -> Dict[int, str]:
+        """Best passage window of each document for a query, matches in **bold**.
+
+        Windows start at a passage holding a match and take whole passages up
+        to SNIPPET_CHARS; the one covering the most (idf-weighted) query terms
+        wins. Match positions come from the positional index and passage
+        bounds from the offsets stored at index time, so only the chosen
+        window's text is tokenized again, to place the highlights.
+        """
+        with self._lock:
+            n_docs = max(len(self.documents) - len(self.deleted), 1)
+            terms = []
+            for word in self._query_words(self._parse_query(query)):
+                found = self._resolve(word)
+                if found is not None:
+                    df = len(found[0])
+                    terms.append((found[0], math.log(1 + (n_docs - df + 0.5) / (df + 0.5))))
+
+            return {doc_id: self._best_window(doc_id, [(postings.positions_of(doc_id), idf)
+                                                       for postings, idf in terms])
+                    for doc_id in doc_ids}
+
+    def _best_window(self, doc_id: int, term_positions: List[tuple]) -> str:
+        content = self.documents[doc_id].get('content', '')
+        lo, hi = self.passage_offsets[doc_id], self.passage_offsets[doc_id + 1]
+        starts = self.passage_tokens[lo:hi]  # Last entry is the end marker
+        chars = self.passage_chars[lo:hi]
+        n_passages = len(starts) - 1
+        if n_passages <= 0:
+            return ''
+
+        # Only content positions count; title/category positions come after them
+        term_positions = [([p for p in positions if p < starts[-1]], idf)
+                          for positions, idf in term_positions]
+
+        def window_end(first: int) -> int:
+            last = first + 1
+            while last < n_passages and chars[last + 1] - chars[first] <= self.SNIPPET_CHARS:
+                last += 1
+            return last
+
+        candidates = {bisect_left(starts, p + 1) - 1 for positions, _ in term_positions for p in positions}
+        best, best_score = 0, -1.0
+        for first in sorted(candidates) or [0]:
+            last = window_end(first)
+            begin, end = starts[first], starts[last]
+            score = 0.0
+            for positions, idf in term_positions:
+                count = bisect_left(positions, end) - bisect_left(positions, begin)
+                if count:
+                    score += idf + 0.01 * count
+            if score > best_score:
+                best, best_score = first, score
+
+        last = window_end(best)
+        begin, start_char, end_char = starts[best], chars[best], chars[last]
+        text = content[start_char:end_char]
+        if end_char - start_char > 2 * self.SNIPPET_CHARS:
+            text = text[:2 * self.SNIPPET_CHARS]
+
+        # Bold the matched tokens inside the window
+        matched = {p - begin for positions, _ in term_positions for p in positions}
+        pieces, cursor = [], 0
+        for k, match in enumerate(re.finditer(r'\w+', text)):
+            if k in matched:
+                pieces.append(text[cursor:match.start()])
+                pieces.append(f"**{match.group()}**")
+                cursor = match.end()
+        pieces.append(text[cursor:])
+
+        snippet = ''.join(pieces).strip()
+        if start_char > 0:
+            snippet = '...' + snippet
+        if end_char < len(content):
+            snippet += '...'
+        return snippet
+
+    def _query_for_bot(self, query: str, context_limit: int) -> str:
+        with self._lock:
+            # Questions are free text: if not every word matches, rank by any of them
+            ranked = self._search(query, None, 3)[0] or self._search(query, None, 3, require_all=False)[0]
+            top = [doc_id for doc_id, _ in ranked]
+            snippets = self.snippets(query, top)
+            results = [(self.describe(doc_id), snippets[doc_id]) for doc_id in top]
 
         if not results:
             return f"No information found for: {query}"
 
         response = f"Found {len(results)} relevant documents:\n\n"
 
-        for i, doc in enumerate(results, 1):
+        for i, (doc, snippet) in enumerate(results, 1):
             title = doc.get('title', 'Unknown')
-            content = doc.get('content', '')[:500]  # First 500 chars
             source = doc.get('source', 'unknown')
 
             response += f"{i}. {title} (from {source})\n"
-            response += f"   {content}...\n\n"
+            response += f"   {snippet}\n\n"
 
             if len(response) > context_limit:
                 break
@@ -229,78 +3794,677 @@ class KnowledgeBase:
         return response
 
 
+def _build_segment(kb_args: Dict, unit: tuple) -> Dict:
+    """Process pool task for KnowledgeBase._build_parallel: index one work unit on its own"""
+    kind, name, start, end = unit
+    kb_args = dict(kb_args)
+    signatures = kb_args.pop('signatures')
+    kb = KnowledgeBase(cache_size=0, dedup_threshold=None, **kb_args)
+    if signatures:
+        kb.dedup = MinHashLSH(None)  # Only record signatures; duplicates are decided when merging
+
+    if kind == 'knowledge':
+        kb.load_knowledge_file(name)
+    elif kind == 'json':
+        kb._read_json(name)
+    else:
+        kb._tail_jsonl(name, start, end)
+
+    n_docs = len(kb.documents)
+    return {
+        'documents': [kb.documents.encoded(i) for i in range(n_docs)],
+        'titles': [kb.documents.title(i) for i in range(n_docs)],
+        'facets': {field: (facet.values, facet.doc_codes) for field, facet in kb.facets.items()},
+        'parents': kb.parents,
+        'index': _pack_postings(kb.index),
+        'doc_lengths': kb.doc_lengths,
+        'field_lengths': kb.field_lengths,
+        'passage_tokens': kb.passage_tokens,
+        'passage_chars': kb.passage_chars,
+        'passage_offsets': kb.passage_offsets,
+        'signatures': kb.dedup.padded(n_docs) if signatures else array('I'),
+        'files': kb.files
+    }
+
+
+class ApiMetrics:
+    """Request and index metrics for the API, rendered in Prometheus text format.
+
+    Counters live in an anonymous shared mmap created before the workers are
+    forked. Each worker process writes only its own slot (under a thread
+    lock), and a scrape of /metrics on any worker adds up every slot, so the
+    totals cover the whole server. Per-process values (documents, memory,
+    cache, last reload) are published by each worker and reported with a
+    worker label. Requests slower than slow_seconds are kept as samples in a
+    small ring per worker.
+    """
+
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+    STATUSES = (200, 400, 404, 405, 500, 503, 504)
+    GAUGES = ('in_flight', 'cache_hits', 'cache_misses', 'cache_entries', 'documents',
+              'index_heap_bytes', 'index_mapped_bytes', 'document_heap_bytes',
+              'document_mapped_bytes', 'reload_seconds', 'reload_timestamp', 'slow_count')
+    SLOW_SAMPLES = 16  # Per worker
+    SLOW_QUERY_BYTES = 200
+    OTHER_ROUTE = 'other'  # Unknown paths share one label
+
+    _SLOW = struct.Struct(f'<ddH{SLOW_QUERY_BYTES}s')
+
+    def __init__(self, routes: List[str], workers: int = 1, slow_seconds: float = 0.5):
+        self.routes = list(routes) + [self.OTHER_ROUTE]
+        self.route_ids = {route: i for i, route in enumerate(self.routes)}
+        self.workers = max(1, workers)
+        self.slow_seconds = slow_seconds
+        self.worker_id = 0
+
+        # Per route: a count per status, latency bucket counts (+Inf last),
+        # latency sum and slot wait sum. Then the gauges, then the slow ring.
+        self._route_size = len(self.STATUSES) + len(self.LATENCY_BUCKETS) + 3
+        self._gauge_base = len(self.routes) * self._route_size
+        self._slot_size = self._gauge_base + len(self.GAUGES)
+        self._ring_base = 8 * self._slot_size * self.workers
+        size = self._ring_base + self._SLOW.size * self.SLOW_SAMPLES * self.workers
+        self._mm = mmap.mmap(-1, size)
+        self._values = memoryview(self._mm)[:self._ring_base].cast('d')
+        self._lock = threading.Lock()
+        self._published = None  # (pid, generation) of the last index memory published
+
+    def _gauge(self, worker: int, name: str) -> int:
+        return worker * self._slot_size + self._gauge_base + self.GAUGES.index(name)
+
+    def start(self) -> float:
+        """Mark a request as in flight; returns its start time"""
+        with self._lock:
+            self._values[self._gauge(self.worker_id, 'in_flight')] += 1
+        return time.perf_counter()
+
+    def observe(self, path: str, status: int, started: float, waited: float = 0.0,
+                query: str = ''):
+        """Record a finished request started by start()"""
+        seconds = time.perf_counter() - started
+        route = self.route_ids.get(path.rstrip('/') or path, self.route_ids[self.OTHER_ROUTE])
+        status_id = self.STATUSES.index(status) if status in self.STATUSES else self.STATUSES.index(500)
+        bucket = bisect_left(self.LATENCY_BUCKETS, seconds)
+        values = self._values
+        base = self.worker_id * self._slot_size + route * self._route_size
+        latency = base + len(self.STATUSES)
+        with self._lock:
+            values[self._gauge(self.worker_id, 'in_flight')] -= 1
+            values[base + status_id] += 1
+            values[latency + bucket] += 1
+            values[latency + len(self.LATENCY_BUCKETS) + 1] += seconds
+            values[latency + len(self.LATENCY_BUCKETS) + 2] += waited
+            if seconds >= self.slow_seconds:
+                count = self._gauge(self.worker_id, 'slow_count')
+                slot = int(values[count]) % self.SLOW_SAMPLES
+                values[count] += 1
+                offset = self._ring_base + self._SLOW.size * (self.worker_id * self.SLOW_SAMPLES + slot)
+                self._SLOW.pack_into(self._mm, offset, seconds, time.time(), route,
+                                     query.encode('utf-8')[:self.SLOW_QUERY_BYTES])
+
+    def publish(self, kb: 'KnowledgeBase'):
+        """Copy this worker's cache, document, memory and reload figures into its slot.
+
+        Index memory and the document count are only measured again after the
+        index has changed.
+        """
+        values = self._values
+        gauge = lambda name: self._gauge(self.worker_id, name)
+        cache = kb.cache.stats()
+        values[gauge('cache_hits')] = cache['hits']
+        values[gauge('cache_misses')] = cache['misses']
+        values[gauge('cache_entries')] = cache['size']
+        if kb.last_reload:
+            values[gauge('reload_seconds')] = kb.last_reload['seconds']
+            values[gauge('reload_timestamp')] = kb.last_reload['finished']
+
+        key = (os.getpid(), kb.generation)
+        if key != self._published:
+            with kb._lock:
+                index = kb._index_memory()
+                documents = kb.documents.memory_usage()
+                values[gauge('documents')] = kb._document_count()
+            values[gauge('index_heap_bytes')] = index['heap_bytes'] + index['doc_lengths_bytes']
+            values[gauge('index_mapped_bytes')] = index['mapped_bytes']
+            values[gauge('document_heap_bytes')] = documents['heap_bytes']
+            values[gauge('document_mapped_bytes')] = documents['mapped_bytes']
+            self._published = key
+
+    def slow_queries(self) -> List[Dict]:
+        """Slow request samples of every worker, slowest first"""
+        samples = []
+        for worker in range(self.workers):
+            count = int(self._values[self._gauge(worker, 'slow_count')])
+            for slot in range(min(count, self.SLOW_SAMPLES)):
+                offset = self._ring_base + self._SLOW.size * (worker * self.SLOW_SAMPLES + slot)
+                seconds, finished, route, query = self._SLOW.unpack_from(self._mm, offset)
+                samples.append({'worker': worker, 'route': self.routes[route], 'seconds': seconds,
+                                'finished': finished,
+                                'query': query.rstrip(b'\0').decode('utf-8', 'ignore')})
+        samples.sort(key=lambda sample: -sample['seconds'])
+        return samples
+
+    @staticmethod
+    def _labels(**labels) -> str:
+        def escape(value) -> str:
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)"""
+        values = self._values
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def total(offset: int) -> float:
+            return sum(values[worker * self._slot_size + offset] for worker in range(self.workers))
+
+        def number(value: float) -> str:
+            return repr(int(value)) if float(value).is_integer() else repr(value)
+
+        metric('kb_requests_total', 'counter', 'API requests by route and HTTP status')
+        for route_id, route in enumerate(self.routes):
+            base = route_id * self._route_size
+            for status_id, status in enumerate(self.STATUSES):
+                count = total(base + status_id)
+                if count:
+                    lines.append(f"kb_requests_total{self._labels(route=route, status=status)} {number(count)}")
+
+        # Routes that have served requests: (route, bucket counts, latency sum, wait sum)
+        served = []
+        for route_id, route in enumerate(self.routes):
+            latency = route_id * self._route_size + len(self.STATUSES)
+            counts = [total(latency + i) for i in range(len(self.LATENCY_BUCKETS) + 1)]
+            if sum(counts):
+                served.append((route, counts, total(latency + len(counts)), total(latency + len(counts) + 1)))
+
+        metric('kb_request_duration_seconds', 'histogram',
+               'Request latency from arrival to response, including waiting for a slot')
+        for route, counts, seconds, waited in served:
+            cumulative = 0
+            for bound, count in zip(self.LATENCY_BUCKETS + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f"kb_request_duration_seconds_bucket{self._labels(route=route, le=bound)} "
+                             f"{number(cumulative)}")
+            lines.append(f"kb_request_duration_seconds_sum{self._labels(route=route)} {number(seconds)}")
+            lines.append(f"kb_request_duration_seconds_count{self._labels(route=route)} {number(cumulative)}")
+
+        metric('kb_request_wait_seconds_total', 'counter',
+               'Time requests spent waiting for a free query slot')
+        for route, counts, seconds, waited in served:
+            lines.append(f"kb_request_wait_seconds_total{self._labels(route=route)} {number(waited)}")
+
+        hits = total(self._gauge_base + self.GAUGES.index('cache_hits'))
+        misses = total(self._gauge_base + self.GAUGES.index('cache_misses'))
+        metric('kb_cache_hits_total', 'counter', 'Result cache hits')
+        lines.append(f"kb_cache_hits_total {number(hits)}")
+        metric('kb_cache_misses_total', 'counter', 'Result cache misses')
+        lines.append(f"kb_cache_misses_total {number(misses)}")
+        metric('kb_cache_hit_ratio', 'gauge', 'Result cache hits per lookup since start')
+        lines.append(f"kb_cache_hit_ratio {number(round(hits / (hits + misses), 4) if hits + misses else 0)}")
+
+        per_worker = (
+            ('kb_requests_in_flight', 'in_flight', 'Requests being served'),
+            ('kb_cache_entries', 'cache_entries', 'Cached query results'),
+            ('kb_documents', 'documents', 'Documents loaded (not counting replaced ones)'),
+            ('kb_index_heap_bytes', 'index_heap_bytes', 'Approximate heap bytes of the keyword index'),
+            ('kb_index_mapped_bytes', 'index_mapped_bytes', 'Bytes of the keyword index mapped from the snapshot'),
+            ('kb_document_heap_bytes', 'document_heap_bytes', 'Heap bytes of the document store'),
+            ('kb_document_mapped_bytes', 'document_mapped_bytes', 'Mapped or spilled bytes of document bodies'),
+            ('kb_last_reload_duration_seconds', 'reload_seconds', 'Duration of the last load or refresh that changed the index'),
+            ('kb_last_reload_timestamp_seconds', 'reload_timestamp', 'Unix time the last load or refresh finished'),
+        )
+        for name, gauge, help_text in per_worker:
+            metric(name, 'gauge', help_text)
+            for worker in range(self.workers):
+                value = values[self._gauge(worker, gauge)]
+                lines.append(f"{name}{self._labels(worker=worker)} {number(value)}")
+
+        metric('kb_slow_requests_total', 'counter', f'Requests that took at least {self.slow_seconds}s')
+        lines.append(f"kb_slow_requests_total {number(total(self._gauge_base + self.GAUGES.index('slow_count')))}")
+        metric('kb_slow_query_seconds', 'gauge',
+               f'Latest slow requests (up to {self.SLOW_SAMPLES} per worker) and their durations')
+        for sample in self.slow_queries():
+            labels = self._labels(route=sample['route'], query=sample['query'], worker=sample['worker'],
+                                  finished=datetime.fromtimestamp(sample['finished']).isoformat(timespec='milliseconds'))
+            lines.append(f"kb_slow_query_seconds{labels} {number(round(sample['seconds'], 4))}")
+
+        return '\n'.join(lines) + '\n'
+
+
 class KnowledgeBaseAPI:
-    """Simple HTTP API for knowledge base (for Discord bot integration)"""
+    """HTTP API for knowledge base (for Discord bot integration)
 
-    def __init__(self, kb: KnowledgeBase, port: int = 8765):
+    The default server is a pre-forked asyncio HTTP/1.1 server. The index is
+    loaded once in the parent and shared copy-on-write by every worker
+    process. Connections are kept alive, each worker caps in-flight queries
+    and every request has a timeout. The Flask development server is still
+    available with server='flask'. /metrics reports request, cache and index
+    metrics for all workers in Prometheus text format.
+    """
+
+    MAX_BATCH_QUERIES = 50  # Per /search/batch request
+    MAX_LIMIT = 100  # Results per search
+    METRICS_INTERVAL = 5.0  # Seconds between each worker publishing its index/cache figures
+    METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, kb: KnowledgeBase, port: int = 8765, host: str = '0.0.0.0',
+                 workers: Optional[int] = None, max_concurrency: int = 16,
+                 request_timeout: float = 10.0, keepalive_timeout: float = 15.0,
+                 watch_interval: float = 0, save_snapshot: bool = True,
+                 slow_query_seconds: float = 0.5):
         self.kb = kb
         self.port = port
+        self.host = host
+        self.workers = workers or os.cpu_count() or 1
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.watch_interval = watch_interval
+        self.save_snapshot = save_snapshot
 
-    def start_server(self):
-        """Start HTTP server for bot queries"""
-        try:
-            from flask import Flask, request, jsonify
-        except ImportError:
-            print("Installing Flask...")
-            os.system("pip3 install -q flask")
-            from flask import Flask, request, jsonify
+        self.routes = {
+            '/search': self._route_search,
+            '/search/batch': self._route_search_batch,
+            '/query': self._route_query,
+            '/categories': self._route_categories,
+            '/stats': self._route_stats,
+            '/metrics': self._route_metrics
+        }
+        self.metrics = ApiMetrics(self.routes, workers=self.workers, slow_seconds=slow_query_seconds)
 
-        app = Flask(__name__)
+    @staticmethod
+    def _arg(params: Dict[str, List[str]], name: str, default=None):
+        values = params.get(name)
+        return values[0] if values else default
+
+    @classmethod
+    def _limit(cls, value) -> int:
+        """Parse a requested result count, 1 to MAX_LIMIT"""
+        limit = 0
+        if isinstance(value, (int, str)) and not isinstance(value, bool):
+            try:
+                limit = int(value)
+            except ValueError:
+                pass
+        if not 1 <= limit <= cls.MAX_LIMIT:
+            raise ValueError(f"limit must be an integer between 1 and {cls.MAX_LIMIT}")
+        return limit
+
+    def _route_search(self, params: Dict[str, List[str]], body: bytes) -> Dict:
+        query = self._arg(params, 'q', '')
+        category = self._arg(params, 'category')
+        limit = self._limit(self._arg(params, 'limit', 10))
+        mode = self._arg(params, 'mode', 'keyword')
+
+        if mode == 'semantic':
+            results = self.kb.semantic_search(query, category=category, limit=limit)
+            return {'query': query, 'mode': mode, 'results': results, 'count': len(results)}
+        if mode == 'hybrid':
+            found = self.kb.hybrid_search(query, category=category, limit=limit)
+            return dict(found, query=query, mode=mode, count=len(found['results']))
+        if mode != 'keyword':
+            raise ValueError(f"Unknown search mode {mode!r}")
+
+        boosts = self.kb.parse_boosts(self._arg(params, 'boost', ''))
+        found = self.kb.search_faceted(query, category=category, limit=limit, boosts=boosts)
+        return {
+            'query': query,
+            'results': found['results'],
+            'count': len(found['results']),
+            'total': found['total'],
+            'facets': found['facets']
+        }
+
+    def _route_search_batch(self, params: Dict[str, List[str]], body: bytes) -> Dict:
+        """Several keyword searches in one request: a JSON body of
+        {"queries": [...], "category", "limit", "boost"}, or repeated q= parameters"""
+        request = json.loads(body) if body.strip() else {}
+        if not isinstance(request, dict):
+            raise ValueError("Expected a JSON object body")
+        queries = request.get('queries', params.get('q', []))
+        if not isinstance(queries, list):
+            raise ValueError("'queries' must be a list")
+        if len(queries) > self.MAX_BATCH_QUERIES:
+            raise ValueError(f"At most {self.MAX_BATCH_QUERIES} queries per batch")
+
+        category = request.get('category', self._arg(params, 'category'))
+        limit = self._limit(request.get('limit', self._arg(params, 'limit', 10)))
+        queries = [dict(item, limit=self._limit(item['limit'])) if isinstance(item, dict) and 'limit' in item
+                   else item for item in queries]
+        boosts = self.kb.parse_boosts(str(request.get('boost', self._arg(params, 'boost', ''))))
+        searches = self.kb.search_many(queries, category=category, limit=limit, boosts=boosts)
+        for search in searches:
+            search['count'] = len(search['results'])
+        return {'searches': searches, 'count': len(searches)}
+
+    def _route_query(self, params: Dict[str, List[str]], body: bytes) -> Dict:
+        """Bot-friendly query endpoint"""
+        q = self._arg(params, 'q', '')
+        response = self.kb.query_for_bot(q)
+        return {'response': response}
 
-        @app.route('/search', methods=['GET'])
-        def search():
-            query = request.args.get('q', '')
-            category = request.args.get('category')
-            limit = int(request.args.get('limit', 10))
-
-            results = self.kb.search(query, category=category, limit=limit)
-            return jsonify({
-                'query': query,
-                'results': results,
-                'count': len(results)
-            })
-
-        @app.route('/query', methods=['GET'])
-        def query():
-            """Bot-friendly query endpoint"""
-            q = request.args.get('q', '')
-            response = self.kb.query_for_bot(q)
-            return jsonify({'response': response})
-
-        @app.route('/categories', methods=['GET'])
-        def categories():
-            cats = self.kb.get_categories()
-            return jsonify({'categories': cats})
-
-        @app.route('/stats', methods=['GET'])
-        def stats():
-            return jsonify(self.kb.get_stats())
+    def _route_categories(self, params: Dict[str, List[str]], body: bytes) -> Dict:
+        cats = self.kb.get_categories()
+        return {'categories': cats}
 
+    def _route_stats(self, params: Dict[str, List[str]], body: bytes) -> Dict:
+        return self.kb.get_stats()
+
+    def _route_metrics(self, params: Dict[str, List[str]], body: bytes) -> str:
+        """Prometheus text format"""
+        self.metrics.publish(self.kb)
+        return self.metrics.render()
+
+    @staticmethod
+    def _sample_query(params: Dict[str, List[str]], body: bytes) -> str:
+        """What a request asked for, for slow-query samples"""
+        if params.get('q'):
+            return ' | '.join(params['q'])
+        return body[:ApiMetrics.SLOW_QUERY_BYTES].decode('utf-8', 'ignore')
+
+    def handle(self, method: str, path: str, params: Dict[str, List[str]],
+               body: bytes = b'') -> tuple:
+        """Run one API request; returns (HTTP status, JSON payload, or text for /metrics)"""
+        route = self.routes.get(path.rstrip('/') or path)
+        if route is None:
+            return 404, {'error': f"Unknown endpoint: {path}"}
+        if method not in ('GET', 'POST'):
+            return 405, {'error': f"Method not allowed: {method}"}
+
+        try:
+            return 200, route(params, body)
+        except ValueError as e:
+            return 400, {'error': str(e)}
+
+    def start_server(self, server: str = 'async'):
+        """Start HTTP server for bot queries"""
         print(f"\n🌐 Knowledge Base API starting on http://localhost:{self.port}")
         print(f"   Search: http://localhost:{self.port}/search?q=VKBT")
         print(f"   Query: http://localhost:{self.port}/query?q=what+is+VKBT")
         print(f"   Stats: http://localhost:{self.port}/stats")
+        print(f"   Metrics: http://localhost:{self.port}/metrics")
+
+        if server == 'flask':
+            self._serve_flask()
+        else:
+            self._serve_async()
+
+    def _serve_flask(self):
+        """Single-process Flask development server"""
+        try:
+            from flask import Flask, Response, request, jsonify
+        except ImportError:
+            print("❌ Flask not installed. Install: pip3 install flask (or use --server async)")
+            return
+
+        if self.watch_interval > 0:
+            self.kb.start_watcher(self.watch_interval, save_snapshot=self.save_snapshot)
+
+        app = Flask(__name__)
 
-        app.run(host='0.0.0.0', port=self.port)
+        @app.route('/<path:path>', methods=['GET', 'POST'])
+        def route(path):
+            params, body = request.args.to_dict(flat=False), request.get_data()
+            started = self.metrics.start()
+            status = 500
+            try:
+                status, payload = self.handle(request.method, '/' + path, params, body)
+            finally:
+                self.metrics.observe('/' + path, status, started, query=self._sample_query(params, body))
+            if isinstance(payload, str):
+                return Response(payload, status=status, mimetype=self.METRICS_CONTENT_TYPE)
+            return jsonify(payload), status
+
+        app.run(host=self.host, port=self.port)
+
+    def _serve_async(self):
+        """Pre-fork asyncio workers that share one listening socket"""
+        sock = socket.create_server((self.host, self.port), backlog=1024)
+        workers = self.workers if hasattr(os, 'fork') else 1
+        print(f"   Workers: {workers} × {self.max_concurrency} concurrent queries, "
+              f"{self.request_timeout}s timeout")
+
+        if workers <= 1:
+            try:
+                self._run_worker(sock, 0)
+            except KeyboardInterrupt:
+                pass
+            return
+
+        children = []
+        for worker_id in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                try:
+                    self._run_worker(sock, worker_id)
+                except KeyboardInterrupt:
+                    pass
+                finally:
+                    os._exit(0)
+            children.append(pid)
+
+        def stop(signum, frame):
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for pid in children:
+                os.waitpid(pid, 0)
+        except KeyboardInterrupt:
+            stop(signal.SIGINT, None)
+        finally:
+            sock.close()
+            print("\n✅ Knowledge Base API stopped")
+
+    def _run_worker(self, sock: socket.socket, worker_id: int):
+        self.metrics.worker_id = worker_id
+        if self.watch_interval > 0:
+            # Only one worker rewrites the snapshot file
+            self.kb.start_watcher(self.watch_interval,
+                                  save_snapshot=self.save_snapshot and worker_id == 0)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix=f'kb-worker-{worker_id}')
+        asyncio.run(self._worker_main(sock))
+
+    async def _worker_main(self, sock: socket.socket):
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        publisher = asyncio.create_task(self._publish_metrics())
+        server = await asyncio.start_server(self._serve_connection, sock=sock)
+        async with server:
+            await server.serve_forever()
+        publisher.cancel()
+
+    async def _publish_metrics(self):
+        """Keep this worker's per-process figures current for scrapes served by other workers"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(self._executor, self.metrics.publish, self.kb)
+            except Exception as e:
+                print(f"⚠️  Metrics publish error: {e}")
+            await asyncio.sleep(self.METRICS_INTERVAL)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve HTTP/1.1 requests on one keep-alive connection"""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self.keepalive_timeout)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ', 2)
+                except ValueError:
+                    self._write_response(writer, 400, {'error': 'Malformed request line'}, False)
+                    break
+
+                headers = {}
+                for line in header_lines:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.1':
+                    keep_alive = connection != 'close'
+                else:
+                    keep_alive = connection == 'keep-alive'
+
+                try:
+                    length = int(headers.get('content-length') or 0)
+                    body = await reader.readexactly(length) if length else b''
+                except (ValueError, asyncio.IncompleteReadError):
+                    self._write_response(writer, 400, {'error': 'Bad request body'}, False)
+                    break
+
+                status, payload = await self._respond(method, target, body)
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, method: str, target: str, body: bytes) -> tuple:
+        """Run a request and record its metrics"""
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        started = self.metrics.start()
+        status, payload, waited = await self._dispatch(method, url, params, body)
+        self.metrics.observe(url.path, status, started, waited, self._sample_query(params, body))
+        return status, payload
+
+    async def _dispatch(self, method: str, url, params: Dict[str, List[str]], body: bytes) -> tuple:
+        """Run a request in the worker's thread pool within the concurrency and time limits;
+        returns (status, payload, seconds spent waiting for a slot)"""
+        waiting = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.request_timeout)
+        except asyncio.TimeoutError:
+            return 503, {'error': 'Server busy, try again shortly'}, time.perf_counter() - waiting
+        waited = time.perf_counter() - waiting
+
+        # A timed-out handler thread cannot be stopped, so its slot is only
+        # freed when the thread finishes; the pool never runs more than
+        # max_concurrency requests at once
+        try:
+            task = asyncio.get_running_loop().run_in_executor(
+                self._executor, self.handle, method, url.path, params, body)
+        except Exception:
+            self._slots.release()
+            raise
+        task.add_done_callback(self._release_slot)
+
+        try:
+            return (*await asyncio.wait_for(asyncio.shield(task), self.request_timeout), waited)
+        except asyncio.TimeoutError:
+            return 504, {'error': f"Request timed out after {self.request_timeout}s"}, waited
+        except Exception as e:
+            print(f"❌ Error handling {url.geturl()}: {e}")
+            return 500, {'error': 'Internal server error'}, waited
+
+    def _release_slot(self, task: asyncio.Future):
+        if not task.cancelled():
+            task.exception()  # Retrieve it, so a failure after a timeout is not logged as unhandled
+        self._slots.release()
+
+    def _write_response(self, writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), self.METRICS_CONTENT_TYPE
+        else:
+            body, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        head = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        if keep_alive:
+            head.append(f"Keep-Alive: timeout={int(self.keepalive_timeout)}")
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
 
 
 def main():
     parser = argparse.ArgumentParser(description='Van Kush Family Knowledge Base')
     parser.add_argument('--datasets-dir', default='datasets', help='Datasets directory')
-    parser.add_argument('--search', help='Search query')
+    parser.add_argument('--knowledge-dir', help='Also index the curated knowledge/<domain>/*.json tree')
+    parser.add_argument('--search', help='Search query ("exact phrase", word NEAR/3 word, title:word)')
     parser.add_argument('--category', help='Filter by category')
+    parser.add_argument('--boost', default='', help='Field boosts for --search, e.g. title:4,content:1')
+    parser.add_argument('--semantic', action='store_true', help='Search by meaning using document vectors')
+    parser.add_argument('--build-vectors', action='store_true',
+                        help='Compute document vectors for semantic search (needs numpy)')
+    parser.add_argument('--vector-dims', type=int, default=KnowledgeBase.VECTOR_DIMS,
+                        help='Dimensions for --build-vectors')
     parser.add_argument('--stats', action='store_true', help='Show statistics')
     parser.add_argument('--categories', action='store_true', help='List categories')
     parser.add_argument('--export', help='Export for fine-tuning (specify output file)')
+    parser.add_argument('--validation-split', type=float, default=0.05,
+                        help='Fraction of exported documents in the validation split')
+    parser.add_argument('--shard-mb', type=int, default=64, help='Uncompressed size of each export shard')
     parser.add_argument('--serve', action='store_true', help='Start HTTP API server')
     parser.add_argument('--port', type=int, default=8765, help='API server port')
+    parser.add_argument('--host', default='0.0.0.0', help='API server bind address')
+    parser.add_argument('--server', choices=['async', 'flask'], default='async',
+                        help='async: pre-forked asyncio workers; flask: development server')
+    parser.add_argument('--workers', type=int, help='API worker processes (default: CPU count)')
+    parser.add_argument('--max-concurrency', type=int, default=16, help='In-flight queries per worker')
+    parser.add_argument('--request-timeout', type=float, default=10.0, help='Per-request timeout in seconds')
+    parser.add_argument('--slow-query-seconds', type=float, default=0.5,
+                        help='Requests at least this slow are sampled under /metrics')
+    parser.add_argument('--snapshot', help='Index snapshot path (default: <datasets-dir>/.kb_snapshot.bin)')
+    parser.add_argument('--build-workers', type=int, default=1,
+                        help='Processes for a full index build (0 = one per CPU)')
+    parser.add_argument('--no-snapshot', action='store_true', help='Always reparse datasets, never read or write a snapshot')
+    parser.add_argument('--rebuild', action='store_true', help='Ignore any existing snapshot and rebuild it')
+    parser.add_argument('--no-stemming', action='store_true', help='Index words without plural stemming')
+    parser.add_argument('--keep-stopwords', action='store_true', help='Index common words like "the" and "and"')
+    parser.add_argument('--no-dedup', action='store_true', help='Index near-duplicate documents too')
+    parser.add_argument('--dedup-threshold', type=float, default=KnowledgeBase.DEDUP_THRESHOLD,
+                        help='Similarity (0-1) at which documents count as near-duplicates')
+    parser.add_argument('--compact', action='store_true',
+                        help='Remove near-duplicate lines from the JSONL datasets, then exit')
+    parser.add_argument('--dry-run', action='store_true', help='With --compact, only report duplicates')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Cached query results (0 disables)')
+    parser.add_argument('--cache-ttl', type=float, default=300.0, help='Seconds a cached result stays valid')
+    parser.add_argument('--watch-interval', type=float, default=5.0,
+                        help='Seconds between dataset refreshes while serving (0 disables)')
 
     args = parser.parse_args()
 
-    kb = KnowledgeBase(datasets_dir=args.datasets_dir)
+    kb = KnowledgeBase(datasets_dir=args.datasets_dir, snapshot_path=args.snapshot,
+                       knowledge_dir=args.knowledge_dir, cache_size=args.cache_size,
+                       cache_ttl=args.cache_ttl,
+                       analyzer=Analyzer(stem=not args.no_stemming,
+                                         stopwords=() if args.keep_stopwords else STOPWORDS),
+                       dedup_threshold=None if args.no_dedup else args.dedup_threshold)
+
+    if args.compact:
+        print("🧬 Compacting datasets...")
+        kb.compact_datasets(dry_run=args.dry_run)
+        return
 
     print("📚 Loading knowledge base...")
-    kb.load_all_datasets()
+    kb.load_all_datasets(use_snapshot=not args.no_snapshot, rebuild=args.rebuild,
+                         workers=args.build_workers or os.cpu_count() or 1)
+
+    if args.build_vectors:
+        kb.build_vectors(dims=args.vector_dims)
 
     if args.stats:
         print("\n📊 Knowledge Base Statistics:")
@@ -309,13 +4473,21 @@ def main():
 
     elif args.categories:
         print("\n📂 Categories:")
+        totals = kb.facets['category'].totals(kb.deleted, kb.parents)
         for cat in kb.get_categories():
-            count = len(kb.get_by_category(cat))
-            print(f"  - {cat}: {count} documents")
+            print(f"  - {cat}: {totals[cat]} documents")
 
     elif args.search:
         print(f"\n🔍 Searching for: {args.search}")
-        results = kb.search(args.search, category=args.category, limit=10)
+        if args.semantic:
+            try:
+                results = kb.semantic_search(args.search, category=args.category, limit=10)
+            except ValueError as e:
+                print(f"❌ {e}")
+                results = []
+        else:
+            results = kb.search(args.search, category=args.category, limit=10,
+                                boosts=KnowledgeBase.parse_boosts(args.boost))
 
         for i, doc in enumerate(results, 1):
             print(f"\n{i}. {doc.get('title', 'Unknown')}")
@@ -324,11 +4496,17 @@ def main():
             print(f"   Content preview: {doc.get('content', '')[:200]}...")
 
     elif args.export:
-        kb.export_for_fine_tuning(args.export, category=args.category)
+        kb.export_for_fine_tuning(args.export, category=args.category,
+                                  validation=args.validation_split, shard_bytes=args.shard_mb << 20)
 
     elif args.serve:
-        api = KnowledgeBaseAPI(kb, port=args.port)
-        api.start_server()
+        api = KnowledgeBaseAPI(kb, port=args.port, host=args.host, workers=args.workers,
+                               max_concurrency=args.max_concurrency,
+                               request_timeout=args.request_timeout,
+                               watch_interval=args.watch_interval,
+                               save_snapshot=not args.no_snapshot,
+                               slow_query_seconds=args.slow_query_seconds)
+        api.start_server(server=args.server)
 
     else:
         print("\n✅ Knowledge base loaded successfully!")
@@ -10,10 +10,10 @@ Scrapes content from multiple sources:
 - PDF extraction
 
 Outputs: JSONL format for AI training and knowledge base
+(frame-compressed .jsonlz with --compress, see framed_jsonl.py)
 """
 
 import os
-import json
 import time
 import re
 from datetime import datetime
@@ -21,6 +21,8 @@ from urllib.parse import urljoin, urlparse
 from typing import List, Dict, Optional, Set
 import argparse
 
+import framed_jsonl
+
 try:
     import requests
     from bs4 import BeautifulSoup
@@ -38,9 +40,10 @@ except ImportError:
 class WebScraper:
     """Base web scraper with rate limiting and robots.txt respect"""
 
-    def __init__(self, rate_limit: float = 2.0, output_dir: str = "datasets"):
+    def __init__(self, rate_limit: float = 2.0, output_dir: str = "datasets", compress: bool = False):
         self.rate_limit = rate_limit  # seconds between requests
         self.output_dir = output_dir
+        self.compress = compress  # Write .jsonlz instead of .jsonl
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Van-Kush-Family-Bot/1.0 (Educational/Research Purpose)'
@@ -112,12 +115,9 @@ class WebScraper:
         return text.strip()
 
     def save_to_jsonl(self, data: List[Dict], filename: str):
-        """Save data to JSONL format"""
-        filepath = os.path.join(self.output_dir, filename)
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            for item in data:
-                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+        """Save data to JSONL format (frame-compressed when self.compress is set)"""
+        filepath = os.path.join(self.output_dir, framed_jsonl.dataset_name(filename, self.compress))
+        framed_jsonl.write_jsonl(filepath, data)
 
         print(f"✅ Saved {len(data)} entries to {filepath}")
 
@@ -351,12 +351,15 @@ def main():
     parser.add_argument('--max-pages', type=int, default=100, help='Maximum pages to scrape')
     parser.add_argument('--output', default='datasets', help='Output directory')
     parser.add_argument('--rate-limit', type=float, default=2.0, help='Seconds between requests')
+    parser.add_argument('--compress', action='store_true',
+                        help='Write frame-compressed .jsonlz datasets')
 
     args = parser.parse_args()
 
     # Scrape based on source
     if args.source == 'sacred-texts':
-        scraper = SacredTextsScraper(rate_limit=args.rate_limit, output_dir=args.output)
+        scraper = SacredTextsScraper(rate_limit=args.rate_limit, output_dir=args.output,
+                                     compress=args.compress)
 
         if not scraper.check_robots_txt('https://www.sacred-texts.com'):
             print("❌ Scraping blocked by robots.txt. Consider using Archive.org or manual download.")
@@ -369,7 +372,8 @@ def main():
             print("Please provide --url with the section URL to scrape")
 
     elif args.source == 'gutenberg':
-        scraper = GutenbergScraper(rate_limit=args.rate_limit, output_dir=args.output)
+        scraper = GutenbergScraper(rate_limit=args.rate_limit, output_dir=args.output,
+                                   compress=args.compress)
 
         if args.book_id:
             books = []
@@ -384,7 +388,8 @@ def main():
             print("Please provide --book-id (e.g., '1,2,3' for multiple books)")
 
     elif args.source == 'theoi':
-        scraper = TheoiScraper(rate_limit=args.rate_limit, output_dir=args.output)
+        scraper = TheoiScraper(rate_limit=args.rate_limit, output_dir=args.output,
+                               compress=args.compress)
 
         if not scraper.check_robots_txt('https://www.theoi.com'):
             print("❌ Scraping blocked by robots.txt. Consider using Archive.org or manual download.")
@@ -398,7 +403,7 @@ def main():
             print("Please provide --url with the page URL to scrape")
 
     elif args.source == 'archive':
-        importer = ClaudeArchiveImporter(output_dir=args.output)
+        importer = ClaudeArchiveImporter(output_dir=args.output, compress=args.compress)
 
         if not args.file or not args.title:
             print("Please provide both --file and --title for archive import")